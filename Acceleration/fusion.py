@@ -3,6 +3,8 @@
 # Released under the MIT License (MIT)
 # Copyright (c) 2017, 2018 Peter Hinch
 
+# V1.1 Optional Mahony filter: Fusion(algorithm='mahony')
+# V1.0 update() and update_nomag() allocate no containers; update_many() for sample arrays
 # V0.9 Time calculations devolved to deltat.py
 # V0.8 Calibrate wait argument can be a function or an integer in ms.
 # V0.7 Yaw replaced with heading
@@ -21,21 +23,39 @@ try:
 except ImportError:
     import time
 
-from math import sqrt, atan2, asin, degrees, radians
+from math import sqrt, atan2, asin, degrees, radians, pi
 from deltat import DeltaT
 
+_DEG2RAD = pi / 180                         # as in radians(), without the call
+
 class Fusion(object):
     '''
     Class provides sensor fusion allowing heading, pitch and roll to be extracted. This uses the Madgwick algorithm.
     The update method must be called peiodically. The calculations take 1.6mS on the Pyboard.
+    update_many() runs the filter over arrays of samples taken at a fixed interval, e.g. from
+    the IMU FIFO. The quaternion self.q is updated in place.
+    algorithm='mahony' selects Mahony's PI filter instead, with gains kp and ki. It takes about
+    half the arithmetic of Madgwick's gradient descent step and suits slowly moving sensors.
+    Both filters skip a sample with a zero mag vector in update(), leaving q and the angles
+    unchanged. With a zero accel vector Madgwick skips the sample too, while Mahony still
+    integrates the gyro rate, uncorrected.
     '''
     declination = 0                         # Optional offset for true north. A +ve value adds to heading
-    def __init__(self, timediff=None):
+    def __init__(self, timediff=None, algorithm='madgwick'):
         self.magbias = (0, 0, 0)            # local magnetic bias factors: set from calibration
         self.deltat = DeltaT(timediff)      # Time between updates
         self.q = [1.0, 0.0, 0.0, 0.0]       # vector to hold quaternion
         GyroMeasError = radians(40)         # Original code indicates this leads to a 2 sec response time
         self.beta = sqrt(3.0 / 4.0) * GyroMeasError  # compute beta (see README)
+        self.kp = 0.5                       # Mahony proportional gain
+        self.ki = 0.0                       # Mahony integral gain: nonzero to learn gyro bias
+        self._integral = [0.0, 0.0, 0.0]    # Mahony integral feedback (rad/s)
+        if algorithm == 'mahony':
+            self._mag = self._mahony
+            self._nomag = self._mahony_nomag
+        elif algorithm != 'madgwick':
+            raise ValueError('algorithm must be madgwick or mahony')
+        self.algorithm = algorithm
         self.pitch = 0
         self.heading = 0
         self.roll = 0
@@ -56,9 +76,18 @@ class Fusion(object):
         self.magbias = tuple(map(lambda a, b: (a +b)/2, magmin, magmax))
 
     def update_nomag(self, accel, gyro, ts=None):    # 3-tuples (x, y, z) for accel, gyro
-        ax, ay, az = accel                  # Units G (but later normalised)
-        gx, gy, gz = (radians(x) for x in gyro) # Units deg/s
-        q1, q2, q3, q4 = (self.q[x] for x in range(4))   # short name local variable for readability
+        if self._nomag(accel[0], accel[1], accel[2],  # Units G (but later normalised)
+                       gyro[0] * _DEG2RAD, gyro[1] * _DEG2RAD, gyro[2] * _DEG2RAD, ts, None):  # Units deg/s
+            self._angles_nomag()
+
+    def _nomag(self, ax, ay, az, gx, gy, gz, ts, deltat):
+        # One 6DOF Madgwick step. gyro in rad/s. deltat None: take it from self.deltat(ts).
+        # Returns False (leaving q unchanged) if the accel vector is zero.
+        q = self.q
+        q1 = q[0]                           # short name local variable for readability
+        q2 = q[1]
+        q3 = q[2]
+        q4 = q[3]
         # Auxiliary variables to avoid repeated arithmetic
         _2q1 = 2 * q1
         _2q2 = 2 * q2
@@ -77,7 +106,7 @@ class Fusion(object):
         # Normalise accelerometer measurement
         norm = sqrt(ax * ax + ay * ay + az * az)
         if (norm == 0):
-            return # handle NaN
+            return False # handle NaN
         norm = 1 / norm        # use reciprocal for division
         ax *= norm
         ay *= norm
@@ -101,23 +130,42 @@ class Fusion(object):
         qDot4 = 0.5 * (q1 * gz + q2 * gy - q3 * gx) - self.beta * s4
 
         # Integrate to yield quaternion
-        deltat = self.deltat(ts)
+        if deltat is None:
+            deltat = self.deltat(ts)
         q1 += qDot1 * deltat
         q2 += qDot2 * deltat
         q3 += qDot3 * deltat
         q4 += qDot4 * deltat
         norm = 1 / sqrt(q1 * q1 + q2 * q2 + q3 * q3 + q4 * q4)    # normalise quaternion
-        self.q = q1 * norm, q2 * norm, q3 * norm, q4 * norm
+        q[0] = q1 * norm
+        q[1] = q2 * norm
+        q[2] = q3 * norm
+        q[3] = q4 * norm
+        return True
+
+    def _angles_nomag(self):
+        q = self.q
         self.heading = 0
-        self.pitch = degrees(-asin(2.0 * (self.q[1] * self.q[3] - self.q[0] * self.q[2])))
-        self.roll = degrees(atan2(2.0 * (self.q[0] * self.q[1] + self.q[2] * self.q[3]),
-            self.q[0] * self.q[0] - self.q[1] * self.q[1] - self.q[2] * self.q[2] + self.q[3] * self.q[3]))
+        self.pitch = degrees(-asin(2.0 * (q[1] * q[3] - q[0] * q[2])))
+        self.roll = degrees(atan2(2.0 * (q[0] * q[1] + q[2] * q[3]),
+            q[0] * q[0] - q[1] * q[1] - q[2] * q[2] + q[3] * q[3]))
 
     def update(self, accel, gyro, mag, ts=None):     # 3-tuples (x, y, z) for accel, gyro and mag data
-        mx, my, mz = (mag[x] - self.magbias[x] for x in range(3)) # Units irrelevant (normalised)
-        ax, ay, az = accel                  # Units irrelevant (normalised)
-        gx, gy, gz = (radians(x) for x in gyro)  # Units deg/s
-        q1, q2, q3, q4 = (self.q[x] for x in range(4))   # short name local variable for readability
+        magbias = self.magbias
+        if self._mag(accel[0], accel[1], accel[2],   # Units irrelevant (normalised)
+                     gyro[0] * _DEG2RAD, gyro[1] * _DEG2RAD, gyro[2] * _DEG2RAD,  # Units deg/s
+                     mag[0] - magbias[0], mag[1] - magbias[1], mag[2] - magbias[2],  # Units irrelevant (normalised)
+                     ts, None):
+            self._angles()
+
+    def _mag(self, ax, ay, az, gx, gy, gz, mx, my, mz, ts, deltat):
+        # One 9DOF Madgwick step. gyro in rad/s, mag with bias removed. deltat None: take it
+        # from self.deltat(ts). Returns False (leaving q unchanged) if accel or mag is zero.
+        q = self.q
+        q1 = q[0]                           # short name local variable for readability
+        q2 = q[1]
+        q3 = q[2]
+        q4 = q[3]
         # Auxiliary variables to avoid repeated arithmetic
         _2q1 = 2 * q1
         _2q2 = 2 * q2
@@ -139,7 +187,7 @@ class Fusion(object):
         # Normalise accelerometer measurement
         norm = sqrt(ax * ax + ay * ay + az * az)
         if (norm == 0):
-            return # handle NaN
+            return False # handle NaN
         norm = 1 / norm                     # use reciprocal for division
         ax *= norm
         ay *= norm
@@ -148,7 +196,7 @@ class Fusion(object):
         # Normalise magnetometer measurement
         norm = sqrt(mx * mx + my * my + mz * mz)
         if (norm == 0):
-            return                          # handle NaN
+            return False                    # handle NaN
         norm = 1 / norm                     # use reciprocal for division
         mx *= norm
         my *= norm
@@ -197,15 +245,161 @@ class Fusion(object):
         qDot4 = 0.5 * (q1 * gz + q2 * gy - q3 * gx) - self.beta * s4
 
         # Integrate to yield quaternion
-        deltat = self.deltat(ts)
+        if deltat is None:
+            deltat = self.deltat(ts)
         q1 += qDot1 * deltat
         q2 += qDot2 * deltat
         q3 += qDot3 * deltat
         q4 += qDot4 * deltat
         norm = 1 / sqrt(q1 * q1 + q2 * q2 + q3 * q3 + q4 * q4)    # normalise quaternion
-        self.q = q1 * norm, q2 * norm, q3 * norm, q4 * norm
-        self.heading = self.declination + degrees(atan2(2.0 * (self.q[1] * self.q[2] + self.q[0] * self.q[3]),
-            self.q[0] * self.q[0] + self.q[1] * self.q[1] - self.q[2] * self.q[2] - self.q[3] * self.q[3]))
-        self.pitch = degrees(-asin(2.0 * (self.q[1] * self.q[3] - self.q[0] * self.q[2])))
-        self.roll = degrees(atan2(2.0 * (self.q[0] * self.q[1] + self.q[2] * self.q[3]),
-            self.q[0] * self.q[0] - self.q[1] * self.q[1] - self.q[2] * self.q[2] + self.q[3] * self.q[3]))
+        q[0] = q1 * norm
+        q[1] = q2 * norm
+        q[2] = q3 * norm
+        q[3] = q4 * norm
+        return True
+
+    def _angles(self):
+        q = self.q
+        self.heading = self.declination + degrees(atan2(2.0 * (q[1] * q[2] + q[0] * q[3]),
+            q[0] * q[0] + q[1] * q[1] - q[2] * q[2] - q[3] * q[3]))
+        self.pitch = degrees(-asin(2.0 * (q[1] * q[3] - q[0] * q[2])))
+        self.roll = degrees(atan2(2.0 * (q[0] * q[1] + q[2] * q[3]),
+            q[0] * q[0] - q[1] * q[1] - q[2] * q[2] + q[3] * q[3]))
+
+    def update_many(self, accel_arr, gyro_arr, mag_arr, dt, n=None):
+        '''
+        Runs the filter over n samples taken dt seconds apart. accel_arr and gyro_arr
+        hold x, y, z of each sample in turn (e.g. array('f') filled by MPU6050.fifo_read),
+        in the units of update(). mag_arr is the same for the magnetometer, a single
+        (x, y, z) used for every sample, or None for 6DOF (as update_nomag). n defaults
+        to all samples in accel_arr. heading, pitch and roll are computed once, after
+        the last sample. self.deltat is not used.
+        '''
+        if n is None:
+            n = len(accel_arr) // 3
+        d2r = _DEG2RAD
+        if mag_arr is None:
+            step = self._nomag
+            for i in range(0, 3 * n, 3):
+                step(accel_arr[i], accel_arr[i + 1], accel_arr[i + 2],
+                     gyro_arr[i] * d2r, gyro_arr[i + 1] * d2r, gyro_arr[i + 2] * d2r, None, dt)
+            self._angles_nomag()
+            return
+        step = self._mag
+        magbias = self.magbias
+        bx = magbias[0]
+        by = magbias[1]
+        bz = magbias[2]
+        m = 0
+        mstride = 0 if len(mag_arr) == 3 else 3
+        for i in range(0, 3 * n, 3):
+            step(accel_arr[i], accel_arr[i + 1], accel_arr[i + 2],
+                 gyro_arr[i] * d2r, gyro_arr[i + 1] * d2r, gyro_arr[i + 2] * d2r,
+                 mag_arr[m] - bx, mag_arr[m + 1] - by, mag_arr[m + 2] - bz, None, dt)
+            m += mstride
+        self._angles()
+
+    def _mahony_nomag(self, ax, ay, az, gx, gy, gz, ts, deltat):
+        return self._mahony(ax, ay, az, gx, gy, gz, 0, 0, 0, ts, deltat, False)
+
+    def _mahony(self, ax, ay, az, gx, gy, gz, mx, my, mz, ts, deltat, usemag=True):
+        # One Mahony step: the gyro rate is corrected by a PI controller on the error between the
+        # measured and estimated directions of gravity (and of the magnetic field if usemag).
+        # A zero accel vector leaves the rate uncorrected. Returns False (leaving q unchanged)
+        # if usemag and mag is zero, as the Madgwick step does.
+        if usemag and mx == 0 and my == 0 and mz == 0:
+            return False                    # handle NaN
+        q = self.q
+        q1 = q[0]                           # short name local variable for readability
+        q2 = q[1]
+        q3 = q[2]
+        q4 = q[3]
+        if deltat is None:
+            deltat = self.deltat(ts)
+
+        # Normalise accelerometer measurement
+        norm = sqrt(ax * ax + ay * ay + az * az)
+        if norm != 0:
+            norm = 1 / norm                 # use reciprocal for division
+            ax *= norm
+            ay *= norm
+            az *= norm
+
+            # Estimated direction of gravity, halved
+            halfvx = q2 * q4 - q1 * q3
+            halfvy = q1 * q2 + q3 * q4
+            halfvz = q1 * q1 - 0.5 + q4 * q4
+
+            # Error is cross product between measured and estimated direction of gravity
+            halfex = ay * halfvz - az * halfvy
+            halfey = az * halfvx - ax * halfvz
+            halfez = ax * halfvy - ay * halfvx
+
+            # Normalise magnetometer measurement
+            norm = sqrt(mx * mx + my * my + mz * mz)
+            if norm != 0:
+                norm = 1 / norm
+                mx *= norm
+                my *= norm
+                mz *= norm
+                q1q2 = q1 * q2
+                q1q3 = q1 * q3
+                q1q4 = q1 * q4
+                q2q2 = q2 * q2
+                q2q3 = q2 * q3
+                q2q4 = q2 * q4
+                q3q3 = q3 * q3
+                q3q4 = q3 * q4
+                q4q4 = q4 * q4
+
+                # Reference direction of Earth's magnetic field
+                hx = 2 * (mx * (0.5 - q3q3 - q4q4) + my * (q2q3 - q1q4) + mz * (q2q4 + q1q3))
+                hy = 2 * (mx * (q2q3 + q1q4) + my * (0.5 - q2q2 - q4q4) + mz * (q3q4 - q1q2))
+                bx = sqrt(hx * hx + hy * hy)
+                bz = 2 * (mx * (q2q4 - q1q3) + my * (q3q4 + q1q2) + mz * (0.5 - q2q2 - q3q3))
+
+                # Estimated direction of magnetic field, halved
+                halfwx = bx * (0.5 - q3q3 - q4q4) + bz * (q2q4 - q1q3)
+                halfwy = bx * (q2q3 - q1q4) + bz * (q1q2 + q3q4)
+                halfwz = bx * (q1q3 + q2q4) + bz * (0.5 - q2q2 - q3q3)
+
+                # Add cross product between measured and estimated direction of field
+                halfex += my * halfwz - mz * halfwy
+                halfey += mz * halfwx - mx * halfwz
+                halfez += mx * halfwy - my * halfwx
+
+            # Integral feedback
+            integral = self._integral
+            if self.ki > 0:
+                twoKi = 2 * self.ki
+                integral[0] += twoKi * halfex * deltat
+                integral[1] += twoKi * halfey * deltat
+                integral[2] += twoKi * halfez * deltat
+                gx += integral[0]
+                gy += integral[1]
+                gz += integral[2]
+            else:
+                integral[0] = 0.0           # prevent integral windup
+                integral[1] = 0.0
+                integral[2] = 0.0
+
+            # Proportional feedback
+            twoKp = 2 * self.kp
+            gx += twoKp * halfex
+            gy += twoKp * halfey
+            gz += twoKp * halfez
+
+        # Integrate rate of change of quaternion
+        gx *= 0.5 * deltat                  # pre-multiply common factors
+        gy *= 0.5 * deltat
+        gz *= 0.5 * deltat
+        n1 = q1 - q2 * gx - q3 * gy - q4 * gz
+        n2 = q2 + q1 * gx + q3 * gz - q4 * gy
+        n3 = q3 + q1 * gy - q2 * gz + q4 * gx
+        n4 = q4 + q1 * gz + q2 * gy - q3 * gx
+        norm = 1 / sqrt(n1 * n1 + n2 * n2 + n3 * n3 + n4 * n4)    # normalise quaternion
+        q[0] = n1 * norm
+        q[1] = n2 * norm
+        q[2] = n3 * norm
+        q[3] = n4 * norm
+        return True
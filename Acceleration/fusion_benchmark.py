@@ -0,0 +1,416 @@
+""" CPython benchmark of fusion.Fusion against the update() it replaced.
+
+By default the data are synthetic: trace() simulates 9DOF readings of a
+sensor rolling and yawing like a buoy, sampled at 200 Hz with noise, held
+in arrays as logged.  No recorded IMU log is kept in the repository; give
+one (csv with the header line t,ax,ay,az,gx,gy,gz,mx,my,mz, the format of
+AnalysisCode/Acceleration/fusion_replay.py) on the command line to use it
+instead.  The trace is replayed through LegacyFusion (the update() and update_nomag()
+of fusion.py before they stopped allocating generators and a new q tuple
+on every call), through Fusion.update() and Fusion.update_nomag(), and
+through Fusion.update_many(), checking the quaternions agree and reporting
+updates per second.  run_backends() compares the Madgwick and Mahony
+filters, 9DOF and 6DOF, on the moving trace and on a still, tilted sensor
+with gyro bias: updates per second and the error from the true attitude
+once the filters have settled (the last third of 3 minutes).  A recorded
+log has no true attitude, so for one the error is the angle between the
+estimated direction of gravity and the accelerometer reading, which is
+only meaningful while the sensor is not accelerating.  Run from this
+folder with
+
+    python fusion_benchmark.py [imu_raw.csv]
+
+"""
+
+import math
+import random
+import time
+from array import array
+from math import sqrt, atan2, asin, degrees, radians
+from fusion import Fusion
+
+RATE = 200                                  # Hz
+PERIOD_US = 1000000 // RATE
+
+def timediff(end, start):
+    return (end - start) / 1000000
+
+def _euler_q(heading, pitch, roll):
+    # quaternion with the heading, pitch and roll (degrees) that Fusion reports
+    cy, sy = math.cos(radians(heading) / 2), math.sin(radians(heading) / 2)
+    cp, sp = math.cos(radians(pitch) / 2), math.sin(radians(pitch) / 2)
+    cr, sr = math.cos(radians(roll) / 2), math.sin(radians(roll) / 2)
+    return [cr * cp * cy + sr * sp * sy, sr * cp * cy - cr * sp * sy,
+            cr * sp * cy + sr * cp * sy, cr * cp * sy - sr * sp * cy]
+
+def _rotate(q, v):
+    # v (earth frame) in the sensor frame of orientation q, as Fusion expects
+    w, x, y, z = q
+    return (v[0] * (1 - 2 * (y * y + z * z)) + v[1] * 2 * (x * y + w * z) + v[2] * 2 * (x * z - w * y),
+            v[0] * 2 * (x * y - w * z) + v[1] * (1 - 2 * (x * x + z * z)) + v[2] * 2 * (y * z + w * x),
+            v[0] * 2 * (x * z + w * y) + v[1] * 2 * (y * z - w * x) + v[2] * (1 - 2 * (x * x + y * y)))
+
+def trace(seconds=60, noise=True, seed=1, still=False, gyro_bias=(0.0, 0.0, 0.0)):
+    """ Simulated recording of a moving IMU.
+
+    If still is True the sensor does not move, tilted by 15 and -10 degrees
+    and facing 30 degrees from north.  gyro_bias (deg/s) is added to the
+    gyro readings.
+
+    Returns
+    -------
+    ts : list of int
+        Timestamps (us).
+    accel, gyro, mag : array('f')
+        x, y, z of each sample in turn: G, deg/s and uT (with a hard iron
+        offset of (5, -3, 2) uT).
+    truth : array('d')
+        The true quaternion at each sample.
+    """
+    rng = random.Random(seed)
+    gauss = rng.gauss if noise else (lambda mu, sigma: mu)
+    field = (20.0, 0.0, -45.0)              # uT, x north, z up
+    offset = (5.0, -3.0, 2.0)
+    n = seconds * RATE
+    ts = []
+    accel = array('f')
+    gyro = array('f')
+    mag = array('f')
+    truth = array('d')
+    q = [1.0, 0.0, 0.0, 0.0]
+    if still:
+        q = _euler_q(30, -10, 15)
+    dt = PERIOD_US / 1000000
+    for i in range(n):
+        t = i * dt
+        # body rates (deg/s): rolling and pitching on the waves, slowly yawing
+        w = (40 * math.cos(2 * math.pi * 0.25 * t), 25 * math.cos(2 * math.pi * 0.17 * t), 6 + 10 * math.sin(2 * math.pi * 0.03 * t))
+        if still:
+            w = (0.0, 0.0, 0.0)
+        ts.append(i * PERIOD_US)
+        truth.extend(q)
+        a = _rotate(q, (0.0, 0.0, 1.0))
+        m = _rotate(q, field)
+        accel.extend(a[k] + gauss(0, 0.01) for k in range(3))
+        gyro.extend(w[k] + gyro_bias[k] + gauss(0, 0.2) for k in range(3))
+        mag.extend(m[k] + offset[k] + gauss(0, 0.5) for k in range(3))
+        # integrate the true orientation (qdot = q * (0, w) / 2) in small steps
+        gx, gy, gz = (radians(x) * dt / 20 for x in w)
+        for j in range(20):
+            q1, q2, q3, q4 = q
+            q = [q1 + 0.5 * (-q2 * gx - q3 * gy - q4 * gz), q2 + 0.5 * (q1 * gx + q3 * gz - q4 * gy),
+                 q3 + 0.5 * (q1 * gy - q2 * gz + q4 * gx), q4 + 0.5 * (q1 * gz + q2 * gy - q3 * gx)]
+            norm = sqrt(sum(x * x for x in q))
+            q = [x / norm for x in q]
+    return ts, accel, gyro, mag, truth
+
+class LegacyFusion(Fusion):
+    """ Fusion with update() and update_nomag() as they were before update_many(). """
+
+    def update_nomag(self, accel, gyro, ts=None):    # 3-tuples (x, y, z) for accel, gyro
+        ax, ay, az = accel                  # Units G (but later normalised)
+        gx, gy, gz = (radians(x) for x in gyro) # Units deg/s
+        q1, q2, q3, q4 = (self.q[x] for x in range(4))   # short name local variable for readability
+        # Auxiliary variables to avoid repeated arithmetic
+        _2q1 = 2 * q1
+        _2q2 = 2 * q2
+        _2q3 = 2 * q3
+        _2q4 = 2 * q4
+        _4q1 = 4 * q1
+        _4q2 = 4 * q2
+        _4q3 = 4 * q3
+        _8q2 = 8 * q2
+        _8q3 = 8 * q3
+        q1q1 = q1 * q1
+        q2q2 = q2 * q2
+        q3q3 = q3 * q3
+        q4q4 = q4 * q4
+
+        # Normalise accelerometer measurement
+        norm = sqrt(ax * ax + ay * ay + az * az)
+        if (norm == 0):
+            return # handle NaN
+        norm = 1 / norm        # use reciprocal for division
+        ax *= norm
+        ay *= norm
+        az *= norm
+
+        # Gradient decent algorithm corrective step
+        s1 = _4q1 * q3q3 + _2q3 * ax + _4q1 * q2q2 - _2q2 * ay
+        s2 = _4q2 * q4q4 - _2q4 * ax + 4 * q1q1 * q2 - _2q1 * ay - _4q2 + _8q2 * q2q2 + _8q2 * q3q3 + _4q2 * az
+        s3 = 4 * q1q1 * q3 + _2q1 * ax + _4q3 * q4q4 - _2q4 * ay - _4q3 + _8q3 * q2q2 + _8q3 * q3q3 + _4q3 * az
+        s4 = 4 * q2q2 * q4 - _2q2 * ax + 4 * q3q3 * q4 - _2q3 * ay
+        norm = 1 / sqrt(s1 * s1 + s2 * s2 + s3 * s3 + s4 * s4)    # normalise step magnitude
+        s1 *= norm
+        s2 *= norm
+        s3 *= norm
+        s4 *= norm
+
+        # Compute rate of change of quaternion
+        qDot1 = 0.5 * (-q2 * gx - q3 * gy - q4 * gz) - self.beta * s1
+        qDot2 = 0.5 * (q1 * gx + q3 * gz - q4 * gy) - self.beta * s2
+        qDot3 = 0.5 * (q1 * gy - q2 * gz + q4 * gx) - self.beta * s3
+        qDot4 = 0.5 * (q1 * gz + q2 * gy - q3 * gx) - self.beta * s4
+
+        # Integrate to yield quaternion
+        deltat = self.deltat(ts)
+        q1 += qDot1 * deltat
+        q2 += qDot2 * deltat
+        q3 += qDot3 * deltat
+        q4 += qDot4 * deltat
+        norm = 1 / sqrt(q1 * q1 + q2 * q2 + q3 * q3 + q4 * q4)    # normalise quaternion
+        self.q = q1 * norm, q2 * norm, q3 * norm, q4 * norm
+        self.heading = 0
+        self.pitch = degrees(-asin(2.0 * (self.q[1] * self.q[3] - self.q[0] * self.q[2])))
+        self.roll = degrees(atan2(2.0 * (self.q[0] * self.q[1] + self.q[2] * self.q[3]),
+            self.q[0] * self.q[0] - self.q[1] * self.q[1] - self.q[2] * self.q[2] + self.q[3] * self.q[3]))
+
+    def update(self, accel, gyro, mag, ts=None):     # 3-tuples (x, y, z) for accel, gyro and mag data
+        mx, my, mz = (mag[x] - self.magbias[x] for x in range(3)) # Units irrelevant (normalised)
+        ax, ay, az = accel                  # Units irrelevant (normalised)
+        gx, gy, gz = (radians(x) for x in gyro)  # Units deg/s
+        q1, q2, q3, q4 = (self.q[x] for x in range(4))   # short name local variable for readability
+        # Auxiliary variables to avoid repeated arithmetic
+        _2q1 = 2 * q1
+        _2q2 = 2 * q2
+        _2q3 = 2 * q3
+        _2q4 = 2 * q4
+        _2q1q3 = 2 * q1 * q3
+        _2q3q4 = 2 * q3 * q4
+        q1q1 = q1 * q1
+        q1q2 = q1 * q2
+        q1q3 = q1 * q3
+        q1q4 = q1 * q4
+        q2q2 = q2 * q2
+        q2q3 = q2 * q3
+        q2q4 = q2 * q4
+        q3q3 = q3 * q3
+        q3q4 = q3 * q4
+        q4q4 = q4 * q4
+
+        # Normalise accelerometer measurement
+        norm = sqrt(ax * ax + ay * ay + az * az)
+        if (norm == 0):
+            return # handle NaN
+        norm = 1 / norm                     # use reciprocal for division
+        ax *= norm
+        ay *= norm
+        az *= norm
+
+        # Normalise magnetometer measurement
+        norm = sqrt(mx * mx + my * my + mz * mz)
+        if (norm == 0):
+            return                          # handle NaN
+        norm = 1 / norm                     # use reciprocal for division
+        mx *= norm
+        my *= norm
+        mz *= norm
+
+        # Reference direction of Earth's magnetic field
+        _2q1mx = 2 * q1 * mx
+        _2q1my = 2 * q1 * my
+        _2q1mz = 2 * q1 * mz
+        _2q2mx = 2 * q2 * mx
+        hx = mx * q1q1 - _2q1my * q4 + _2q1mz * q3 + mx * q2q2 + _2q2 * my * q3 + _2q2 * mz * q4 - mx * q3q3 - mx * q4q4
+        hy = _2q1mx * q4 + my * q1q1 - _2q1mz * q2 + _2q2mx * q3 - my * q2q2 + my * q3q3 + _2q3 * mz * q4 - my * q4q4
+        _2bx = sqrt(hx * hx + hy * hy)
+        _2bz = -_2q1mx * q3 + _2q1my * q2 + mz * q1q1 + _2q2mx * q4 - mz * q2q2 + _2q3 * my * q4 - mz * q3q3 + mz * q4q4
+        _4bx = 2 * _2bx
+        _4bz = 2 * _2bz
+
+        # Gradient descent algorithm corrective step
+        s1 = (-_2q3 * (2 * q2q4 - _2q1q3 - ax) + _2q2 * (2 * q1q2 + _2q3q4 - ay) - _2bz * q3 * (_2bx * (0.5 - q3q3 - q4q4)
+             + _2bz * (q2q4 - q1q3) - mx) + (-_2bx * q4 + _2bz * q2) * (_2bx * (q2q3 - q1q4) + _2bz * (q1q2 + q3q4) - my)
+             + _2bx * q3 * (_2bx * (q1q3 + q2q4) + _2bz * (0.5 - q2q2 - q3q3) - mz))
+
+        s2 = (_2q4 * (2 * q2q4 - _2q1q3 - ax) + _2q1 * (2 * q1q2 + _2q3q4 - ay) - 4 * q2 * (1 - 2 * q2q2 - 2 * q3q3 - az)
+             + _2bz * q4 * (_2bx * (0.5 - q3q3 - q4q4) + _2bz * (q2q4 - q1q3) - mx) + (_2bx * q3 + _2bz * q1) * (_2bx * (q2q3 - q1q4)
+             + _2bz * (q1q2 + q3q4) - my) + (_2bx * q4 - _4bz * q2) * (_2bx * (q1q3 + q2q4) + _2bz * (0.5 - q2q2 - q3q3) - mz))
+
+        s3 = (-_2q1 * (2 * q2q4 - _2q1q3 - ax) + _2q4 * (2 * q1q2 + _2q3q4 - ay) - 4 * q3 * (1 - 2 * q2q2 - 2 * q3q3 - az)
+             + (-_4bx * q3 - _2bz * q1) * (_2bx * (0.5 - q3q3 - q4q4) + _2bz * (q2q4 - q1q3) - mx)
+             + (_2bx * q2 + _2bz * q4) * (_2bx * (q2q3 - q1q4) + _2bz * (q1q2 + q3q4) - my)
+             + (_2bx * q1 - _4bz * q3) * (_2bx * (q1q3 + q2q4) + _2bz * (0.5 - q2q2 - q3q3) - mz))
+
+        s4 = (_2q2 * (2 * q2q4 - _2q1q3 - ax) + _2q3 * (2 * q1q2 + _2q3q4 - ay) + (-_4bx * q4 + _2bz * q2) * (_2bx * (0.5 - q3q3 - q4q4)
+              + _2bz * (q2q4 - q1q3) - mx) + (-_2bx * q1 + _2bz * q3) * (_2bx * (q2q3 - q1q4) + _2bz * (q1q2 + q3q4) - my)
+              + _2bx * q2 * (_2bx * (q1q3 + q2q4) + _2bz * (0.5 - q2q2 - q3q3) - mz))
+
+        norm = 1 / sqrt(s1 * s1 + s2 * s2 + s3 * s3 + s4 * s4)    # normalise step magnitude
+        s1 *= norm
+        s2 *= norm
+        s3 *= norm
+        s4 *= norm
+
+        # Compute rate of change of quaternion
+        qDot1 = 0.5 * (-q2 * gx - q3 * gy - q4 * gz) - self.beta * s1
+        qDot2 = 0.5 * (q1 * gx + q3 * gz - q4 * gy) - self.beta * s2
+        qDot3 = 0.5 * (q1 * gy - q2 * gz + q4 * gx) - self.beta * s3
+        qDot4 = 0.5 * (q1 * gz + q2 * gy - q3 * gx) - self.beta * s4
+
+        # Integrate to yield quaternion
+        deltat = self.deltat(ts)
+        q1 += qDot1 * deltat
+        q2 += qDot2 * deltat
+        q3 += qDot3 * deltat
+        q4 += qDot4 * deltat
+        norm = 1 / sqrt(q1 * q1 + q2 * q2 + q3 * q3 + q4 * q4)    # normalise quaternion
+        self.q = q1 * norm, q2 * norm, q3 * norm, q4 * norm
+        self.heading = self.declination + degrees(atan2(2.0 * (self.q[1] * self.q[2] + self.q[0] * self.q[3]),
+            self.q[0] * self.q[0] + self.q[1] * self.q[1] - self.q[2] * self.q[2] - self.q[3] * self.q[3]))
+        self.pitch = degrees(-asin(2.0 * (self.q[1] * self.q[3] - self.q[0] * self.q[2])))
+        self.roll = degrees(atan2(2.0 * (self.q[0] * self.q[1] + self.q[2] * self.q[3]),
+            self.q[0] * self.q[0] - self.q[1] * self.q[1] - self.q[2] * self.q[2] + self.q[3] * self.q[3]))
+
+def load_log(path, period=1 << 30):
+    """ Reads a recorded csv log (t in ticks_us, unwrapped at period) in the form trace() returns, without truth. """
+    ts = []
+    accel = array('f')
+    gyro = array('f')
+    mag = array('f')
+    with open(path) as f:
+        for line in f:
+            if not line.strip() or line.startswith('t'):
+                continue
+            values = [float(x) for x in line.split(',')]
+            t = int(values[0])
+            if ts:
+                t = ts[-1] + (t - ts[-1]) % period
+            ts.append(t)
+            accel.extend(values[1:4])
+            gyro.extend(values[4:7])
+            mag.extend(values[7:10])
+    return ts, accel, gyro, mag, None
+
+def rows(a, n):
+    # per-sample (x, y, z) tuples, as update() is given them by the logger
+    return [(a[i], a[i + 1], a[i + 2]) for i in range(0, 3 * n, 3)]
+
+def updates_per_second(func, n, repeat=3):
+    best = None
+    for r in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None or elapsed < best else best
+    return n / best
+
+def run(seconds=60, log=None):
+    ts, accel, gyro, mag, truth = trace(seconds) if log is None else load_log(log)
+    n = len(ts)
+    a, g, m = rows(accel, n), rows(gyro, n), rows(mag, n)
+    dt = (ts[-1] - ts[0]) / (n - 1) / 1000000
+    results = {}
+    for dof in (9, 6):
+        for name, cls in (('legacy', LegacyFusion), ('update', Fusion)):
+            fuse = cls(timediff)
+            if dof == 9:
+                update = fuse.update
+                def replay():
+                    fuse.q = [1.0, 0.0, 0.0, 0.0]
+                    fuse.deltat.start_time = None
+                    for i in range(n):
+                        update(a[i], g[i], m[i], ts[i])
+            else:
+                update = fuse.update_nomag
+                def replay():
+                    fuse.q = [1.0, 0.0, 0.0, 0.0]
+                    fuse.deltat.start_time = None
+                    for i in range(n):
+                        update(a[i], g[i], ts[i])
+            rate = updates_per_second(replay, n)
+            results[dof, name] = rate, tuple(fuse.q), (fuse.heading, fuse.pitch, fuse.roll)
+        fuse = Fusion(timediff)
+        mag_arr = mag if dof == 9 else None
+        def replay_many():
+            fuse.q = [1.0, 0.0, 0.0, 0.0]
+            fuse.update_many(accel, gyro, mag_arr, dt)
+        rate = updates_per_second(replay_many, n)
+        results[dof, 'update_many'] = rate, tuple(fuse.q), (fuse.heading, fuse.pitch, fuse.roll)
+
+        # update() must give the quaternion the legacy code did, bit for bit, and
+        # update_many() that of update() with the same time step
+        assert results[dof, 'update'][1] == results[dof, 'legacy'][1], dof
+        check = Fusion(timediff)
+        check.deltat = lambda ts: dt
+        for i in range(n):
+            if dof == 9:
+                check.update(accel[3 * i:3 * i + 3], gyro[3 * i:3 * i + 3], mag[3 * i:3 * i + 3])
+            else:
+                check.update_nomag(accel[3 * i:3 * i + 3], gyro[3 * i:3 * i + 3])
+        assert results[dof, 'update_many'][1] == tuple(check.q), dof
+
+    if log is None:
+        print(f'{n} samples ({seconds} s at {RATE} Hz, simulated)')
+    else:
+        print(f'{n} samples recorded in {log} ({(ts[-1] - ts[0]) / 1000000:.1f} s)')
+    print(f"{'dof':>4}{'method':>13}{'updates/s':>12}{'speedup':>9}  heading, pitch, roll")
+    for dof in (9, 6):
+        base = results[dof, 'legacy'][0]
+        for name in ('legacy', 'update', 'update_many'):
+            rate, q, angles = results[dof, name]
+            print(f"{dof:4d}{name:>13}{rate:12.0f}{rate / base:9.2f}  {angles[0]:.2f}, {angles[1]:.2f}, {angles[2]:.2f}")
+
+def attitude_error(q, truth, tilt_only=False):
+    """ Angle (degrees) between the estimated and true attitude, or between the directions of gravity. """
+    if tilt_only:
+        a = _rotate(q, (0.0, 0.0, 1.0))
+        b = _rotate(truth, (0.0, 0.0, 1.0))
+        return degrees(math.acos(min(1.0, sum(a[k] * b[k] for k in range(3)))))
+    dot = abs(sum(q[k] * truth[k] for k in range(4)))
+    return degrees(2 * math.acos(min(1.0, dot)))
+
+def gravity_error(q, accel):
+    """ Angle (degrees) between the direction of gravity estimated by q and the accelerometer reading. """
+    a = _rotate(q, (0.0, 0.0, 1.0))
+    norm = sqrt(sum(x * x for x in accel))
+    return degrees(math.acos(max(-1.0, min(1.0, sum(a[k] * accel[k] for k in range(3)) / norm))))
+
+def run_backends(seconds=180, log=None):
+    print(f"{'trace':>7}{'dof':>4}{'algorithm':>10}{'updates/s':>11}{'mean err':>10}{'max err':>9}  (degrees, last third)")
+    if log is None:
+        traces = (('moving', trace(seconds)), ('still', trace(seconds, still=True, gyro_bias=(0.5, -0.3, 0.2))))
+    else:
+        traces = (('log', load_log(log)),)
+    for name, (ts, accel, gyro, mag, truth) in traces:
+        n = len(ts)
+        settled = 2 * n // 3
+        if truth is None:
+            # the midpoint of the range of each axis, as Fusion.calibrate() finds it
+            magbias = tuple((max(mag[k::3]) + min(mag[k::3])) / 2 for k in range(3))
+        else:
+            magbias = (5.0, -3.0, 2.0)      # the trace's hard iron offset
+        a, g, m = rows(accel, n), rows(gyro, n), rows(mag, n)
+        for dof in (9, 6):
+            for algorithm, ki in (('madgwick', 0), ('mahony', 0), ('mahony', 0.05)):
+                fuse = Fusion(timediff, algorithm)
+                fuse.magbias = magbias
+                fuse.ki = ki
+                errors = []
+                start = time.perf_counter()
+                if dof == 9:
+                    update = fuse.update
+                    for i in range(n):
+                        update(a[i], g[i], m[i], ts[i])
+                        if i >= settled:
+                            errors.append(fuse.q[:])
+                else:
+                    update = fuse.update_nomag
+                    for i in range(n):
+                        update(a[i], g[i], ts[i])
+                        if i >= settled:
+                            errors.append(fuse.q[:])
+                rate = n / (time.perf_counter() - start)
+                if truth is None:
+                    errors = [gravity_error(q, a[settled + j]) for j, q in enumerate(errors)]
+                else:
+                    errors = [attitude_error(q, truth[4 * (settled + j):4 * (settled + j) + 4], dof == 6)
+                              for j, q in enumerate(errors)]
+                label = algorithm if not ki else 'mahony+ki'
+                print(f'{name:>7}{dof:4d}{label:>10}{rate:11.0f}{sum(errors) / len(errors):10.2f}{max(errors):9.2f}')
+
+if __name__ == '__main__':
+    import sys
+    log = sys.argv[1] if len(sys.argv) > 1 else None
+    run(log=log)
+    run_backends(log=log)
@@ -33,11 +33,19 @@ THE SOFTWARE.
 # myimu = MPU9250('X')
 # magx = myimu.mag.x
 # accelxyz = myimu.accel.xyz
+# For fusion, read accel, temperature and gyro in one I2C transaction:
+# myimu.read_all()
+# accelxyz = myimu.accel.last_xyz
+# gyroxyz = myimu.gyro.last_xyz
+# For gap-free high-rate data, let the FIFO collect samples and drain it now and then:
+# myimu.fifo_start()
+# n = myimu.fifo_read(accel_array, gyro_array, frame_array)
+# frame k was sampled at myimu.fifo_timestamp(frame_array[k])
 # Error handling: on code used for initialisation, abort with message
 # At runtime try to continue returning last good data value. We don't want aircraft
 # crashing. However if the I2C has crashed we're probably stuffed.
 
-from utime import sleep_ms
+from utime import sleep_ms, ticks_us, ticks_add, ticks_diff
 from machine import I2C
 from vector3d import Vector3d
 
@@ -69,6 +77,12 @@ class MPU6050(object):
     _I2Cerror = "I2C failure when communicating with IMU"
     _mpu_addr = (104, 105)  # addresses of MPU9150/MPU6050. There can be two devices
     _chip_id = 104
+    _temp_scale = 340                           # temperature (C) = raw/_temp_scale + _temp_offset
+    _temp_offset = 35
+    _accel_scales = (16384, 8192, 4096, 2048)   # LSB per g for each accel_range
+    _gyro_scales = (131, 65.5, 32.8, 16.4)      # LSB per degree/s for each gyro_range
+    _fifo_size = 1024                           # FIFO length in bytes
+    _fifo_chunk = 18                            # frames read from the FIFO per I2C transaction
 
     def __init__(self, side_str, device_addr=None, transposition=(0, 1, 2), scaling=(1, 1, 1)):
 
@@ -78,6 +92,10 @@ class MPU6050(object):
         self.buf2 = bytearray(2)                # be done in interrupt handlers
         self.buf3 = bytearray(3)
         self.buf6 = bytearray(6)
+        self.buf14 = bytearray(14)              # accel, temperature and gyro (0x3B to 0x48)
+        self.last_temperature = 0               # temperature (C) from the last read_all()
+        self._fifo_buf = None                   # FIFO state, set up by fifo_start()
+        self.fifo_overflows = 0
 
         sleep_ms(200)                           # Ensure PSU and device have settled
         if isinstance(side_str, str):           # Non-pyb targets may use other than X or Y
@@ -178,7 +196,7 @@ class MPU6050(object):
             self._read(self.buf2, 0x41, self.mpu_addr)
         except OSError:
             raise MPUException(self._I2Cerror)
-        return bytes_toint(self.buf2[0], self.buf2[1])/340 + 35  # I think
+        return bytes_toint(self.buf2[0], self.buf2[1])/self._temp_scale + self._temp_offset
 
     # passthrough
     @property
@@ -233,6 +251,16 @@ class MPU6050(object):
         except OSError:
             raise MPUException(self._I2Cerror)
 
+    @property
+    def sample_period_us(self):
+        '''
+        Time between samples in microseconds, from the sample rate divider and
+        the low pass filter setting: the internal rate is 8kHz with the filter
+        off (0 or 7) and 1kHz otherwise.
+        '''
+        base = 125 if self.filter_range in (0, 7) else 1000
+        return base * (1 + self.sample_rate)
+
     # Low pass filters. Using the filter_range property of the MPU9250 is
     # harmless but gyro_filter_range is preferred and offers an extra setting.
     @property
@@ -295,6 +323,7 @@ class MPU6050(object):
                 self._write(ar_bytes[accel_range], 0x1C, self.mpu_addr)
             except OSError:
                 raise MPUException(self._I2Cerror)
+            self._accel_scale = self._accel_scales[accel_range]  # cached for reads
         else:
             raise ValueError('accel_range can only be 0, 1, 2 or 3')
 
@@ -327,6 +356,7 @@ class MPU6050(object):
                 self._write(gr_bytes[gyro_range], 0x1B, self.mpu_addr)  # Sets fchoice = b11 which enables filter
             except OSError:
                 raise MPUException(self._I2Cerror)
+            self._gyro_scale = self._gyro_scales[gyro_range]  # cached for reads
         else:
             raise ValueError('gyro_range can only be 0, 1, 2 or 3')
 
@@ -349,10 +379,10 @@ class MPU6050(object):
         self._accel._ivector[0] = bytes_toint(self.buf6[0], self.buf6[1])
         self._accel._ivector[1] = bytes_toint(self.buf6[2], self.buf6[3])
         self._accel._ivector[2] = bytes_toint(self.buf6[4], self.buf6[5])
-        scale = (16384, 8192, 4096, 2048)
-        self._accel._vector[0] = self._accel._ivector[0]/scale[self.accel_range]
-        self._accel._vector[1] = self._accel._ivector[1]/scale[self.accel_range]
-        self._accel._vector[2] = self._accel._ivector[2]/scale[self.accel_range]
+        scale = self._accel_scale
+        self._accel._vector[0] = self._accel._ivector[0]/scale
+        self._accel._vector[1] = self._accel._ivector[1]/scale
+        self._accel._vector[2] = self._accel._ivector[2]/scale
 
     def get_accel_irq(self):
         '''
@@ -383,10 +413,10 @@ class MPU6050(object):
         self._gyro._ivector[0] = bytes_toint(self.buf6[0], self.buf6[1])
         self._gyro._ivector[1] = bytes_toint(self.buf6[2], self.buf6[3])
         self._gyro._ivector[2] = bytes_toint(self.buf6[4], self.buf6[5])
-        scale = (131, 65.5, 32.8, 16.4)
-        self._gyro._vector[0] = self._gyro._ivector[0]/scale[self.gyro_range]
-        self._gyro._vector[1] = self._gyro._ivector[1]/scale[self.gyro_range]
-        self._gyro._vector[2] = self._gyro._ivector[2]/scale[self.gyro_range]
+        scale = self._gyro_scale
+        self._gyro._vector[0] = self._gyro._ivector[0]/scale
+        self._gyro._vector[1] = self._gyro._ivector[1]/scale
+        self._gyro._vector[2] = self._gyro._ivector[2]/scale
 
     def get_gyro_irq(self):
         '''
@@ -397,3 +427,159 @@ class MPU6050(object):
         self._gyro._ivector[0] = bytes_toint(self.buf6[0], self.buf6[1])
         self._gyro._ivector[1] = bytes_toint(self.buf6[2], self.buf6[3])
         self._gyro._ivector[2] = bytes_toint(self.buf6[4], self.buf6[5])
+
+    # Accel, temperature and gyro together
+    def read_all(self):
+        '''
+        Reads accel, temperature and gyro (registers 0x3B to 0x48) in one I2C
+        transaction, so that all values are from the same sample. Updates the
+        accel and gyro Vector3d objects (read them with last_xyz to avoid
+        another read) and last_temperature.
+        '''
+        buf = self.buf14
+        try:
+            self._read(buf, 0x3B, self.mpu_addr)
+        except OSError:
+            raise MPUException(self._I2Cerror)
+        accel = self._accel
+        gyro = self._gyro
+        accel._ivector[0] = bytes_toint(buf[0], buf[1])
+        accel._ivector[1] = bytes_toint(buf[2], buf[3])
+        accel._ivector[2] = bytes_toint(buf[4], buf[5])
+        self.last_temperature = bytes_toint(buf[6], buf[7])/self._temp_scale + self._temp_offset
+        gyro._ivector[0] = bytes_toint(buf[8], buf[9])
+        gyro._ivector[1] = bytes_toint(buf[10], buf[11])
+        gyro._ivector[2] = bytes_toint(buf[12], buf[13])
+        scale = self._accel_scale
+        accel._vector[0] = accel._ivector[0]/scale
+        accel._vector[1] = accel._ivector[1]/scale
+        accel._vector[2] = accel._ivector[2]/scale
+        scale = self._gyro_scale
+        gyro._vector[0] = gyro._ivector[0]/scale
+        gyro._vector[1] = gyro._ivector[1]/scale
+        gyro._vector[2] = gyro._ivector[2]/scale
+
+    # FIFO
+    def fifo_start(self, accel=True, gyro=True, temperature=False):
+        '''
+        Resets the FIFO and starts writing the chosen sensors to it at the
+        sample rate. Frame timestamps count from this call.
+        '''
+        self._fifo_accel = accel
+        self._fifo_gyro = gyro
+        self._fifo_temperature = temperature
+        self._fifo_frame = 6*accel + 2*temperature + 6*gyro
+        if self._fifo_frame == 0:
+            raise ValueError('Select at least one sensor for the FIFO')
+        if self._fifo_buf is None or len(self._fifo_buf) != self._fifo_chunk * self._fifo_frame:
+            self._fifo_buf = bytearray(self._fifo_chunk * self._fifo_frame)
+            view = memoryview(self._fifo_buf)  # Views of 0 to _fifo_chunk frames for the reads
+            self._fifo_views = [view[:n * self._fifo_frame] for n in range(self._fifo_chunk + 1)]
+        self.fifo_period_us = self.sample_period_us
+        enable = 0x80*temperature | 0x70*gyro | 0x08*accel
+        try:
+            self._write(0, 0x23, self.mpu_addr)       # Stop writing to the FIFO
+            self._write(0x04, 0x6A, self.mpu_addr)    # Reset it (I2C master stays off for passthrough)
+            self._write(0x40, 0x6A, self.mpu_addr)    # Enable it
+            self._write(enable, 0x23, self.mpu_addr)  # Select the sensors
+        except OSError:
+            raise MPUException(self._I2Cerror)
+        self.fifo_start_ticks = ticks_us()
+        self.fifo_frames = 0                    # number of the next frame to be read
+        self.fifo_overflows = 0
+
+    def fifo_stop(self):
+        '''
+        Stops and disables the FIFO.
+        '''
+        try:
+            self._write(0, 0x23, self.mpu_addr)
+            self._write(0, 0x6A, self.mpu_addr)
+        except OSError:
+            raise MPUException(self._I2Cerror)
+
+    def fifo_count(self):
+        '''
+        Number of bytes waiting in the FIFO.
+        '''
+        try:
+            self._read(self.buf2, 0x72, self.mpu_addr)
+        except OSError:
+            raise MPUException(self._I2Cerror)
+        return (self.buf2[0] & 0x1F) << 8 | self.buf2[1]
+
+    def fifo_timestamp(self, frame):
+        '''
+        ticks_us value at which a frame (as numbered by fifo_read) was sampled,
+        assuming the first frame was sampled when fifo_start() was called.
+        '''
+        return ticks_add(self.fifo_start_ticks, frame * self.fifo_period_us)
+
+    def fifo_read(self, accel_out=None, gyro_out=None, frames_out=None, temp_out=None):
+        '''
+        Drains whole frames from the FIFO in bulk reads into preallocated
+        arrays, without allocating memory.
+        accel_out, gyro_out: array('f') receiving x, y, z of each frame in g and
+        degrees/s (sensor axes: no transposition, scaling or calibration)
+        frames_out: array('l') receiving the frame number of each frame, for
+        fifo_timestamp()
+        temp_out: array('f') receiving temperatures in degree C
+        Arrays that are None are skipped. Reads at most as many frames as the
+        given arrays hold. Returns the number of frames read.
+        If the FIFO has overflowed it is reset, the overflow counted in
+        fifo_overflows and the frame numbering resynchronised to the clock.
+        '''
+        frame = self._fifo_frame
+        limit = self._fifo_size // frame
+        if accel_out is not None:
+            limit = min(limit, len(accel_out) // 3)
+        if gyro_out is not None:
+            limit = min(limit, len(gyro_out) // 3)
+        if frames_out is not None:
+            limit = min(limit, len(frames_out))
+        if temp_out is not None:
+            limit = min(limit, len(temp_out))
+        count = self.fifo_count()
+        if count >= self._fifo_size:
+            # Full: the oldest samples were overwritten, possibly leaving a partial frame
+            self.fifo_overflows += 1
+            try:
+                self._write(0x04, 0x6A, self.mpu_addr)
+                self._write(0x40, 0x6A, self.mpu_addr)
+            except OSError:
+                raise MPUException(self._I2Cerror)
+            self.fifo_frames = ticks_diff(ticks_us(), self.fifo_start_ticks) // self.fifo_period_us
+            return 0
+        available = min(count // frame, limit)
+        accel_scale = self._accel_scale
+        gyro_scale = self._gyro_scale
+        offset_gyro = 6*self._fifo_accel + 2*self._fifo_temperature
+        offset_temp = 6*self._fifo_accel
+        buf = self._fifo_buf
+        done = 0
+        while done < available:
+            n = min(self._fifo_chunk, available - done)
+            try:
+                self._read(self._fifo_views[n], 0x74, self.mpu_addr)
+            except OSError:
+                raise MPUException(self._I2Cerror)
+            for k in range(n):
+                i = k * frame
+                j = done + k
+                if accel_out is not None and self._fifo_accel:
+                    accel_out[3*j] = bytes_toint(buf[i], buf[i + 1])/accel_scale
+                    accel_out[3*j + 1] = bytes_toint(buf[i + 2], buf[i + 3])/accel_scale
+                    accel_out[3*j + 2] = bytes_toint(buf[i + 4], buf[i + 5])/accel_scale
+                if temp_out is not None and self._fifo_temperature:
+                    t = i + offset_temp
+                    temp_out[j] = bytes_toint(buf[t], buf[t + 1])/self._temp_scale + self._temp_offset
+                if gyro_out is not None and self._fifo_gyro:
+                    g = i + offset_gyro
+                    gyro_out[3*j] = bytes_toint(buf[g], buf[g + 1])/gyro_scale
+                    gyro_out[3*j + 1] = bytes_toint(buf[g + 2], buf[g + 3])/gyro_scale
+                    gyro_out[3*j + 2] = bytes_toint(buf[g + 4], buf[g + 5])/gyro_scale
+                if frames_out is not None:
+                    frames_out[j] = self.fifo_frames + j
+            done += n
+        self.fifo_frames += done
+        return done
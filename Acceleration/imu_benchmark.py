@@ -0,0 +1,204 @@
+""" Host-side benchmark of imu.MPU6050.read_all against separate reads.
+
+Runs the MPU6050 and MPU9250 drivers on CPython with the fake I2C bus from
+fake_machine and simulated sensors.  For one fusion sample it compares
+reading accel, gyro and temperature through their own properties with one
+read_all(), reporting I2C transactions, bus bytes, bus time at 400 kHz and
+host processing time.  run_fifo() compares polling every 20 ms with draining
+the FIFO of an MPU9250 sampling at 1 kHz and 200 Hz.  Run from this folder
+with
+
+    python imu_benchmark.py
+
+"""
+
+import fake_machine
+import struct
+import time
+from machine import I2C
+from imu import MPU6050
+from mpu9250 import MPU9250
+
+class FakeMPU:
+    """ Simulates the registers and FIFO of an MPU6050 or MPU9250.
+
+    The FIFO fills at the sample rate set by registers 0x19 and 0x1A, on the
+    fake clock.  In every frame written to the FIFO the raw accel x value is
+    the frame number (modulo 32768), so that gaps can be found.
+
+    Parameters
+    ----------
+    accel, gyro : tuple of int
+        Raw accelerometer and gyro values.
+    temperature : int
+        Raw temperature.
+    mpu9250 : bool
+        If True, use the MPU9250 FIFO size and sample rate rules.
+    """
+
+    def __init__(self, accel=(1200, -800, 16000), gyro=(30, -45, 12), temperature=-1500, mpu9250=False):
+        self.registers = bytearray(128)
+        self.registers[0x3B:0x49] = struct.pack('>7h', *accel, temperature, *gyro)
+        self.mpu9250 = mpu9250
+        self.fifo_size = 512 if mpu9250 else 1024
+        self._fifo_start = 0
+        self._fifo_read = 0
+
+    def _period_us(self):
+        dlpf = self.registers[0x1A] & 7
+        if dlpf in (0, 7):
+            return 125 if self.mpu9250 else 125 * (1 + self.registers[0x19])
+        return 1000 * (1 + self.registers[0x19])
+
+    def _frame(self):
+        enable = self.registers[0x23]
+        return 6 * bool(enable & 0x08) + 2 * bool(enable & 0x80) + 6 * bool(enable & 0x70)
+
+    def _fifo_written(self):
+        #bytes written to the FIFO since it was reset
+        if not (self.registers[0x6A] & 0x40 and self._frame()):
+            return 0
+        return (time.ticks_us() - self._fifo_start) // self._period_us() * self._frame()
+
+    def _fifo_byte(self, index):
+        frame = self._frame()
+        number, offset = divmod(index, frame)
+        enable = self.registers[0x23]
+        data = b''
+        if enable & 0x08:
+            data += struct.pack('>h', number & 0x7FFF) + self.registers[0x3D:0x41]
+        if enable & 0x80:
+            data += self.registers[0x41:0x43]
+        if enable & 0x70:
+            data += self.registers[0x43:0x49]
+        return data[offset]
+
+    def readfrom_mem(self, memaddr, nbytes):
+        if memaddr in (0x72, 0x74):
+            written = self._fifo_written()
+            #when full, the oldest bytes are overwritten
+            self._fifo_read = max(self._fifo_read, written - self.fifo_size)
+            if memaddr == 0x72:
+                count = written - self._fifo_read
+                return bytes([count >> 8, count & 0xFF])
+            data = bytes([self._fifo_byte(self._fifo_read + i) for i in range(nbytes)])
+            self._fifo_read += nbytes
+            return data
+        return self.registers[memaddr:memaddr + nbytes]
+
+    def writeto_mem(self, memaddr, buf):
+        self.registers[memaddr:memaddr + len(buf)] = buf
+        if memaddr == 0x6A and buf[0] & 0x04:
+            self._fifo_start = time.ticks_us()
+            self._fifo_read = 0
+
+class FakeAK8963:
+    """ Simulates the MPU9250 magnetometer, always with new data. """
+
+    def __init__(self, mag=(200, -100, 300)):
+        self.registers = bytearray(32)
+        self.registers[0x02] = 1
+        self.registers[0x03:0x09] = struct.pack('<3h', *mag)
+        self.registers[0x10:0x13] = bytes([170, 170, 165])
+
+    def readfrom_mem(self, memaddr, nbytes):
+        return self.registers[memaddr:memaddr + nbytes]
+
+    def writeto_mem(self, memaddr, buf):
+        pass
+
+def separate(imu):
+    return imu.accel.xyz, imu.gyro.xyz, imu.temperature
+
+def together(imu):
+    imu.read_all()
+    return imu.accel.last_xyz, imu.gyro.last_xyz, imu.last_temperature
+
+def per_sample(func, imu, i2c, samples=1000):
+    """ Returns the transactions, bus bytes, bus time (us) and host time (us) per sample. """
+    transactions = i2c.transactions
+    bus_bytes = i2c.bus_bytes
+    bus_us = i2c.bus_us()
+    start = time.perf_counter()
+    for i in range(samples):
+        func(imu)
+    cpu = (time.perf_counter() - start) / samples * 1000000
+    return ((i2c.transactions - transactions) / samples, (i2c.bus_bytes - bus_bytes) / samples,
+            (i2c.bus_us() - bus_us) / samples, cpu)
+
+def run():
+    for name in ('MPU6050', 'MPU9250'):
+        i2c = I2C(1)
+        i2c.add_device(104, FakeMPU())
+        if name == 'MPU6050':
+            imu = MPU6050(i2c)
+        else:
+            i2c.add_device(12, FakeAK8963())
+            imu = MPU9250(i2c)
+        assert separate(imu) == together(imu)
+        print(name, 'accel, gyro, temperature =', together(imu))
+        print(f"{'':>10}{'I2C/sample':>12}{'bytes':>8}{'bus us':>9}{'host us':>9}")
+        for label, func in (('separate', separate), ('read_all', together)):
+            transactions, bus_bytes, bus_us, cpu = per_sample(func, imu, i2c)
+            print(f"{label:>10}{transactions:12.0f}{bus_bytes:8.0f}{bus_us:9.1f}{cpu:9.1f}")
+
+def run_fifo(seconds=2):
+    """ Compares 50 Hz polling with read_all with draining the FIFO at two sample rates. """
+    from array import array
+    i2c = I2C(1)
+    i2c.add_device(104, FakeMPU(mpu9250=True))
+    i2c.add_device(12, FakeAK8963())
+    imu = MPU9250(i2c)
+    imu.gyro_filter_range = 1                   # 1kHz internal rate, 184 Hz bandwidth
+    print(f"{'':>20}{'samples':>9}{'wakes/s':>9}{'I2C/sample':>12}{'bus us/sample':>15}{'gaps':>6}")
+
+    #polling as in logger.py
+    transactions = i2c.transactions
+    bus_us = i2c.bus_us()
+    samples = seconds * 50
+    for i in range(samples):
+        imu.read_all()
+        time.sleep_ms(20)
+    print(f"{'poll every 20 ms':>20}{samples:9d}{50:9d}{(i2c.transactions - transactions) / samples:12.2f}"
+          f"{(i2c.bus_us() - bus_us) / samples:15.1f}{'-':>6}")
+
+    #FIFO with accel and gyro frames (12 bytes, so 42 frames fit in the FIFO)
+    accel = array('f', bytes(4 * 3 * 64))
+    gyro = array('f', bytes(4 * 3 * 64))
+    frames = array('l', bytes(4 * 64))
+    for divider, drain_ms in ((0, 30), (4, 150)):
+        imu.sample_rate = divider
+        transactions = i2c.transactions
+        bus_us = i2c.bus_us()
+        imu.fifo_start()
+        received = 0
+        gaps = 0
+        expected = 0
+        end = time.ticks_add(imu.fifo_start_ticks, seconds * 1000000)
+        while time.ticks_diff(end, time.ticks_us()) > 0:
+            time.sleep_ms(drain_ms)
+            n = imu.fifo_read(accel, gyro, frames)
+            while n:
+                for k in range(n):
+                    #accel x carries the frame number written by the fake sensor
+                    if round(accel[3 * k] * imu._accel_scale) != frames[k] & 0x7FFF:
+                        gaps += 1
+                received += n
+                expected = frames[n - 1] + 1
+                n = imu.fifo_read(accel, gyro, frames)
+        label = f"FIFO {1000000 // imu.fifo_period_us} Hz, {drain_ms} ms"
+        print(f"{label:>20}{received:9d}{1000 // drain_ms:9d}{(i2c.transactions - transactions) / received:12.2f}"
+              f"{(i2c.bus_us() - bus_us) / received:15.1f}{gaps + imu.fifo_overflows:6d}")
+    print(f"last frame {expected - 1} sampled {time.ticks_diff(imu.fifo_timestamp(expected - 1), imu.fifo_start_ticks)} us "
+          f"after fifo_start")
+
+    #draining too slowly overflows the 512 byte FIFO, which is detected and reset
+    imu.fifo_start()
+    time.sleep_ms(1000)
+    imu.fifo_read(accel, gyro, frames)
+    print('after 1 s without draining: overflows', imu.fifo_overflows, ', numbering resumes at frame', imu.fifo_frames)
+    imu.fifo_stop()
+
+if __name__ == '__main__':
+    run()
+    run_fifo()
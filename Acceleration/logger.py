@@ -67,13 +67,14 @@ def log(t):
         #Read sensor values
         count = 0
         while count < 300:
-            fuse.update(imu.accel.xyz, imu.gyro.xyz, imu.mag.xyz) # Note blocking mag read
+            imu.read_all() # accel, gyro and temperature in one I2C transaction
+            fuse.update(imu.accel.last_xyz, imu.gyro.last_xyz, imu.mag.xyz) # Note blocking mag read
             time.sleep_ms(20)
             count += 1
         heading = fuse.heading
         pitch = fuse.pitch
         roll = fuse.roll
-        temperature = imu.temperature
+        temperature = imu.last_temperature
         
         #Get time
         [year, month, day, hour, minute, second, weekday, yesterday] = time.localtime()
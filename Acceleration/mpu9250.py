@@ -41,6 +41,9 @@ class MPU9250(MPU6050):
 
     _mag_addr = 12          # Magnetometer address
     _chip_id = 113
+    _temp_scale = 333.87
+    _temp_offset = 21
+    _fifo_size = 512
 
     def __init__(self, side_str, device_addr=None, transposition=(0, 1, 2), scaling=(1, 1, 1)):
 
@@ -59,17 +62,15 @@ class MPU9250(MPU6050):
         '''
         return self._accel, self._gyro, self._mag
 
-    # get temperature
     @property
-    def temperature(self):
+    def sample_period_us(self):
         '''
-        Returns the temperature in degree C.
+        Time between samples in microseconds. With the gyro filter at 0 or 7
+        the MPU9250 samples at 8kHz and ignores the sample rate divider.
         '''
-        try:
-            self._read(self.buf2, 0x41, self.mpu_addr)
-        except OSError:
-            raise MPUException(self._I2Cerror)
-        return bytes_toint(self.buf2[0], self.buf2[1])/333.87 + 21  # I think
+        if self.gyro_filter_range in (0, 7):
+            return 125
+        return 1000 * (1 + self.sample_rate)
 
     # Low pass filters
     @property
@@ -103,6 +103,16 @@ class Vector3d(object):
                 self._calvector[self._transpose[1]] * self._scale[1],
                 self._calvector[self._transpose[2]] * self._scale[2])
 
+    @property
+    def last_xyz(self):
+        '''
+        Values from the last update, without reading the sensor again
+        (e.g. after MPU6050.read_all())
+        '''
+        return (self._calvector[self._transpose[0]] * self._scale[0],
+                self._calvector[self._transpose[1]] * self._scale[1],
+                self._calvector[self._transpose[2]] * self._scale[2])
+
     @property
     def magnitude(self):
         x, y, z = self.xyz  # All measurements must correspond to the same instant
@@ -0,0 +1,398 @@
+""" Replays logged raw IMU data through the Madgwick filter of fusion.py on a PC.
+
+Acceleration/fusion.py updates the orientation one sample at a time on the
+logger, so trying another beta, magnetometer bias or declination would mean
+running the hardware again.  This module replays logged raw accelerometer,
+gyro and magnetometer readings with their timestamps through the same
+filter, doing the arithmetic of Fusion.update (and Fusion.update_nomag) in
+the same order, so the quaternions are identical to those of Fusion on
+CPython given the same readings and a timediff of (end - start) / scale.
+Boards with single precision floats round differently.
+
+The filter is sequential in time, so the arithmetic is done on NumPy arrays
+across settings instead: every combination of beta and magnetometer bias
+is one element of the arrays, and one pass over the file updates them all.
+The declination only adds to the heading, so declinations cost nothing.
+Each step costs a few hundred NumPy operations whatever the number of
+settings, so replay is slower than Fusion itself for a handful of settings
+and faster from a few tens (about 20 times faster for 1000).
+sweep() runs files in parallel in a process pool and writes one row per
+setting and output sample to a columnar .npz or .csv file.
+
+Raw logs are .npz files with arrays 't', 'accel', 'gyro' and 'mag' (n x 3),
+or csv files with the header line::
+
+    t,ax,ay,az,gx,gy,gz,mx,my,mz
+
+t in microseconds (ticks_us), accel in G, gyro in deg/s and mag in any unit.
+
+Example
+-------
+>>> import fusion_replay
+>>> t, accel, gyro, mag = fusion_replay.load('imu_raw.csv')
+>>> out = fusion_replay.replay(t, accel, gyro, mag, beta=[0.1, 0.6], magbias=(5, -3, 2))
+>>> out['heading'][-1]
+>>> fusion_replay.sweep(['a.csv', 'b.csv'], betas=[0.05, 0.1, 0.6], declinations=[0, 10], output='sweep.npz')
+
+"""
+
+import io
+import itertools
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+#Fusion's default beta
+BETA = math.sqrt(3.0 / 4.0) * math.radians(40)
+#ticks_us of MicroPython wraps at 2**30 on most ports
+TICKS_PERIOD = 1 << 30
+COLUMNS = ('t', 'ax', 'ay', 'az', 'gx', 'gy', 'gz', 'mx', 'my', 'mz')
+
+def unwrap_ticks(t, period=TICKS_PERIOD):
+    """ Makes wrapping ticks_us timestamps increase, as ticks_diff would see them. """
+    t = np.asarray(t, dtype=np.int64)
+    if len(t) == 0:
+        return t
+    steps = np.diff(t) % period
+    return np.concatenate(([t[0]], t[0] + np.cumsum(steps)))
+
+def load(path, period=None):
+    """ Reads a raw IMU log.
+
+    Parameters
+    ----------
+    path : str
+        .npz or csv file in the format above.
+    period : int, optional
+        If given, timestamps wrapping at period (e.g. TICKS_PERIOD) are
+        unwrapped.
+
+    Returns
+    -------
+    t : numpy.ndarray
+        Timestamps, int64 if they are whole numbers.
+    accel, gyro, mag : numpy.ndarray
+        n x 3 float arrays.
+
+    """
+    if path.endswith('.npz'):
+        with np.load(path) as data:
+            t = data['t']
+            accel, gyro, mag = (np.asarray(data[name], dtype=np.float64).reshape(-1, 3) for name in ('accel', 'gyro', 'mag'))
+    else:
+        with open(path, 'rb') as f:
+            text = f.read().decode()
+        table = np.loadtxt(io.StringIO(text), delimiter=',', comments='t', ndmin=2)
+        if table.shape[0] == 0:
+            table = np.zeros((0, len(COLUMNS)))
+        t = table[:, 0]
+        accel, gyro, mag = table[:, 1:4], table[:, 4:7], table[:, 7:10]
+    if t.dtype.kind == 'f' and np.all(t == np.round(t)):
+        t = t.astype(np.int64)
+    if period is not None:
+        t = unwrap_ticks(t, period)
+    return t, accel, gyro, mag
+
+def replay(t, accel, gyro, mag, beta=BETA, magbias=(0, 0, 0), declination=0, scale=1000000, every=1):
+    """ Runs the Madgwick filter of fusion.Fusion over a log for several settings at once.
+
+    Parameters
+    ----------
+    t : sequence of int or float
+        Timestamps; the time step is (t[i] - t[previous update]) / scale,
+        and 0.0001 s for the first update, as with Fusion(timediff).
+    accel, gyro, mag : array_like
+        n x 3 readings, as passed to Fusion.update.  If mag is None the
+        filter of Fusion.update_nomag is used and the heading is 0.
+    beta : float or sequence of float
+        Filter gain, one per setting.
+    magbias : sequence of 3 float, or S x 3
+        Magnetometer bias (Fusion.magbias), one per setting.
+    declination : float
+        Added to the heading.
+    scale : float
+        Timestamp units per second.
+    every : int
+        Output every every-th sample (the last is always output).
+
+    beta and magbias are broadcast against each other to S settings.
+
+    Returns
+    -------
+    dict of numpy.ndarray
+        'index' (the samples output), 't', and 'q1' to 'q4', 'heading',
+        'pitch', 'roll' and 'updated', each (samples output) x S.
+        Before the first update ('updated' False) the angles are 0, as in
+        Fusion.
+
+    """
+    beta = np.atleast_1d(np.asarray(beta, dtype=np.float64))
+    magbias = np.atleast_2d(np.asarray(magbias, dtype=np.float64))
+    settings = np.broadcast(beta[:, None], magbias).shape[0]
+    beta = np.broadcast_to(beta, (settings,)).copy()
+    magbias = np.broadcast_to(magbias, (settings, 3))
+    bx, by, bz = magbias[:, 0].copy(), magbias[:, 1].copy(), magbias[:, 2].copy()
+    accel = np.asarray(accel, dtype=np.float64)
+    gyro = np.asarray(gyro, dtype=np.float64)
+    n = len(accel)
+    index = np.arange(every - 1, n, every)
+    if n and (len(index) == 0 or index[-1] != n - 1):
+        index = np.append(index, n - 1)
+    out = np.zeros((len(index), 4, settings))
+    updated = np.zeros((len(index), settings), dtype=bool)
+
+    #the readings are the same for every setting, so they stay Python floats
+    ts = np.asarray(t).tolist()
+    ax_, ay_, az_ = (accel[:, k].tolist() for k in range(3))
+    gx_, gy_, gz_ = (gyro[:, k].tolist() for k in range(3))
+    if mag is not None:
+        mag = np.asarray(mag, dtype=np.float64)
+        mx_, my_, mz_ = (mag[:, k].tolist() for k in range(3))
+    deg2rad = math.pi / 180                 # math.radians
+    sqrt = math.sqrt
+    q1 = np.ones(settings)
+    q2 = np.zeros(settings)
+    q3 = np.zeros(settings)
+    q4 = np.zeros(settings)
+    last = np.zeros(settings, dtype=np.asarray(t).dtype if n else np.int64)
+    started = np.zeros(settings, dtype=bool)
+    row = 0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for i in range(n):
+            ax = ax_[i]
+            ay = ay_[i]
+            az = az_[i]
+            gx = gx_[i] * deg2rad
+            gy = gy_[i] * deg2rad
+            gz = gz_[i] * deg2rad
+            # Normalise accelerometer measurement
+            norm = sqrt(ax * ax + ay * ay + az * az)
+            if norm != 0:
+                norm = 1 / norm
+                ax *= norm
+                ay *= norm
+                az *= norm
+                if mag is None:
+                    ok = None
+                    # Auxiliary variables to avoid repeated arithmetic
+                    _2q1 = 2 * q1
+                    _2q2 = 2 * q2
+                    _2q3 = 2 * q3
+                    _2q4 = 2 * q4
+                    _4q1 = 4 * q1
+                    _4q2 = 4 * q2
+                    _4q3 = 4 * q3
+                    _8q2 = 8 * q2
+                    _8q3 = 8 * q3
+                    q1q1 = q1 * q1
+                    q2q2 = q2 * q2
+                    q3q3 = q3 * q3
+                    q4q4 = q4 * q4
+
+                    # Gradient decent algorithm corrective step
+                    s1 = _4q1 * q3q3 + _2q3 * ax + _4q1 * q2q2 - _2q2 * ay
+                    s2 = _4q2 * q4q4 - _2q4 * ax + 4 * q1q1 * q2 - _2q1 * ay - _4q2 + _8q2 * q2q2 + _8q2 * q3q3 + _4q2 * az
+                    s3 = 4 * q1q1 * q3 + _2q1 * ax + _4q3 * q4q4 - _2q4 * ay - _4q3 + _8q3 * q2q2 + _8q3 * q3q3 + _4q3 * az
+                    s4 = 4 * q2q2 * q4 - _2q2 * ax + 4 * q3q3 * q4 - _2q3 * ay
+                else:
+                    mx = mx_[i] - bx
+                    my = my_[i] - by
+                    mz = mz_[i] - bz
+                    # Normalise magnetometer measurement; settings where it is zero are not updated
+                    norm = np.sqrt(mx * mx + my * my + mz * mz)
+                    ok = norm != 0
+                    if ok.all():
+                        ok = None
+                    norm = 1 / norm
+                    mx = mx * norm
+                    my = my * norm
+                    mz = mz * norm
+
+                    # Auxiliary variables to avoid repeated arithmetic
+                    _2q1 = 2 * q1
+                    _2q2 = 2 * q2
+                    _2q3 = 2 * q3
+                    _2q4 = 2 * q4
+                    _2q1q3 = 2 * q1 * q3
+                    _2q3q4 = 2 * q3 * q4
+                    q1q1 = q1 * q1
+                    q1q2 = q1 * q2
+                    q1q3 = q1 * q3
+                    q1q4 = q1 * q4
+                    q2q2 = q2 * q2
+                    q2q3 = q2 * q3
+                    q2q4 = q2 * q4
+                    q3q3 = q3 * q3
+                    q3q4 = q3 * q4
+                    q4q4 = q4 * q4
+
+                    # Reference direction of Earth's magnetic field
+                    _2q1mx = 2 * q1 * mx
+                    _2q1my = 2 * q1 * my
+                    _2q1mz = 2 * q1 * mz
+                    _2q2mx = 2 * q2 * mx
+                    hx = mx * q1q1 - _2q1my * q4 + _2q1mz * q3 + mx * q2q2 + _2q2 * my * q3 + _2q2 * mz * q4 - mx * q3q3 - mx * q4q4
+                    hy = _2q1mx * q4 + my * q1q1 - _2q1mz * q2 + _2q2mx * q3 - my * q2q2 + my * q3q3 + _2q3 * mz * q4 - my * q4q4
+                    _2bx = np.sqrt(hx * hx + hy * hy)
+                    _2bz = -_2q1mx * q3 + _2q1my * q2 + mz * q1q1 + _2q2mx * q4 - mz * q2q2 + _2q3 * my * q4 - mz * q3q3 + mz * q4q4
+                    _4bx = 2 * _2bx
+                    _4bz = 2 * _2bz
+
+                    # Gradient descent algorithm corrective step
+                    s1 = (-_2q3 * (2 * q2q4 - _2q1q3 - ax) + _2q2 * (2 * q1q2 + _2q3q4 - ay) - _2bz * q3 * (_2bx * (0.5 - q3q3 - q4q4)
+                         + _2bz * (q2q4 - q1q3) - mx) + (-_2bx * q4 + _2bz * q2) * (_2bx * (q2q3 - q1q4) + _2bz * (q1q2 + q3q4) - my)
+                         + _2bx * q3 * (_2bx * (q1q3 + q2q4) + _2bz * (0.5 - q2q2 - q3q3) - mz))
+
+                    s2 = (_2q4 * (2 * q2q4 - _2q1q3 - ax) + _2q1 * (2 * q1q2 + _2q3q4 - ay) - 4 * q2 * (1 - 2 * q2q2 - 2 * q3q3 - az)
+                         + _2bz * q4 * (_2bx * (0.5 - q3q3 - q4q4) + _2bz * (q2q4 - q1q3) - mx) + (_2bx * q3 + _2bz * q1) * (_2bx * (q2q3 - q1q4)
+                         + _2bz * (q1q2 + q3q4) - my) + (_2bx * q4 - _4bz * q2) * (_2bx * (q1q3 + q2q4) + _2bz * (0.5 - q2q2 - q3q3) - mz))
+
+                    s3 = (-_2q1 * (2 * q2q4 - _2q1q3 - ax) + _2q4 * (2 * q1q2 + _2q3q4 - ay) - 4 * q3 * (1 - 2 * q2q2 - 2 * q3q3 - az)
+                         + (-_4bx * q3 - _2bz * q1) * (_2bx * (0.5 - q3q3 - q4q4) + _2bz * (q2q4 - q1q3) - mx)
+                         + (_2bx * q2 + _2bz * q4) * (_2bx * (q2q3 - q1q4) + _2bz * (q1q2 + q3q4) - my)
+                         + (_2bx * q1 - _4bz * q3) * (_2bx * (q1q3 + q2q4) + _2bz * (0.5 - q2q2 - q3q3) - mz))
+
+                    s4 = (_2q2 * (2 * q2q4 - _2q1q3 - ax) + _2q3 * (2 * q1q2 + _2q3q4 - ay) + (-_4bx * q4 + _2bz * q2) * (_2bx * (0.5 - q3q3 - q4q4)
+                          + _2bz * (q2q4 - q1q3) - mx) + (-_2bx * q1 + _2bz * q3) * (_2bx * (q2q3 - q1q4) + _2bz * (q1q2 + q3q4) - my)
+                          + _2bx * q2 * (_2bx * (q1q3 + q2q4) + _2bz * (0.5 - q2q2 - q3q3) - mz))
+
+                norm = 1 / np.sqrt(s1 * s1 + s2 * s2 + s3 * s3 + s4 * s4)    # normalise step magnitude
+                s1 = s1 * norm
+                s2 = s2 * norm
+                s3 = s3 * norm
+                s4 = s4 * norm
+
+                # Compute rate of change of quaternion
+                qDot1 = 0.5 * (-q2 * gx - q3 * gy - q4 * gz) - beta * s1
+                qDot2 = 0.5 * (q1 * gx + q3 * gz - q4 * gy) - beta * s2
+                qDot3 = 0.5 * (q1 * gy - q2 * gz + q4 * gx) - beta * s3
+                qDot4 = 0.5 * (q1 * gz + q2 * gy - q3 * gx) - beta * s4
+
+                # Integrate to yield quaternion, with Fusion.deltat's time step
+                deltat = np.where(started, (ts[i] - last) / scale, 0.0001)
+                n1 = q1 + qDot1 * deltat
+                n2 = q2 + qDot2 * deltat
+                n3 = q3 + qDot3 * deltat
+                n4 = q4 + qDot4 * deltat
+                norm = 1 / np.sqrt(n1 * n1 + n2 * n2 + n3 * n3 + n4 * n4)    # normalise quaternion
+                if ok is None:
+                    q1 = n1 * norm
+                    q2 = n2 * norm
+                    q3 = n3 * norm
+                    q4 = n4 * norm
+                    last[:] = ts[i]
+                    started[:] = True
+                else:
+                    q1 = np.where(ok, n1 * norm, q1)
+                    q2 = np.where(ok, n2 * norm, q2)
+                    q3 = np.where(ok, n3 * norm, q3)
+                    q4 = np.where(ok, n4 * norm, q4)
+                    last[ok] = ts[i]
+                    started |= ok
+            if row < len(index) and index[row] == i:
+                out[row] = q1, q2, q3, q4
+                updated[row] = started
+                row += 1
+
+    q1, q2, q3, q4 = out[:, 0], out[:, 1], out[:, 2], out[:, 3]
+    if mag is None:
+        heading = np.zeros_like(q1)
+    else:
+        heading = np.where(updated, declination + np.degrees(np.arctan2(2.0 * (q2 * q3 + q1 * q4),
+            q1 * q1 + q2 * q2 - q3 * q3 - q4 * q4)), 0.0)
+    pitch = np.where(updated, np.degrees(-np.arcsin(2.0 * (q2 * q4 - q1 * q3))), 0.0)
+    roll = np.where(updated, np.degrees(np.arctan2(2.0 * (q1 * q2 + q3 * q4),
+        q1 * q1 - q2 * q2 - q3 * q3 + q4 * q4)), 0.0)
+    return {'index': index, 't': np.asarray(t)[index], 'q1': q1, 'q2': q2, 'q3': q3, 'q4': q4,
+            'heading': heading, 'pitch': pitch, 'roll': roll, 'updated': updated}
+
+def _replay_file(task):
+    #one file for the process pool
+    path, betas, magbiases, declinations, scale, every, period, use_mag = task
+    t, accel, gyro, mag = load(path, period)
+    settings = list(itertools.product(betas, magbiases))
+    result = replay(t, accel, gyro, mag if use_mag else None, [s[0] for s in settings],
+                    [s[1] for s in settings], 0, scale, every)
+    return settings, result
+
+def write_columns(path, columns):
+    """ Writes a dict of equal length 1-D arrays to .npz (compressed) or .csv. """
+    if path.endswith('.npz'):
+        np.savez_compressed(path, **columns)
+        return
+    names = list(columns)
+    with open(path, 'w') as f:
+        f.write(','.join(names) + '\n')
+        np.savetxt(f, np.column_stack([np.asarray(columns[name], dtype=np.float64) for name in names]),
+                   delimiter=',', fmt='%.10g')
+
+def sweep(paths, betas=(BETA,), magbiases=((0, 0, 0),), declinations=(0,), output=None,
+          processes=None, scale=1000000, every=1, period=None, use_mag=True):
+    """ Replays raw logs for every combination of beta, magbias and declination.
+
+    Parameters
+    ----------
+    paths : sequence of str
+        Raw logs (see load()), replayed in parallel.
+    betas, magbiases, declinations : sequence
+        Settings to try; see replay().
+    output : str, optional
+        .npz or .csv file to write.
+    processes : int, optional
+        Size of the process pool (default: one per CPU); 1 runs in this process.
+    scale, every : optional
+        Passed to replay().
+    period : int, optional
+        Passed to load().
+    use_mag : bool
+        If False, replay as Fusion.update_nomag.
+
+    Returns
+    -------
+    dict of numpy.ndarray
+        One row per file, setting and output sample: 'file_index' (into
+        paths), 'beta', 'magbias_x' to 'magbias_z', 'declination', 't',
+        'q1' to 'q4', 'heading', 'pitch' and 'roll'.
+
+    """
+    tasks = [(path, list(betas), [tuple(b) for b in magbiases], list(declinations), scale, every, period, use_mag)
+             for path in paths]
+    if processes == 1 or len(tasks) == 1:
+        results = [_replay_file(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(processes) as pool:
+            results = list(pool.map(_replay_file, tasks))
+
+    parts = []
+    for file_index, (settings, result) in enumerate(results):
+        rows = len(result['t'])
+        for declination in declinations:
+            #replayed with declination 0, which leaves the heading unchanged
+            heading = result['heading']
+            if use_mag:
+                heading = np.where(result['updated'], declination + heading, 0.0)
+            for k, (beta, magbias) in enumerate(settings):
+                parts.append({'file_index': np.full(rows, file_index), 'beta': np.full(rows, beta),
+                              'magbias_x': np.full(rows, magbias[0]), 'magbias_y': np.full(rows, magbias[1]),
+                              'magbias_z': np.full(rows, magbias[2]), 'declination': np.full(rows, declination),
+                              't': result['t'], 'q1': result['q1'][:, k], 'q2': result['q2'][:, k],
+                              'q3': result['q3'][:, k], 'q4': result['q4'][:, k], 'heading': heading[:, k],
+                              'pitch': result['pitch'][:, k], 'roll': result['roll'][:, k]})
+    names = ('file_index', 'beta', 'magbias_x', 'magbias_y', 'magbias_z', 'declination', 't',
+             'q1', 'q2', 'q3', 'q4', 'heading', 'pitch', 'roll')
+    columns = {name: np.concatenate([part[name] for part in parts]) if parts else np.zeros(0) for name in names}
+    if output is not None:
+        write_columns(output, columns)
+    return columns
+
+if __name__ == '__main__':
+    import sys
+    import time
+    if len(sys.argv) < 3:
+        print('usage: python fusion_replay.py output.npz imu_raw.csv [imu_raw2.csv ...]')
+        sys.exit(1)
+    start = time.perf_counter()
+    columns = sweep(sys.argv[2:], betas=(0.05, 0.1, 0.2, BETA, 1.0), output=sys.argv[1], period=TICKS_PERIOD)
+    print('%d rows in %.3f s' % (len(columns['t']), time.perf_counter() - start))
+    print('Wrote', sys.argv[1])
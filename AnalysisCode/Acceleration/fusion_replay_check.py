@@ -0,0 +1,122 @@
+""" Checks fusion_replay against Acceleration/fusion.py and times a sweep.
+
+By default the data are synthetic: no recorded IMU log is kept in the
+repository.  A simulated recording (fusion_benchmark.trace: a sensor
+rolling and yawing like a buoy at 200 Hz), or each recorded log given on
+the command line (read with fusion_replay.load), with a zero accelerometer reading and a reading
+equal to one of the magnetometer biases is run through Fusion.update and
+Fusion.update_nomag, one Fusion per setting, and through
+fusion_replay.replay for all settings at once.  The quaternions must be
+identical and the angles agree to 1e-9 degrees.  Then replay is timed
+against Fusion.update for growing numbers of settings, and sweep() over
+several files (the recorded logs if given) with and without the process
+pool.  Run from this folder with
+
+    python fusion_replay_check.py [imu_raw.csv ...]
+
+"""
+
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+import fusion_replay
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'Acceleration'))
+from fusion import Fusion
+from fusion_benchmark import trace
+
+def recording(seconds=20, seed=1):
+    ts, accel, gyro, mag, truth = trace(seconds, seed=seed)
+    t = np.array(ts, dtype=np.int64)
+    accel, gyro, mag = (np.array(a, dtype=np.float64).reshape(-1, 3) for a in (accel, gyro, mag))
+    return t, accel, gyro, mag
+
+def fusion_reference(t, accel, gyro, mag, beta, magbias, declination):
+    fuse = Fusion(lambda end, start: (end - start) / 1000000)
+    fuse.beta = beta
+    fuse.magbias = magbias
+    fuse.declination = declination
+    ts = t.tolist()
+    a, g = accel.tolist(), gyro.tolist()
+    m = None if mag is None else mag.tolist()
+    q = np.zeros((len(ts), 4))
+    angles = np.zeros((len(ts), 3))
+    for i in range(len(ts)):
+        if m is None:
+            fuse.update_nomag(a[i], g[i], ts[i])
+        else:
+            fuse.update(a[i], g[i], m[i], ts[i])
+        q[i] = fuse.q
+        angles[i] = fuse.heading, fuse.pitch, fuse.roll
+    return q, angles
+
+def check(data=None, label='simulated'):
+    t, accel, gyro, mag = recording() if data is None else (np.array(x) for x in data)
+    betas = [0.02, fusion_replay.BETA, 1.5, fusion_replay.BETA]
+    magbiases = [(0, 0, 0), (5, -3, 2), (4, -2, 1), (1, 2, 3)]
+    accel[7] = 0                            # skipped by Fusion, without a time step
+    mag[min(300, len(mag) - 1)] = magbiases[3]  # skipped for the last setting only
+    declination = 3.5
+    for use_mag in (True, False):
+        out = fusion_replay.replay(t, accel, gyro, mag if use_mag else None, betas, magbiases, declination)
+        for k in range(len(betas)):
+            q, angles = fusion_reference(t, accel, gyro, mag if use_mag else None, betas[k], magbiases[k], declination)
+            got = np.column_stack([out[name][:, k] for name in ('q1', 'q2', 'q3', 'q4')])
+            assert np.array_equal(got, q), (use_mag, k, np.abs(got - q).max())
+            got = np.column_stack([out[name][:, k] for name in ('heading', 'pitch', 'roll')])
+            assert np.abs(got - angles).max() < 1e-9, (use_mag, k, np.abs(got - angles).max())
+    print('replay matches Fusion.update and Fusion.update_nomag for %d settings and %d samples (%s)' % (len(betas), len(t), label))
+
+def timing(data=None):
+    #10 s of the simulated recording or the first 2000 samples of a log
+    t, accel, gyro, mag = recording(10) if data is None else (x[:2000] for x in data)
+    n = len(t)
+    start = time.perf_counter()
+    fusion_reference(t, accel, gyro, mag, fusion_replay.BETA, (0, 0, 0), 0)
+    fusion_rate = n / (time.perf_counter() - start)
+    print(f"{'settings':>9}{'Fusion updates/s':>18}{'replay updates/s':>18}{'speedup':>9}")
+    for settings in (1, 4, 16, 64, 256, 1024):
+        betas = np.linspace(0.01, 1.0, settings)
+        start = time.perf_counter()
+        fusion_replay.replay(t, accel, gyro, mag, betas, every=100)
+        rate = n * settings / (time.perf_counter() - start)
+        print(f'{settings:9d}{fusion_rate:18.0f}{rate:18.0f}{rate / fusion_rate:9.2f}')
+
+def sweep_timing(files=8, paths=None):
+    with tempfile.TemporaryDirectory() as folder:
+        if paths:
+            files = len(paths)
+        else:
+            paths = []
+        for k in range(len(paths), files):
+            t, accel, gyro, mag = recording(30, seed=k)
+            path = os.path.join(folder, 'imu_raw%d.npz' % k)
+            np.savez(path, t=t, accel=accel, gyro=gyro, mag=mag)
+            paths.append(path)
+        betas = np.linspace(0.02, 1.0, 8)
+        magbiases = [(0, 0, 0), (5, -3, 2), (4, -3, 2), (5, -2, 2)]
+        declinations = (0, 2, 4)
+        times = {}
+        for processes in (1, None):
+            output = os.path.join(folder, 'sweep.npz')
+            start = time.perf_counter()
+            columns = fusion_replay.sweep(paths, betas, magbiases, declinations, output, processes, every=200)
+            times[processes] = time.perf_counter() - start
+        with np.load(output) as saved:
+            assert all(np.array_equal(saved[name], columns[name]) for name in columns)
+        print('sweep of %d files x %d settings x %d declinations: %d rows, %.2f s in one process, %.2f s with a pool of %d'
+              % (files, len(betas) * len(magbiases), len(declinations), len(columns['t']), times[1], times[None], os.cpu_count()))
+
+if __name__ == '__main__':
+    logs = sys.argv[1:]
+    if logs:
+        for path in logs:
+            check(fusion_replay.load(path, fusion_replay.TICKS_PERIOD), path)
+        timing(fusion_replay.load(logs[0], fusion_replay.TICKS_PERIOD))
+        sweep_timing(paths=logs)
+    else:
+        check()
+        timing()
+        sweep_timing()
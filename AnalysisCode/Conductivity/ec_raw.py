@@ -0,0 +1,217 @@
+""" Decodes and reprocesses raw conductivity bursts captured by ec_function.
+
+A sampler created with ``ec_function.ECSampler(raw_file='ecraw.bin')`` appends
+every burst to a binary file as a packed header followed by the six arrays of
+ADC counts (see RAW_HEADER in ec_function.py).  This module reads those files
+into NumPy structured arrays and recomputes current, resistance and the
+interquartile means for all bursts at once, optionally with new values of
+max_voltage, con_resistance or max_count.
+
+Example
+-------
+>>> import ec_raw
+>>> records = ec_raw.read_raw('ecraw.bin')
+>>> result = ec_raw.reprocess(records, max_voltage=2.745)
+>>> result['R_av']
+
+"""
+
+import numpy as np
+
+#must match RAW_HEADER = '<4sHHIIff' and RAW_MAGIC in ec_function.py
+RAW_MAGIC = b'ECR1'
+HEADER_FIELDS = [('magic', 'S4'), ('n', '<u2'), ('max_count', '<u2'),
+                 ('time', '<u4'), ('elapsed_time', '<u4'),
+                 ('max_voltage', '<f4'), ('con_resistance', '<f4')]
+HEADER_DTYPE = np.dtype(HEADER_FIELDS)
+COUNT_NAMES = ('imeas1', 'imeas2', 'p3meas1', 'p3meas2', 'p4meas1', 'p4meas2')
+
+def record_dtype(n):
+    """ Returns the structured dtype of one raw record with n samples per array. """
+    return np.dtype(HEADER_FIELDS + [(name, '<u2', (n,)) for name in COUNT_NAMES])
+
+def _split_records(buffer):
+    #walks the headers of a file whose records do not all have the same n and
+    #returns the (start, stop, n) byte ranges of runs of equal-length records
+    runs = []
+    offset = 0
+    size = len(buffer)
+    while offset < size:
+        header = np.frombuffer(buffer, HEADER_DTYPE, 1, offset)[0]
+        if header['magic'] != RAW_MAGIC:
+            raise ValueError('Bad raw record header at byte %d' % offset)
+        n = int(header['n'])
+        length = record_dtype(n).itemsize
+        if runs and runs[-1][2] == n and runs[-1][1] == offset:
+            runs[-1][1] = offset + length
+        else:
+            runs.append([offset, offset + length, n])
+        offset += length
+    if offset != size:
+        raise ValueError('Raw file ends with a partial record')
+    return runs
+
+def read_raw(path):
+    """ Reads a raw capture file.
+
+    Parameters
+    ----------
+    path : str
+        File written in raw capture mode.
+
+    Returns
+    -------
+    numpy.ndarray or list of numpy.ndarray
+        Structured array of records.  Files normally hold records with one
+        value of n and are read with a single np.frombuffer call; if n changes
+        within the file, a list with one array per run of equal n is returned.
+
+    """
+    with open(path, 'rb') as f:
+        buffer = f.read()
+    if not buffer:
+        return np.zeros(0, record_dtype(0))
+    first = np.frombuffer(buffer, HEADER_DTYPE, 1)[0]
+    dtype = record_dtype(int(first['n']))
+    if len(buffer) % dtype.itemsize == 0:
+        records = np.frombuffer(buffer, dtype)
+        if (np.all(records['magic'] == RAW_MAGIC)
+                and np.all(records['n'] == first['n'])):
+            return records
+    return [np.frombuffer(buffer, record_dtype(n), (stop - start) // record_dtype(n).itemsize, start)
+            for start, stop, n in _split_records(buffer)]
+
+def trimmed_mean(x, lower_index, upper_index):
+    """ Mean of np.sort(x, axis=1)[:, lower_index:upper_index], found by partitioning. """
+    part = np.partition(x, (lower_index, upper_index - 1), axis=1)
+    return part[:, lower_index:upper_index].mean(axis=1)
+
+def valid_trimmed_mean(x, valid):
+    """ Interquartile mean of the valid samples of each row, as ECSampler._finish computes it.
+
+    Parameters
+    ----------
+    x : numpy.ndarray
+        (bursts, n) samples.
+    valid : numpy.ndarray of bool
+        (bursts, n) mask of the samples to use.
+
+    Returns
+    -------
+    numpy.ndarray
+        Mean of the sorted valid samples from valid_count >> 2 up to
+        (3*valid_count + 3) >> 2 in each row; nan for rows with none.
+
+    """
+    count = valid.sum(axis=1)
+    lower_index = (count >> 2)[:, None]
+    upper_index = ((3 * count + 3) >> 2)[:, None]
+    #invalid samples sort to the end of each row, after the valid ones
+    ordered = np.sort(np.where(valid, x, np.inf), axis=1)
+    j = np.arange(x.shape[1])
+    window = (j >= lower_index) & (j < upper_index)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(window, ordered, 0).sum(axis=1) / window.sum(axis=1)
+
+def reprocess(records, max_voltage=None, con_resistance=None, max_count=None):
+    """ Recomputes current, resistance and their interquartile means for every burst.
+
+    Parameters
+    ----------
+    records : numpy.ndarray
+        Structured array returned by read_raw (one value of n).
+    max_voltage, con_resistance, max_count : float, optional
+        Calibration to apply.  By default the values stored with each record
+        are used.
+
+    Returns
+    -------
+    dict of numpy.ndarray
+        Per-sample arrays of shape (bursts, n): i1, i2, V1, V2, R1, R2; and
+        per-burst arrays: time, meas_freq, resistance1, resistance2, R_av,
+        current1, current2, i_av, maximum, minimum, invalid.  Samples with
+        zero current in either polarity get a resistance of -999999 and, as
+        on the logger, are left out of the means; invalid is their number
+        in each burst (the logger sets STATUS_INVALID if it is not 0).
+        Bursts with no valid sample get resistances of -999999 and
+        currents of 0.
+
+    """
+    n = records['imeas1'].shape[1]
+    if max_voltage is None:
+        max_voltage = records['max_voltage'].astype(np.float64)[:, None]
+    if con_resistance is None:
+        con_resistance = records['con_resistance'].astype(np.float64)[:, None]
+    if max_count is None:
+        max_count = records['max_count'].astype(np.float64)[:, None]
+    v_scale = max_voltage / max_count
+    i_scale = v_scale / con_resistance
+
+    imeas1 = records['imeas1'].astype(np.int32)
+    imeas2 = records['imeas2'].astype(np.int32)
+    i1 = imeas1 * i_scale
+    i2 = imeas2 * i_scale
+    V1 = (records['p3meas1'].astype(np.int32) - records['p4meas1']) * v_scale
+    V2 = (records['p4meas2'].astype(np.int32) - records['p3meas2']) * v_scale
+    with np.errstate(divide='ignore', invalid='ignore'):
+        R1 = np.where(imeas1 != 0, V1 / i1, -999999.0)
+        R2 = np.where(imeas2 != 0, V2 / i2, -999999.0)
+
+    #clean data by sampling middle two quartiles of the valid samples, as on the logger
+    valid = (imeas1 != 0) & (imeas2 != 0)
+    invalid = n - valid.sum(axis=1)
+    if invalid.any():
+        none = invalid == n
+        resistance1 = np.where(none, -999999.0, valid_trimmed_mean(R1, valid))
+        resistance2 = np.where(none, -999999.0, valid_trimmed_mean(R2, valid))
+        current1 = np.where(none, 0.0, valid_trimmed_mean(i1, valid))
+        current2 = np.where(none, 0.0, valid_trimmed_mean(i2, valid))
+    else:
+        lower_index = n // 4
+        upper_index = (3 * n + 3) // 4
+        resistance1 = trimmed_mean(R1, lower_index, upper_index)
+        resistance2 = trimmed_mean(R2, lower_index, upper_index)
+        current1 = trimmed_mean(i1, lower_index, upper_index)
+        current2 = trimmed_mean(i2, lower_index, upper_index)
+
+    counts = np.concatenate([records[name] for name in COUNT_NAMES], axis=1)
+    return {
+        'time': records['time'],
+        'meas_freq': n / (records['elapsed_time'] / 1000000),
+        'i1': i1, 'i2': i2, 'V1': V1, 'V2': V2, 'R1': R1, 'R2': R2,
+        'resistance1': resistance1,
+        'resistance2': resistance2,
+        'R_av': (resistance1 + resistance2) / 2,
+        'current1': current1,
+        'current2': current2,
+        'i_av': (current1 + current2) / 2,
+        'maximum': counts.max(axis=1),
+        'minimum': counts.min(axis=1),
+        'invalid': invalid,
+    }
+
+def reprocess_file(path, **calibration):
+    """ Reads and reprocesses a raw file, returning per-burst results in file order.
+
+    Keyword arguments are passed to reprocess().  Per-sample arrays are
+    omitted because their width can change when n changes within the file.
+
+    """
+    records = read_raw(path)
+    if not isinstance(records, list):
+        records = [records]
+    results = [reprocess(r, **calibration) for r in records if len(r)]
+    if not results:
+        return {}
+    keys = [key for key in results[0] if results[0][key].ndim == 1]
+    return {key: np.concatenate([r[key] for r in results]) for key in keys}
+
+if __name__ == '__main__':
+    import sys
+    for path in sys.argv[1:]:
+        result = reprocess_file(path)
+        output = path.rsplit('.', 1)[0] + '_reprocessed.csv'
+        columns = ('time', 'R_av', 'i_av', 'resistance1', 'resistance2', 'meas_freq', 'maximum', 'minimum', 'invalid')
+        np.savetxt(output, np.column_stack([result[c] for c in columns]), delimiter=',',
+                   header=','.join(columns), comments='', fmt=['%d'] + ['%.6g'] * (len(columns) - 2) + ['%d'])
+        print('Wrote %d bursts to %s' % (len(result['time']), output))
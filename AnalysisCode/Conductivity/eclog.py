@@ -0,0 +1,195 @@
+""" Loads eclog files from the conductivity loggers and computes specific conductance.
+
+The loggers in ConductivityLogger and EC_logger append one line per reading
+to eclog.txt::
+
+    datetime,MS_pres,MS_temp,R_av,i_av,Therm_temp
+    2022/3/10 10:28:52,13.04,1028.09,656.614,0.0015,-59.80
+
+and write the header line again every time they start.  This module reads
+any number of these files into NumPy arrays, converts -999 to nan, and
+computes conductivity from the cell constant (found as in
+AnalysisCode/Calibration/CalibrationExamples.ipynb) and specific conductance
+at 25 degrees C with a linear temperature coefficient.  All of the arithmetic
+is done on whole arrays.
+
+Note that the loggers write the MS5839 temperature in the MS_pres column and
+the pressure in the MS_temp column (ms_pressure returns [cTemp, pressure]).
+read_eclog swaps them back unless ms_swapped=False.
+
+Example
+-------
+>>> import eclog
+>>> data = eclog.process(['eclog_LOS.txt'], cell_constant=0.6, temperature='MS_temp')
+>>> data['time'], data['EC25']
+
+"""
+
+import io
+import re
+import numpy as np
+try:
+    import pandas as pd
+except ImportError:
+    pd = None
+
+COLUMNS = ('MS_pres', 'MS_temp', 'R_av', 'i_av', 'Therm_temp')
+MISSING = -999
+#linear temperature coefficient (per degree C) typical of natural waters
+ALPHA = 0.0191
+
+#header lines
+_HEADER = re.compile(rb'datetime[^\n]*\n?')
+#the date and time separators become commas, so every field is a number
+_SEPARATORS = bytes.maketrans(b'/ :', b',,,')
+
+def _read_one(path):
+    #the header lines are removed before parsing, so the parser needs no
+    #comment handling (which made np.loadtxt much slower), and the whole
+    #file is parsed as numbers in one call, by pandas if it is installed
+    with open(path, 'rb') as f:
+        text = f.read()
+    text = _HEADER.sub(b'', text).replace(b'\r', b'').translate(_SEPARATORS)
+    columns = 6 + len(COLUMNS)
+    if not text.strip():
+        return np.zeros((0, columns))
+    if pd is not None:
+        table = pd.read_csv(io.BytesIO(text), header=None, dtype=np.float64).to_numpy()
+    else:
+        table = np.loadtxt(io.StringIO(text.decode()), delimiter=',', comments=None, ndmin=2)
+    if table.shape[1] != columns:
+        raise ValueError('%s: expected %d fields per line, found %d' % (path, columns, table.shape[1]))
+    return table
+
+def _to_datetime64(table):
+    #year, month, day, hour, minute and second columns to datetime64[s]
+    year = table[:, 0].astype(np.int64)
+    month = table[:, 1].astype(np.int64)
+    months = ((year - 1970) * 12 + month - 1).astype('datetime64[M]')
+    days = months.astype('datetime64[D]') + (table[:, 2].astype(np.int64) - 1)
+    seconds = table[:, 3] * 3600 + table[:, 4] * 60 + table[:, 5]
+    return days.astype('datetime64[s]') + seconds.astype(np.int64)
+
+def read_eclog(paths, ms_swapped=True, sort=True):
+    """ Reads one or more eclog files.
+
+    Parameters
+    ----------
+    paths : str or sequence of str
+        eclog files.
+    ms_swapped : bool, optional
+        If True (the default), swap the MS_pres and MS_temp columns, which
+        the loggers write in the wrong order.
+    sort : bool, optional
+        If True (the default), sort the readings by time.
+
+    Returns
+    -------
+    dict of numpy.ndarray
+        'time' (datetime64[s]) and one float array per column in COLUMNS,
+        with -999 replaced by nan.
+
+    """
+    if isinstance(paths, str):
+        paths = [paths]
+    table = np.concatenate([_read_one(path) for path in paths])
+    time = _to_datetime64(table)
+    if sort:
+        order = np.argsort(time, kind='stable')
+        table = table[order]
+        time = time[order]
+    values = table[:, 6:]
+    values[values == MISSING] = np.nan
+    data = {'time': time}
+    for k, name in enumerate(COLUMNS):
+        data[name] = values[:, k]
+    if ms_swapped:
+        data['MS_pres'], data['MS_temp'] = data['MS_temp'], data['MS_pres']
+    return data
+
+def conductivity(R_av, cell_constant):
+    """ Conductivity (uS/cm) at the measured temperature, k * 1e6 / R_av; nan where R_av is not positive. """
+    R_av = np.asarray(R_av, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(R_av > 0, cell_constant * 1e6 / R_av, np.nan)
+
+def ec25(R_av, temperature, cell_constant, alpha=ALPHA, reference=25.0):
+    """ Specific conductance (uS/cm at the reference temperature).
+
+    Parameters
+    ----------
+    R_av : numpy.ndarray
+        Cell resistance (ohms).  Values that are not positive give nan.
+    temperature : numpy.ndarray or float
+        Water temperature (degrees C).
+    cell_constant : float
+        Cell constant k (1/cm) from calibration, so that conductivity is
+        k * 1e6 / R_av uS/cm.
+    alpha : float, optional
+        Linear temperature coefficient (per degree C).  Default is ALPHA.
+    reference : float, optional
+        Reference temperature.  Default is 25.
+
+    Returns
+    -------
+    numpy.ndarray
+
+    """
+    return conductivity(R_av, cell_constant) / (1 + alpha * (np.asarray(temperature) - reference))
+
+def process(paths, cell_constant, alpha=ALPHA, temperature='Therm_temp',
+            valid_temperature=(-5, 45), ms_swapped=True):
+    """ Reads eclog files and adds conductivity and specific conductance.
+
+    Parameters
+    ----------
+    paths : str or sequence of str
+        eclog files.
+    cell_constant : float
+        Cell constant k (1/cm).
+    alpha : float, optional
+        Linear temperature coefficient (per degree C).
+    temperature : str or numpy.ndarray, optional
+        Column used for temperature compensation ('Therm_temp' or
+        'MS_temp'), or an array of temperatures for every reading.
+    valid_temperature : tuple of float, optional
+        Temperatures outside this range (for example -60 from a
+        disconnected thermistor) are treated as missing.
+    ms_swapped : bool, optional
+        Passed to read_eclog.
+
+    Returns
+    -------
+    dict of numpy.ndarray
+        The columns from read_eclog, plus 'EC' (uS/cm at the measured
+        temperature), 'T' (the temperature used) and 'EC25'.
+
+    """
+    data = read_eclog(paths, ms_swapped)
+    if isinstance(temperature, str):
+        T = data[temperature].copy()
+    else:
+        T = np.array(temperature, dtype=np.float64) + np.zeros(len(data['time']))
+    low, high = valid_temperature
+    T[(T < low) | (T > high)] = np.nan
+    data['T'] = T
+    data['EC'] = conductivity(data['R_av'], cell_constant)
+    data['EC25'] = data['EC'] / (1 + alpha * (T - 25.0))
+    return data
+
+if __name__ == '__main__':
+    import sys
+    import time
+    if len(sys.argv) < 3:
+        print('usage: python eclog.py cell_constant eclog.txt [eclog2.txt ...]')
+        sys.exit(1)
+    start = time.perf_counter()
+    data = process(sys.argv[2:], float(sys.argv[1]), temperature='MS_temp')
+    print('%d readings in %.3f s' % (len(data['time']), time.perf_counter() - start))
+    output = sys.argv[2].rsplit('.', 1)[0] + '_ec25.csv'
+    columns = ('MS_pres', 'MS_temp', 'R_av', 'Therm_temp', 'EC', 'EC25')
+    with open(output, 'w') as f:
+        f.write('datetime,' + ','.join(columns) + '\n')
+        np.savetxt(f, np.column_stack([data['time'].astype(str)] + [np.char.mod('%.4g', data[c]) for c in columns]),
+                   delimiter=',', fmt='%s')
+    print('Wrote', output)
@@ -0,0 +1,73 @@
+""" Times eclog.read_eclog and eclog.process on a large eclog file.
+
+Writes a file of a few years of readings (800000 lines by default, with
+CRLF line ends, -999 values and a header line every 100000 readings as
+when a logger restarts) to a temporary folder and reads it with the
+original reader (reproduced below as legacy_read_one) and with eclog,
+checking that the tables are identical.  eclog parses with pandas.read_csv
+if pandas is installed and with np.loadtxt otherwise; the parser used is
+printed with the timings.  Run from this folder with
+
+    python eclog_benchmark.py [lines]
+
+"""
+
+import io
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+import eclog
+
+def legacy_read_one(path):
+    with open(path, 'rb') as f:
+        text = f.read().decode()
+    text = text.replace('/', ',').replace(' ', ',').replace(':', ',')
+    table = np.loadtxt(io.StringIO(text), delimiter=',', comments='datetime', ndmin=2)
+    if table.shape[0] == 0:
+        table = np.zeros((0, 6 + len(eclog.COLUMNS)))
+    return table
+
+def write_eclog(path, lines, header_every=100000, seed=1):
+    rng = np.random.default_rng(seed)
+    start = np.datetime64('2022-03-10T10:28:52')
+    time = start + np.arange(lines) * np.timedelta64(60, 's')
+    stamps = np.datetime_as_string(time).astype('U19')
+    values = np.column_stack([rng.normal(15, 5, lines), rng.normal(1020, 10, lines),
+                              rng.uniform(200, 2000, lines), rng.uniform(0, 0.002, lines),
+                              rng.normal(12, 4, lines)])
+    values[rng.random(values.shape) < 0.01] = eclog.MISSING
+    header = 'datetime,' + ','.join(eclog.COLUMNS) + '\r\n'
+    with open(path, 'w', newline='') as f:
+        for begin in range(0, lines, header_every):
+            f.write(header)
+            for stamp, row in zip(stamps[begin:begin + header_every], values[begin:begin + header_every].tolist()):
+                #the loggers write the date without leading zeros
+                date, clock = stamp.split('T')
+                y, m, d = date.split('-')
+                f.write('%s/%d/%d %s,%.2f,%.2f,%.3f,%.4f,%.2f\r\n' % (y, int(m), int(d), clock, *row))
+
+def run(lines=800000):
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, 'eclog.txt')
+        write_eclog(path, lines)
+        size = os.path.getsize(path)
+        start = time.perf_counter()
+        old = legacy_read_one(path)
+        old_time = time.perf_counter() - start
+        start = time.perf_counter()
+        new = eclog._read_one(path)
+        new_time = time.perf_counter() - start
+        assert np.array_equal(old, new), 'tables differ'
+        start = time.perf_counter()
+        data = eclog.process(path, 0.6)
+        process_time = time.perf_counter() - start
+        assert len(data['time']) == lines
+    print('%d lines (%.1f MB), parser %s' % (lines, size / 1e6, 'pandas.read_csv' if eclog.pd is not None else 'np.loadtxt'))
+    print('legacy reader  %.3f s' % old_time)
+    print('eclog reader   %.3f s' % new_time)
+    print('eclog.process  %.3f s' % process_time)
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 800000)
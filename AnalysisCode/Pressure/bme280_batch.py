@@ -0,0 +1,144 @@
+""" Compensates arrays of raw BME280 readings on a PC.
+
+Pressure/bme280.py compensates one reading at a time with Bosch's integer
+formulas.  This module applies the same formulas, in the same order and with
+the same integer shifts and floor divisions, to whole NumPy int64 arrays, so
+raw readings logged at a high rate (or logged before a calibration problem
+was found) can be reprocessed with results identical to the driver's.
+
+The calibration block is the 26 bytes read from 0x88 followed by the 7 bytes
+read from 0xE1, and raw readings are either the 8-byte bursts read from
+0xF7 or arrays of raw temperature, pressure and humidity.
+
+As in Bosch's int64 reference code, the pressure formula assumes realistic
+calibration words and readings; for words far outside the range of real
+sensors its intermediate products exceed 64 bits and wrap, where the
+MicroPython driver (with unbounded integers) would not.
+
+Example
+-------
+>>> import bme280_batch
+>>> cal = bme280_batch.calibration(block)
+>>> raw_temp, raw_press, raw_hum = bme280_batch.decode_burst(bursts)
+>>> T, P, H = bme280_batch.to_units(*bme280_batch.compensate(cal, raw_temp, raw_press, raw_hum))
+
+"""
+
+import struct
+import numpy as np
+
+def calibration(block):
+    """ Decodes the calibration words as the driver does.
+
+    Parameters
+    ----------
+    block : bytes
+        26 bytes from register 0x88 followed by 7 bytes from 0xE1.
+
+    Returns
+    -------
+    dict
+        dig_T1 to dig_T3, dig_P1 to dig_P9 and dig_H1 to dig_H6.
+
+    """
+    if len(block) != 33:
+        raise ValueError('the calibration block must be 33 bytes long')
+    cal = {}
+    names = ('dig_T1', 'dig_T2', 'dig_T3', 'dig_P1', 'dig_P2', 'dig_P3', 'dig_P4',
+             'dig_P5', 'dig_P6', 'dig_P7', 'dig_P8', 'dig_P9', None, 'dig_H1')
+    for name, value in zip(names, struct.unpack('<HhhHhhhhhhhhBB', block[:26])):
+        if name:
+            cal[name] = value
+    e1 = block[26:]
+    cal['dig_H2'], cal['dig_H3'] = struct.unpack_from('<hB', e1)
+    cal['dig_H4'] = (struct.unpack_from('<b', e1, 3)[0] << 4) | (e1[4] & 0xF)
+    cal['dig_H5'] = (struct.unpack_from('<b', e1, 5)[0] << 4) | (e1[4] >> 4)
+    cal['dig_H6'] = struct.unpack_from('<b', e1, 6)[0]
+    return cal
+
+def decode_burst(registers):
+    """ Raw temperature, pressure and humidity from bursts of registers 0xF7 to 0xFE.
+
+    Parameters
+    ----------
+    registers : array_like
+        uint8 array of shape (n, 8), or bytes of length 8 * n.
+
+    Returns
+    -------
+    raw_temp, raw_press, raw_hum : numpy.ndarray
+        int64 arrays.
+
+    """
+    r = np.frombuffer(registers, dtype=np.uint8) if isinstance(registers, (bytes, bytearray)) \
+        else np.asarray(registers, dtype=np.uint8)
+    r = r.reshape(-1, 8).astype(np.int64)
+    raw_press = ((r[:, 0] << 16) | (r[:, 1] << 8) | r[:, 2]) >> 4
+    raw_temp = ((r[:, 3] << 16) | (r[:, 4] << 8) | r[:, 5]) >> 4
+    raw_hum = (r[:, 6] << 8) | r[:, 7]
+    return raw_temp, raw_press, raw_hum
+
+def compensate(cal, raw_temp, raw_press, raw_hum=None):
+    """ Compensated readings, identical to BME280.read_compensated_data.
+
+    Parameters
+    ----------
+    cal : dict
+        Calibration words from calibration().
+    raw_temp, raw_press, raw_hum : array_like
+        Raw readings.  If raw_hum is None (BMP280), humidity is not computed.
+
+    Returns
+    -------
+    temperature, pressure, humidity : numpy.ndarray
+        int64 arrays in the driver's units: 0.01 degrees C, Pa / 256 and
+        %RH / 1024.  humidity is None if raw_hum is None.
+
+    """
+    c = dict((name, np.int64(value)) for name, value in cal.items())
+    raw_temp = np.asarray(raw_temp, dtype=np.int64)
+    raw_press = np.asarray(raw_press, dtype=np.int64)
+
+    #temperature
+    var1 = (((raw_temp >> 3) - (c['dig_T1'] << 1)) * c['dig_T2']) >> 11
+    var2 = (((((raw_temp >> 4) - c['dig_T1']) *
+              ((raw_temp >> 4) - c['dig_T1'])) >> 12) * c['dig_T3']) >> 14
+    t_fine = var1 + var2
+    temp = (t_fine * 5 + 128) >> 8
+
+    #pressure
+    var1 = t_fine - 128000
+    var2 = var1 * var1 * c['dig_P6']
+    var2 = var2 + ((var1 * c['dig_P5']) << 17)
+    var2 = var2 + (c['dig_P4'] << 35)
+    var1 = ((var1 * var1 * c['dig_P3']) >> 8) + ((var1 * c['dig_P2']) << 12)
+    var1 = (((np.int64(1) << 47) + var1) * c['dig_P1']) >> 33
+    zero = var1 == 0
+    p = 1048576 - raw_press
+    with np.errstate(over='ignore'):
+        p = (((p << 31) - var2) * 3125) // np.where(zero, 1, var1)
+    var1 = (c['dig_P9'] * (p >> 13) * (p >> 13)) >> 25
+    var2 = (c['dig_P8'] * p) >> 19
+    pressure = np.where(zero, 0, ((p + var1 + var2) >> 8) + (c['dig_P7'] << 4))
+
+    if raw_hum is None:
+        return temp, pressure, None
+
+    #humidity
+    raw_hum = np.asarray(raw_hum, dtype=np.int64)
+    h = t_fine - 76800
+    h = (((((raw_hum << 14) - (c['dig_H4'] << 20) -
+            (c['dig_H5'] * h)) + 16384)
+          >> 15) * (((((((h * c['dig_H6']) >> 10) *
+                        (((h * c['dig_H3']) >> 11) + 32768)) >> 10) +
+                      2097152) * c['dig_H2'] + 8192) >> 14))
+    h = h - (((((h >> 15) * (h >> 15)) >> 7) * c['dig_H1']) >> 4)
+    h = np.clip(h, 0, 419430400)
+    return temp, pressure, h >> 12
+
+def to_units(temperature, pressure, humidity=None):
+    """ Converts compensate() output to degrees C, hPa and %RH (float64 arrays). """
+    T = temperature / 100
+    P = pressure / 25600
+    H = None if humidity is None else humidity / 1024
+    return T, P, H
@@ -0,0 +1,108 @@
+""" Checks bme280_batch against the MicroPython driver in Pressure/bme280.py.
+
+The driver is run on CPython with a small fake I2C bus that returns a
+calibration block and raw bursts.  Random calibration sets (around the
+values of real sensors) and random raw readings are compensated one at a
+time by the driver and as arrays by bme280_batch, and every integer result
+must agree.  The datasheet example (section 8.2) is checked first.  Run from
+this folder with
+
+    python bme280_fuzz.py
+
+"""
+
+import os
+import random
+import struct
+import sys
+import time
+import types
+import numpy as np
+import bme280_batch
+
+#the driver imports ustruct; MicroPython's unpack accepts longer buffers
+ustruct = types.ModuleType('ustruct')
+ustruct.unpack = struct.unpack_from
+ustruct.unpack_from = struct.unpack_from
+sys.modules.setdefault('ustruct', ustruct)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'Pressure'))
+import bme280
+
+#calibration words of the datasheet example (0x88 to 0xA1), and typical
+#registers 0xE1 to 0xE7 packed as H2, H3, 0xE4, 0xE5, 0xE6, H6
+EXAMPLE = (27504, 26435, -1000, 36477, -10685, 3024, 2855, 140, -7, 15500, -14600, 6000, 0, 75)
+EXAMPLE_H = (362, 0, 19, 0x25, 3, 30)
+
+class FakeI2C:
+    """ Serves a calibration block and one raw burst to bme280.BME280. """
+
+    def __init__(self, block):
+        self.block = block
+        self.burst = bytearray(8)
+
+    def readfrom_mem(self, address, memaddr, nbytes):
+        if memaddr == 0x88:
+            return self.block[:26]
+        return self.block[26:26 + nbytes]
+
+    def readfrom_mem_into(self, address, memaddr, buf):
+        buf[:] = self.burst[:len(buf)]
+
+    def writeto_mem(self, address, memaddr, buf):
+        pass
+
+def block_from(words, h):
+    #packs calibration words the way the sensor stores them
+    e1 = struct.pack('<hBbBbb', h[0], h[1], h[2], h[3], h[4], h[5])
+    return struct.pack('<HhhHhhhhhhhhBB', *words) + e1
+
+def random_block(rng):
+    spread = [2000, 2000, 300, 2000, 800, 1000, 2000, 200, 20, 3000, 3000, 2000, 0, 20]
+    words = [w + rng.randint(-s, s) for w, s in zip(EXAMPLE, spread)]
+    h = (rng.randint(300, 420), rng.randint(0, 10), rng.randint(15, 25), rng.randint(0, 255),
+         rng.randint(0, 5), rng.randint(20, 40))
+    return block_from(words, h)
+
+def burst(raw_temp, raw_press, raw_hum):
+    return bytes([raw_press >> 12, (raw_press >> 4) & 0xFF, (raw_press & 0xF) << 4,
+                  raw_temp >> 12, (raw_temp >> 4) & 0xFF, (raw_temp & 0xF) << 4,
+                  raw_hum >> 8, raw_hum & 0xFF])
+
+def run(sets=200, readings=200, seed=1):
+    rng = random.Random(seed)
+    block = block_from(EXAMPLE, EXAMPLE_H)
+    cal = bme280_batch.calibration(block)
+    T, P, H = bme280_batch.compensate(cal, [519888], [415148], [30000])
+    print('datasheet example: T =', T[0], '(2508), P =', P[0] / 256, 'Pa (100653.27)')
+    assert T[0] == 2508
+
+    mismatches = 0
+    for i in range(sets):
+        block = random_block(rng)
+        i2c = FakeI2C(block)
+        sensor = bme280.BME280(i2c=i2c, normal=True)
+        raw = [(rng.randint(400000, 600000), rng.randint(250000, 600000), rng.randint(0, 65535))
+               for k in range(readings)]
+        expected = []
+        for r in raw:
+            i2c.burst[:] = burst(*r)
+            expected.append(tuple(sensor.read_compensated_data()))
+        registers = b''.join([burst(*r) for r in raw])
+        T, P, H = bme280_batch.compensate(bme280_batch.calibration(block), *bme280_batch.decode_burst(registers))
+        for k in range(readings):
+            if (T[k], P[k], H[k]) != expected[k]:
+                mismatches += 1
+    print(sets * readings, 'random readings,', mismatches, 'mismatches')
+
+    #throughput
+    n = 1000000
+    raw_temp = np.random.default_rng(seed).integers(400000, 600000, n)
+    raw_press = np.random.default_rng(seed + 1).integers(250000, 600000, n)
+    raw_hum = np.random.default_rng(seed + 2).integers(0, 65535, n)
+    start = time.perf_counter()
+    bme280_batch.compensate(cal, raw_temp, raw_press, raw_hum)
+    print('%.1f million readings/s' % (n / (time.perf_counter() - start) / 1e6))
+    return mismatches
+
+if __name__ == '__main__':
+    sys.exit(1 if run() else 0)
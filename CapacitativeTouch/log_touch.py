@@ -17,6 +17,7 @@ Be sure to set the correct SSID, password, and apikey in credentials.py.
 import machine, utime, esp, esp32, urequests, usocket, network, uos
 #import post_to_google_sheet
 from machine import TouchPad, Pin
+from array import array
 #from credentials import credentials
 
 #pad_gpios = [0,2,12,13,14,27,33]
@@ -45,17 +46,23 @@ def log(sleeptime, wifi=False, sd=False):
     #Read touch data before turning on wifi
 
     #   t = TouchPad(Pin(32))
-    touches = []
-    raws = []
+    n = 12
+    touches = array('f', [0]*n)
+    raws = array('l', [0]*n)
     lower_index = 3
     upper_index = 9
     utime.sleep(3)
-    for i in range(12):    
-        (normal,raw) = normal_reading(touch_pads, t)
-        touches.append(normal)
-        raws.append(raw)
-    touch = sum(touches[3:9])/6
-    raw_touch = sum(raws[3:9])/6
+    for i in range(n):    
+        (touches[i], raws[i]) = normal_reading(touch_pads, t)
+    #average readings 3 to 8 in the order they were taken: the first three
+    #are skipped while the pads settle after the sleep
+    touch = 0
+    raw_touch = 0
+    for i in range(lower_index, upper_index):
+        touch += touches[i]
+        raw_touch += raws[i]
+    touch /= upper_index - lower_index
+    raw_touch /= upper_index - lower_index
     print('touch = ', touch, ' raw_touch = ', raw_touch)
         
     led = Pin(5, Pin.OUT)
@@ -2,6 +2,7 @@ import machine
 from machine import Pin, ADC
 import time
 import math
+import thermistor
 
 therm_resistance = 10000 #resistor in line with thermistor
 
@@ -18,14 +19,10 @@ therm_power.value(1)
 #set attenuation so that maximum voltage is about 2.5V
 adc_therm.atten(ADC.ATTN_11DB)
 
-A = 0.001125308852122
-B = 0.000234711863267
-C = 0.000000085663516
+#build the count to temperature table once (uses the default Steinhart-Hart coefficients)
+therm = thermistor.Thermistor(therm_resistance, max_voltage, max_count)
 
 while True:
     therm_count = adc_therm.read()
-    therm_voltage = therm_count / max_count * max_voltage
-    therm_i = therm_voltage / therm_resistance
-    R_t = (3.3 - therm_voltage)/therm_i
-    T = 1/((A+B*(math.log(R_t)))+C*((math.log(R_t))**3))-273.15
+    T = therm.temperature(therm_count)
     print(f'T={T}')
@@ -3,6 +3,7 @@ from machine import Pin, ADC
 import time
 import math
 import array as arr
+import thermistor
 
 #sampling parameters
 n = 12 #number of samples per measurement
@@ -90,31 +91,37 @@ for i in range(n):
         R2[i] = -999999
         print('Error in resistance computation')
 
+#leave samples without a valid resistance out of the averages
+valid = [i for i in range(n) if R1[i] != -999999]
+n_valid = len(valid)
+
 #clean data by sampling middle two quartiles       
-upper_index = math.ceil(3*n/4)
-lower_index = math.floor(n/4)
+upper_index = math.ceil(3*n_valid/4)
+lower_index = math.floor(n_valid/4)
 sampled_length = (upper_index - lower_index)
-resistance1 = sum(sorted(R1)[lower_index:upper_index])/sampled_length
-resistance2 = sum(sorted(R2)[lower_index:upper_index])/sampled_length
+if n_valid:
+    resistance1 = sum(sorted([R1[i] for i in valid])[lower_index:upper_index])/sampled_length
+    resistance2 = sum(sorted([R2[i] for i in valid])[lower_index:upper_index])/sampled_length
+    current1 = sum(sorted([i1[i] for i in valid])[lower_index:upper_index])/sampled_length
+    current2 = sum(sorted([i2[i] for i in valid])[lower_index:upper_index])/sampled_length
+else:
+    resistance1 = resistance2 = -999999
+    current1 = current2 = 0
 resistance_average = (resistance1+resistance2)/2
-current1 = sum(sorted(i1)[lower_index:upper_index])/sampled_length
-current2 = sum(sorted(i2)[lower_index:upper_index])/sampled_length
 current_average = (current1+current2)/2
+upper_index = math.ceil(3*n/4)
+lower_index = math.floor(n/4)
+sampled_length = (upper_index - lower_index)
 
-#read thermistor
-A = 0.001125308852122
-B = 0.000234711863267
-C = 0.000000085663516
+#read thermistor.  The count to temperature table is built once and then interpolated.
+therm = thermistor.Thermistor(therm_resistance, max_voltage, max_count)
 therm_count = arr.array('f',[0]*n)
 therm_power.value(1)
 for i in range(n):
     therm_count[i] = adc_therm.read()
 therm_power.value(0)
 therm_count_av = sum(sorted(therm_count)[lower_index:upper_index])/sampled_length    
-therm_voltage = therm_count_av / max_count * max_voltage
-therm_i = therm_voltage / therm_resistance
-R_t = (3.3 - therm_voltage)/therm_i
-T = 1/((A+B*(math.log(R_t)))+C*((math.log(R_t))**3))-273.15
+T = therm.temperature(therm_count_av)
     
 #find maximum and minimum counts to see if out of range of ADC:
 arrays_of_counts = [imeas1, imeas2, p3meas1, p3meas2, p4meas1, p4meas2]
@@ -126,6 +133,17 @@ for array in arrays_of_counts:
     oldmax = maximum
     oldmin = minimum
 
+#flag readings at the ends of the ADC range, or too small to resolve.  See
+#ECSampler in ec_function.py for automatic switching to another range.
+clip_margin = 8
+status = ''
+if maximum >= max_count - clip_margin or minimum <= clip_margin:
+    status += ' clipped'
+if abs(resistance_average * current_average) / max_voltage * max_count < max_count // 64:
+    status += ' low signal'
+if n_valid < n:
+    status += f" {n - n_valid} invalid samples"
+
 #Print output
 if printflag:
     for i in range (n):
@@ -134,5 +152,7 @@ if printflag:
 outputstring = f"R1 = {resistance1:.2f}, R2 = {resistance2:.2f}, R_av = {resistance_average:.2f}, "
 outputstring += f"i1 = {current1:.5f}, i2 = {current2:.5f}, i_av = {current_average:.5f}, "
 outputstring += f"T = {T:.2f}, freq = {meas_freq:.1f} hz, max_count = {maximum}, min_count = {minimum}"
+if status:
+    outputstring += ", status:" + status
 print(outputstring)
     
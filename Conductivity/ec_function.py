@@ -0,0 +1,894 @@
+""" Micropython library for reading a four-electrode conductivity cell and thermistor.
+
+The cell is excited with a square wave of alternating polarity while the current
+and the voltage drop across the inner electrodes are read by the ADC.  An
+ECSampler object owns the pins, ADCs and the count and result buffers for one
+cell, so they are configured once and then reused for every measurement.
+
+Example
+-------
+>>> import ec_function
+>>> sampler = ec_function.ECSampler()
+>>> [R_av, i_av, T] = sampler.measure()
+
+The older call ``ec_function.read_ec()`` is still available and uses a sampler
+that is created on the first call.
+
+Raw capture
+-----------
+If a sampler is created with ``raw_file='ecraw.bin'``, the raw counts of every
+burst are appended to that file, so resistance can be recomputed later (for
+example after recalibrating max_voltage or con_resistance).  Each record is a
+little-endian header packed with RAW_HEADER::
+
+    magic (4s, b'ECR1'), n (H), max_count (H), time (I, seconds),
+    elapsed_time (I, microseconds), max_voltage (f), con_resistance (f)
+
+followed by six arrays of n unsigned 16-bit counts: imeas1, imeas2, p3meas1,
+p3meas2, p4meas1, p4meas2.  AnalysisCode/Conductivity/ec_raw.py decodes these
+files on a PC.
+
+Auto-ranging
+------------
+If a sampler is created with a list of ranges, each measurement starts with a
+short probe burst.  If any count is clipped at the top of the ADC, the next
+wider range is tried; if the largest reading would fit in a more sensitive
+range, that range is used.  The index of the range used is kept in
+``sampler.range_index`` and problems with the measurement in the bits of
+``sampler.status``.  Each raw record stores the max_voltage and
+con_resistance of its range, so raw files are reprocessed correctly.
+
+>>> sampler = ec_function.ECSampler(ranges=ec_function.RANGES)
+>>> sampler.measure()
+>>> sampler.range_index, sampler.status
+
+Several cells
+-------------
+A MultiCellSampler measures several cells in one burst.  While one cell is in
+the off-period of its excitation cycle the others are excited, so N cells take
+much less than N times as long as one, and the thermistor is read once.
+
+>>> sampler = ec_function.MultiCellSampler([{}, dict(gpio1_pin=14, gpio2_pin=15,
+...     p3_pin=16, p4_pin=17, i1_pin=18, i2_pin=21)])
+>>> [[R_av, i_av, T], [R_av2, i_av2, T2]] = sampler.measure()
+
+Frequency sweep
+---------------
+``sampler.sweep()`` repeats the measurement for a list of cycle times, keeps
+the resistance and achieved excitation frequency of each, and switches the
+sampler to the shortest cycle time whose resistance still agrees with the
+slower ones.  This shows electrode polarization or settling effects and lets
+routine measurements use the fastest accurate setting.
+
+>>> sampler.sweep((400, 200, 100, 50, 20), tolerance=0.002)
+50
+>>> sampler.sweep_freq, sampler.sweep_R
+
+Samples whose resistance could not be computed (stored as -999999) are left
+out of the averages; STATUS_INVALID is set if there were any.
+
+"""
+
+import machine
+from machine import Pin, ADC
+import time
+import math
+import array as arr
+import struct
+import robust
+import thermistor
+
+#header of each record written in raw capture mode
+RAW_HEADER = '<4sHHIIff'
+RAW_MAGIC = b'ECR1'
+
+#ADC ranges tried by auto-ranging, from widest to most sensitive: (attenuation
+#code, max_voltage).  Voltages are nominal for the ESP32-S2 and should be
+#calibrated.  A range may also be (attenuation code, max_voltage,
+#con_resistance, gpio1_pin, gpio2_pin) to drive the cell through a different
+#pair of series resistors.
+RANGES = ((ADC.ATTN_11DB, 2.730), (ADC.ATTN_6DB, 1.300),
+          (ADC.ATTN_2_5DB, 1.050), (ADC.ATTN_0DB, 0.750))
+#fraction of a range's max_voltage that the largest probe reading may use
+RANGE_HEADROOM = 0.85
+
+#cycle times (us) measured by ECSampler.sweep() by default
+SWEEP_CYCLE_TIMES = (800, 400, 200, 100, 50, 20, 10)
+
+#bits of ECSampler.status
+STATUS_CLIPPED = 1  #a count was at the top or bottom of the ADC range
+STATUS_LOW_SIGNAL = 2  #the voltage across the inner electrodes was below low_count counts
+STATUS_INVALID = 4  #some samples had no valid resistance and were left out
+
+class ECSampler:
+    """ Persistent sampler for a four-electrode conductivity cell and thermistor.
+
+    Pins and ADCs are created and their attenuation is set once, in the
+    constructor.  The count and result buffers are allocated once as well, so
+    that repeated calls to measure() do not allocate new buffers.
+
+    Parameters
+    ----------
+    n : int, optional
+        Number of polarity-switched samples per measurement.  Default is 12.
+    cycle_time : int, optional
+        On and off time (microseconds) of each half of the excitation cycle.
+    con_resistance : float, optional
+        Resistor (ohms) on either end of the conductivity cell.
+    therm_resistance : float, optional
+        Resistor (ohms) in line with the thermistor.
+    max_count : int, optional
+        Maximum ADC count.  8191 for the ESP32-S2 in single read mode.
+    max_voltage : float, optional
+        Maximum readable voltage.  Should be calibrated for the attenuation.
+    attenuation_code : int, optional
+        ADC attenuation mode.  Default is ADC.ATTN_11DB.
+    gpio1_pin, gpio2_pin : int, optional
+        Pins that drive electrodes P1 and P2 through con_resistance.
+    p3_pin, p4_pin : int, optional
+        ADC pins connected directly to the inner electrodes.
+    i1_pin, i2_pin : int, optional
+        ADC pins connected directly to P1 and P2, used to compute current.
+    therm_power_pin, therm_pin : int or None, optional
+        Power pin and ADC pin of the NTC thermistor.  Use None if the
+        logger does not have a thermistor; the temperature is then -999.
+    supply_voltage : float, optional
+        Voltage across the thermistor divider.  Default is 3.3.
+    therm_coefficients : tuple of float, optional
+        Steinhart-Hart coefficients (A, B, C) of the thermistor.
+    printflag : int, optional
+        If nonzero, print every individual sample.
+    max_n : int, optional
+        Largest number of samples measure_adaptive() may take.  The count and
+        result buffers are allocated for this many samples.  Default is n.
+    interleave_therm : bool, optional
+        If True, the thermistor is powered during the excitation burst and
+        read in the first off-period of each of the first n cycles, instead
+        of in a separate loop after the burst.  Default is False.
+    raw_file : str or None, optional
+        If given, the raw counts of every burst are appended to this file.
+    ranges : sequence of tuple, optional
+        ADC ranges for auto-ranging, ordered from widest to most sensitive
+        (see RANGES).  By default the range is fixed by attenuation_code,
+        max_voltage and con_resistance.
+    probe_n : int, optional
+        Number of cycles in the auto-ranging probe burst.  Default is 2.
+    clip_margin : int, optional
+        Counts within this distance of 0 or max_count are treated as clipped.
+    low_count : int, optional
+        Mean voltage difference (counts) below which STATUS_LOW_SIGNAL is set.
+        Default is max_count // 64.
+
+    """
+
+    def __init__(self, n=12, cycle_time=100, con_resistance=272,
+                 therm_resistance=9880, max_count=8191, max_voltage=2.730,
+                 attenuation_code=ADC.ATTN_11DB, gpio1_pin=11, gpio2_pin=12,
+                 p3_pin=10, p4_pin=9, i1_pin=6, i2_pin=8, therm_power_pin=13,
+                 therm_pin=5, supply_voltage=3.3,
+                 therm_coefficients=(thermistor.A, thermistor.B, thermistor.C), printflag=0,
+                 raw_file=None, max_n=None, interleave_therm=False, ranges=None,
+                 probe_n=2, clip_margin=8, low_count=None):
+
+        #sampling parameters
+        self.n = n
+        self.max_n = n if max_n is None else max(n, max_n)
+        [self.on1, self.off1, self.on2, self.off2] = [cycle_time, cycle_time, cycle_time, cycle_time]
+        self.printflag = printflag
+        self.raw_file = raw_file
+        self.interleave_therm = interleave_therm and therm_pin is not None
+
+        #resistor values and ADC range
+        self.con_resistance = con_resistance
+        self._default_con_resistance = con_resistance
+        self.therm_resistance = therm_resistance
+        self.max_count = max_count
+        self.max_voltage = max_voltage
+        self.supply_voltage = supply_voltage
+        self.clip_margin = clip_margin
+        self.low_count = max_count // 64 if low_count is None else low_count
+
+        #define gpio pins and ADCs, and set attenuation so that maximum voltage is at highest possible level
+        self.gpio1 = Pin(gpio1_pin, Pin.OUT)
+        self.gpio2 = Pin(gpio2_pin, Pin.OUT)
+        self.adc_p3 = ADC(Pin(p3_pin))
+        self.adc_p4 = ADC(Pin(p4_pin))
+        self.adc_i1 = ADC(Pin(i1_pin))
+        self.adc_i2 = ADC(Pin(i2_pin))
+        adcs = [self.adc_p3, self.adc_p4, self.adc_i1, self.adc_i2]
+        if therm_pin is None:
+            self.therm_power = None
+            self.adc_therm = None
+            self.thermistor = None
+        else:
+            self.therm_power = Pin(therm_power_pin, Pin.OUT)
+            self.adc_therm = ADC(Pin(therm_pin))
+            adcs.append(self.adc_therm)
+            #count to temperature table, built once
+            self.thermistor = thermistor.Thermistor(therm_resistance, max_voltage,
+                max_count, supply_voltage, therm_coefficients)
+        for adc in adcs:
+            adc.atten(attenuation_code)
+
+        #bound methods are looked up once here; on MicroPython each lookup in the
+        #sampling loop would otherwise allocate a new bound method object
+        self._gpio1_value = self.gpio1.value
+        self._gpio2_value = self.gpio2.value
+        self._read_p3 = self.adc_p3.read
+        self._read_p4 = self.adc_p4.read
+        self._read_i1 = self.adc_i1.read
+        self._read_i2 = self.adc_i2.read
+        self._read_therm = None if self.adc_therm is None else self.adc_therm.read
+
+        #excitation pins of each auto-ranging profile, created once
+        self.ranges = ranges
+        self.probe_n = probe_n
+        self._range_pins = None
+        if ranges is not None:
+            self._range_pins = []
+            for r in ranges:
+                if len(r) > 2:
+                    self._range_pins.append((Pin(r[3], Pin.OUT).value, Pin(r[4], Pin.OUT).value))
+                else:
+                    self._range_pins.append((self._gpio1_value, self._gpio2_value))
+        self.range_index = 0
+        self.status = 0
+        self._invalid = 0
+        if ranges is not None:
+            self.set_range(0)
+
+        #pre-allocate arrays that will store counts.  Counts are unsigned 16-bit
+        #so that the arrays can be written to the raw file as they are (the ESP32
+        #is little-endian, matching the record header).
+        max_n = self.max_n
+        self.imeas1 = arr.array('H', [0]*max_n)
+        self.imeas2 = arr.array('H', [0]*max_n)
+        self.p3meas1 = arr.array('H', [0]*max_n)
+        self.p3meas2 = arr.array('H', [0]*max_n)
+        self.p4meas1 = arr.array('H', [0]*max_n)
+        self.p4meas2 = arr.array('H', [0]*max_n)
+        self.therm_count = arr.array('f', [0]*n)
+        self._count_arrays = (self.imeas1, self.imeas2, self.p3meas1,
+                              self.p3meas2, self.p4meas1, self.p4meas2)
+        self._therm_filled = 0
+        #ticks_us() at the start of each cycle, used to check the sample rate
+        self.cycle_ticks = arr.array('l', [0]*max_n)
+
+        #pre-allocate arrays for current, voltage drop across poles, and resistance, for flow each direction
+        self.i1 = arr.array('f', [0]*max_n)
+        self.i2 = arr.array('f', [0]*max_n)
+        self.V1 = arr.array('f', [0]*max_n)
+        self.V2 = arr.array('f', [0]*max_n)
+        self.R1 = arr.array('f', [0]*max_n)
+        self.R2 = arr.array('f', [0]*max_n)
+
+        #results of the last measurement: resistance_average, current_average, T
+        self.result = arr.array('f', [0, 0, 0])
+        #results of the last adaptive measurement: the same, plus n used and standard error of R
+        self.adaptive_result = arr.array('f', [0, 0, 0, 0, 0])
+        self.n_used = n
+        self.standard_error = 0
+        self.resistance1 = self.resistance2 = 0
+        self.current1 = self.current2 = 0
+        self.meas_freq = 0
+        self.elapsed_time = 0
+        self.measure_time = 0
+        self._raw_header = bytearray(struct.calcsize(RAW_HEADER))
+        self.maximum = self.minimum = 0
+
+    def sample(self, start=0, count=None):
+        """ Runs the polarity-switched excitation loop and stores the raw counts.
+
+        Samples are stored at indices start to start + count - 1 of the count
+        arrays.  By default n samples are stored from index 0.  If
+        interleave_therm is set, thermistor counts are also taken until n of
+        them have been stored since the last call to measure().
+
+        """
+        if count is None:
+            count = self.n
+        on1 = self.on1
+        off1 = self.off1
+        on2 = self.on2
+        off2 = self.off2
+        gpio1 = self._gpio1_value
+        gpio2 = self._gpio2_value
+        read_p3 = self._read_p3
+        read_p4 = self._read_p4
+        read_i1 = self._read_i1
+        read_i2 = self._read_i2
+        imeas1 = self.imeas1
+        imeas2 = self.imeas2
+        p3meas1 = self.p3meas1
+        p3meas2 = self.p3meas2
+        p4meas1 = self.p4meas1
+        p4meas2 = self.p4meas2
+        sleep_us = time.sleep_us
+        ticks_us = time.ticks_us
+        ticks_diff = time.ticks_diff
+        cycle_ticks = self.cycle_ticks
+        therm_count = self.therm_count
+        read_therm = self._read_therm
+        j = self._therm_filled
+        therm_n = self.n if self.interleave_therm else 0
+        if j < therm_n:
+            self.therm_power.value(1)
+
+        starttime = ticks_us()
+        for i in range(start, start + count):
+            cycle_ticks[i] = ticks_us()
+            #normal polarity
+            gpio1(1)
+            sleep_us(on1)
+            imeas1[i] = read_i1()
+            p3meas1[i] = read_p3()
+            p4meas1[i] = read_p4()
+            gpio1(0)
+            if j < therm_n:
+                #read the thermistor in the off-period and sleep for the rest of it
+                t0 = ticks_us()
+                therm_count[j] = read_therm()
+                j += 1
+                sleep_us(max(0, off1 - ticks_diff(ticks_us(), t0)))
+            else:
+                sleep_us(off1)
+
+            #switched polarity
+            gpio2(1)
+            sleep_us(on2)
+            imeas2[i] = read_i2()
+            p3meas2[i] = read_p3()
+            p4meas2[i] = read_p4()
+            gpio2(0)
+            sleep_us(off2)
+
+        elapsed_time = ticks_diff(ticks_us(), starttime)
+        if therm_n:
+            self.therm_power.value(0)
+            self._therm_filled = j
+        self.elapsed_time = elapsed_time
+        self.meas_freq = count/(elapsed_time/1000000)
+
+    def set_range(self, index):
+        """ Switches the cell ADCs and excitation pins to ranges[index]. """
+        r = self.ranges[index]
+        for adc in (self.adc_p3, self.adc_p4, self.adc_i1, self.adc_i2):
+            adc.atten(r[0])
+        self.max_voltage = r[1]
+        self.con_resistance = r[2] if len(r) > 2 else self._default_con_resistance
+        self._gpio1_value, self._gpio2_value = self._range_pins[index]
+        self.range_index = index
+
+    def autorange(self):
+        """ Chooses the range for the next burst from short probe bursts.
+
+        Starts from the range used last.  A probe with a clipped count moves
+        to the next wider range; otherwise the most sensitive range whose
+        max_voltage holds the largest probe reading with RANGE_HEADROOM to
+        spare is chosen.  A range is never made more sensitive again after a
+        clipped probe, so the search ends after at most len(ranges) + 1
+        probes.
+
+        Returns
+        -------
+        int
+            Index of the range chosen.
+
+        """
+        ranges = self.ranges
+        probe_n = self.probe_n
+        index = self.range_index
+        widened = False
+        self._therm_filled = self.n  #no thermistor reads in the probe
+        for attempt in range(len(ranges) + 1):
+            self.sample(0, probe_n)
+            maximum, minimum = self._extremes(probe_n)
+            if maximum >= self.max_count - self.clip_margin:
+                if index == 0:
+                    break
+                index -= 1
+                widened = True
+            else:
+                if widened:
+                    break
+                peak = maximum * self.max_voltage / self.max_count
+                new = index
+                while new + 1 < len(ranges) and peak < ranges[new + 1][1] * RANGE_HEADROOM:
+                    new += 1
+                if new == index:
+                    break
+                index = new
+            self.set_range(index)
+        return index
+
+    def _extremes(self, length):
+        #largest and smallest count in the first length samples
+        maximum = 0
+        minimum = self.max_count
+        for counts in self._count_arrays:
+            if length == self.max_n:
+                maximum = max(max(counts), maximum)
+                minimum = min(min(counts), minimum)
+            else:
+                for i in range(length):
+                    if counts[i] > maximum:
+                        maximum = counts[i]
+                    if counts[i] < minimum:
+                        minimum = counts[i]
+        return maximum, minimum
+
+    def write_raw(self, f, length=None):
+        """ Appends the raw counts of the last burst (length samples, default n) to the binary file object f. """
+        if length is None:
+            length = self.n
+        struct.pack_into(RAW_HEADER, self._raw_header, 0, RAW_MAGIC, length,
+                         self.max_count, int(time.time()), self.elapsed_time,
+                         self.max_voltage, self.con_resistance)
+        f.write(self._raw_header)
+        for counts in self._count_arrays:
+            if length == self.max_n:
+                f.write(counts)
+            else:
+                f.write(memoryview(counts)[:length])
+
+    def _compute(self, start, stop):
+        #compute current, voltage, and resistance for samples start to stop - 1
+        #(done outside sampling loop to maintain sampling timing)
+        imeas1 = self.imeas1
+        imeas2 = self.imeas2
+        p3meas1 = self.p3meas1
+        p3meas2 = self.p3meas2
+        p4meas1 = self.p4meas1
+        p4meas2 = self.p4meas2
+        i1 = self.i1
+        i2 = self.i2
+        V1 = self.V1
+        V2 = self.V2
+        R1 = self.R1
+        R2 = self.R2
+        v_scale = self.max_voltage / self.max_count
+        i_scale = v_scale / self.con_resistance
+        for i in range(start, stop):
+            try:
+                i1[i] = imeas1[i] * i_scale
+                i2[i] = imeas2[i] * i_scale
+                V1[i] = (p3meas1[i] - p4meas1[i]) * v_scale
+                V2[i] = (p4meas2[i] - p3meas2[i]) * v_scale
+                R1[i] = V1[i]/i1[i]
+                R2[i] = V2[i]/i2[i]
+            except ZeroDivisionError:
+                R1[i] = -999999
+                R2[i] = -999999
+                self._invalid += 1
+                print('Error in resistance computation')
+
+    def read_temperature(self):
+        """ Reads the thermistor and returns the temperature in degrees C.
+
+        Returns -999 if the sampler was created without a thermistor.
+
+        """
+        if self.adc_therm is None:
+            return -999
+        n = self.n
+        therm_count = self.therm_count
+        read_therm = self._read_therm
+        self.therm_power.value(1)
+        for i in range(n):
+            therm_count[i] = read_therm()
+        self.therm_power.value(0)
+        self._therm_filled = n
+        return self._therm_temperature()
+
+    def _therm_temperature(self):
+        #temperature from the interquartile mean of the stored thermistor counts
+        length = self._therm_filled
+        therm_count_av = robust.trimmed_mean(self.therm_count, length >> 2, (3*length + 3) >> 2, length)
+        return self.thermistor.temperature(therm_count_av)
+
+    def measure(self):
+        """ Measures resistance, current and temperature.
+
+        Returns
+        -------
+        result : array.array
+            Array of floats with the average resistance (ohms), the average
+            current (A) and the temperature (degrees C).  The same array is
+            returned (and overwritten) on every call.
+
+        """
+        n = self.n
+        starttime = time.ticks_us()
+        if self.ranges is not None:
+            self.autorange()
+        self._therm_filled = 0
+        self._invalid = 0
+        self.sample()
+        if self.raw_file is not None:
+            with open(self.raw_file, 'ab') as f:
+                self.write_raw(f)
+        self._compute(0, n)
+        result = self._finish(n)
+        self.measure_time = time.ticks_diff(time.ticks_us(), starttime)
+        return result
+
+    def measure_adaptive(self, target_se, block=None, max_time_us=None):
+        """ Measures in blocks until the standard error of R is small enough.
+
+        Blocks of polarity-switched samples are taken until the standard error
+        of the mean resistance falls to target_se, until another block would
+        exceed max_n samples, or until max_time_us has passed.  Resistance is
+        computed between blocks, so there is a short extra pause there.
+
+        Parameters
+        ----------
+        target_se : float
+            Standard error (ohms) of the mean resistance to stop at.
+        block : int, optional
+            Samples per block.  Default is n.
+        max_time_us : int, optional
+            Time budget in microseconds.  Default is no limit.
+
+        Returns
+        -------
+        result : array.array
+            Array of floats with the average resistance (ohms), the average
+            current (A), the temperature (degrees C), the number of samples
+            used and the standard error of the resistance (ohms).  The same
+            array is returned (and overwritten) on every call.
+
+        """
+        if block is None:
+            block = self.n
+        max_n = self.max_n
+        if block > max_n:
+            raise ValueError('block must not be larger than max_n')
+        R1 = self.R1
+        R2 = self.R2
+        count = 0
+        valid = 0
+        mean = 0
+        m2 = 0
+        se = -999
+        elapsed_time = 0
+        starttime = time.ticks_us()
+        if self.ranges is not None:
+            self.autorange()
+        self._therm_filled = 0
+        self._invalid = 0
+        while count + block <= max_n:
+            self.sample(count, block)
+            elapsed_time += self.elapsed_time
+            self._compute(count, count + block)
+            #running mean and variance of the resistance of each cycle (Welford)
+            for i in range(count, count + block):
+                if R1[i] == -999999:
+                    continue
+                valid += 1
+                r = (R1[i] + R2[i])/2
+                delta = r - mean
+                mean += delta / valid
+                m2 += delta * (r - mean)
+            count += block
+            if valid > 1:
+                se = math.sqrt(m2 / (valid - 1) / valid)
+                if se <= target_se:
+                    break
+            if max_time_us is not None and time.ticks_diff(time.ticks_us(), starttime) >= max_time_us:
+                break
+        self.elapsed_time = elapsed_time
+        self.meas_freq = count/(elapsed_time/1000000)
+        if self.raw_file is not None:
+            with open(self.raw_file, 'ab') as f:
+                self.write_raw(f, count)
+        self.n_used = count
+        self.standard_error = se
+
+        result = self._finish(count)
+        adaptive_result = self.adaptive_result
+        adaptive_result[0] = result[0]
+        adaptive_result[1] = result[1]
+        adaptive_result[2] = result[2]
+        adaptive_result[3] = count
+        adaptive_result[4] = se
+        self.measure_time = time.ticks_diff(time.ticks_us(), starttime)
+        return adaptive_result
+
+    def sweep(self, cycle_times=SWEEP_CYCLE_TIMES, tolerance=0.005, apply=True):
+        """ Measures at several cycle times and picks the shortest accurate one.
+
+        Cycle times are measured from longest to shortest, and the
+        resistance at the longest one is the reference.  The chosen cycle
+        time is the shortest one for which it, and every longer cycle time,
+        gives a resistance within tolerance of the reference.  The cycle
+        times, resistances and achieved frequencies (hz) are kept in the
+        arrays sweep_cycle_times, sweep_R and sweep_freq.
+
+        Parameters
+        ----------
+        cycle_times : sequence of int, optional
+            On and off times (microseconds) to try.
+        tolerance : float, optional
+            Largest relative difference from the reference resistance.
+        apply : bool, optional
+            If True (the default), the sampler keeps the chosen cycle time;
+            otherwise the previous timing is restored.
+
+        Returns
+        -------
+        int
+            The chosen cycle time in microseconds.
+
+        """
+        times = sorted(cycle_times, reverse=True)
+        count = len(times)
+        self.sweep_cycle_times = arr.array('l', times)
+        self.sweep_R = arr.array('f', [0]*count)
+        self.sweep_freq = arr.array('f', [0]*count)
+        old_timing = [self.on1, self.off1, self.on2, self.off2]
+        chosen = times[0]
+        reference = 0
+        agree = True
+        for k in range(count):
+            cycle_time = times[k]
+            [self.on1, self.off1, self.on2, self.off2] = [cycle_time, cycle_time, cycle_time, cycle_time]
+            R = self.measure()[0]
+            self.sweep_R[k] = R
+            self.sweep_freq[k] = self.meas_freq
+            if k == 0:
+                reference = R
+            elif agree and reference > 0 and abs(R - reference) <= tolerance * reference:
+                chosen = cycle_time
+            else:
+                agree = False
+        if apply:
+            [self.on1, self.off1, self.on2, self.off2] = [chosen, chosen, chosen, chosen]
+        else:
+            [self.on1, self.off1, self.on2, self.off2] = old_timing
+        return chosen
+
+    def _finish(self, length):
+        #reduce the first length samples to the results and read the thermistor
+        R1 = self.R1
+        R2 = self.R2
+        i1 = self.i1
+        i2 = self.i2
+        if self.printflag:
+            V1 = self.V1
+            V2 = self.V2
+            for i in range(length):
+                print(f"R1 = {R1[i]:.2f}, R2 = {R2[i]:.2f}, V1 = {V1[i]:.2f}, V2 = {V2[i]:.2f}, i1 = {i1[i]:.2f}, i2 = {i2[i]:.2f}")
+                print(f"adc_count3 = {self.imeas2[i]}, adc_count4 = {self.imeas1[i]}, adc1_1 = {self.p3meas1[i]}, acd1_2 = {self.p4meas1[i]}, adc2_1 = {self.p4meas1[i]}, adc2_2 = {self.p4meas2[i]}")
+
+        #find maximum and minimum counts to see if out of range of ADC
+        maximum, minimum = self._extremes(length)
+        self.maximum = maximum
+        self.minimum = minimum
+        status = 0
+        if maximum >= self.max_count - self.clip_margin or minimum <= self.clip_margin:
+            status |= STATUS_CLIPPED
+
+        #move samples without a valid resistance out of the averaged part of the arrays
+        valid = length
+        if self._invalid:
+            status |= STATUS_INVALID
+            valid = 0
+            for i in range(length):
+                if R1[i] != -999999:
+                    R1[valid] = R1[i]
+                    R2[valid] = R2[i]
+                    i1[valid] = i1[i]
+                    i2[valid] = i2[i]
+                    valid += 1
+
+        result = self.result
+        if valid:
+            #clean data by sampling middle two quartiles (reorders the result arrays in place)
+            lower_index = valid >> 2
+            upper_index = (3*valid + 3) >> 2
+            self.resistance1 = robust.trimmed_mean(R1, lower_index, upper_index, valid)
+            self.resistance2 = robust.trimmed_mean(R2, lower_index, upper_index, valid)
+            self.current1 = robust.trimmed_mean(i1, lower_index, upper_index, valid)
+            self.current2 = robust.trimmed_mean(i2, lower_index, upper_index, valid)
+            result[0] = (self.resistance1 + self.resistance2)/2
+            result[1] = (self.current1 + self.current2)/2
+            if abs(result[0] * result[1]) * self.max_count / self.max_voltage < self.low_count:
+                status |= STATUS_LOW_SIGNAL
+        else:
+            self.resistance1 = self.resistance2 = -999999
+            self.current1 = self.current2 = 0
+            result[0] = -999999
+            result[1] = 0
+        self.status = status
+        if self.interleave_therm and self._therm_filled:
+            result[2] = self._therm_temperature()
+        else:
+            result[2] = self.read_temperature()
+        return result
+
+    def summary(self):
+        """ Returns a one-line text summary of the last measurement. """
+        outputstring = f"R1 = {self.resistance1:.2f}, R2 = {self.resistance2:.2f}, R_av = {self.result[0]:.2f}, "
+        outputstring += f"i1 = {self.current1:.5f}, i2 = {self.current2:.5f}, i_av = {self.result[1]:.5f}, "
+        if self.adc_therm is not None:
+            outputstring += f"T = {self.result[2]:.2f}, "
+        outputstring += f"freq = {self.meas_freq:.1f} hz, max_count = {self.maximum}, min_count = {self.minimum}"
+        if self.ranges is not None:
+            outputstring += f", range = {self.range_index}"
+        if self.status:
+            outputstring += f", status = {self.status}"
+        return outputstring
+
+class MultiCellSampler:
+    """ Measures several conductivity cells in one interleaved burst.
+
+    Each cell is an ECSampler without a thermistor.  In every excitation
+    cycle the cells are excited one after another in normal polarity, then
+    one after another in switched polarity, so each cell's off-period is
+    spent exciting the others.  The sampler only sleeps for the part of
+    cycle_time that the other cells did not fill.  The thermistor is read
+    once per measurement and its temperature reported for every cell.
+
+    Parameters
+    ----------
+    cells : sequence of dict
+        Keyword arguments of ECSampler for each cell, for example its pins
+        and con_resistance.  cycle_time and the ADC settings given here are
+        used unless a cell overrides them; therm_pin is always None.  All
+        cells take n samples per burst, so a cell may not set n (ValueError).
+    n, cycle_time, therm_resistance, max_count, max_voltage, attenuation_code : optional
+        As for ECSampler.
+    therm_power_pin, therm_pin : int or None, optional
+        Power pin and ADC pin of the shared thermistor.
+    supply_voltage, therm_coefficients : optional
+        As for ECSampler.
+
+    """
+
+    def __init__(self, cells, n=12, cycle_time=100, therm_resistance=9880,
+                 max_count=8191, max_voltage=2.730, attenuation_code=ADC.ATTN_11DB,
+                 therm_power_pin=13, therm_pin=5, supply_voltage=3.3,
+                 therm_coefficients=(thermistor.A, thermistor.B, thermistor.C)):
+        self.n = n
+        self.cells = []
+        for cell in cells:
+            if 'n' in cell:
+                raise ValueError('cells share the n of the MultiCellSampler')
+            kwargs = dict(cycle_time=cycle_time, max_count=max_count,
+                          max_voltage=max_voltage, attenuation_code=attenuation_code)
+            kwargs.update(cell)
+            kwargs['n'] = n
+            kwargs['therm_pin'] = None
+            self.cells.append(ECSampler(**kwargs))
+        self.results = [cell.result for cell in self.cells]
+
+        if therm_pin is None:
+            self.therm_power = None
+            self.adc_therm = None
+            self.thermistor = None
+        else:
+            self.therm_power = Pin(therm_power_pin, Pin.OUT)
+            self.adc_therm = ADC(Pin(therm_pin))
+            self.adc_therm.atten(attenuation_code)
+            self.thermistor = thermistor.Thermistor(therm_resistance, max_voltage,
+                max_count, supply_voltage, therm_coefficients)
+        self.therm_count = arr.array('f', [0]*n)
+        self.elapsed_time = 0
+        self.measure_time = 0
+
+    def sample(self):
+        """ Runs one interleaved burst of n cycles on every cell. """
+        n = self.n
+        cells = self.cells
+        number = len(cells)
+        off1 = min([cell.off1 for cell in cells])
+        off2 = min([cell.off2 for cell in cells])
+        sleep_us = time.sleep_us
+        ticks_us = time.ticks_us
+        ticks_diff = time.ticks_diff
+
+        #per-cell bound methods and buffers, looked up once per burst
+        phase1 = [(cell._gpio1_value, cell.on1, cell._read_i1, cell._read_p3, cell._read_p4,
+                   cell.imeas1, cell.p3meas1, cell.p4meas1) for cell in cells]
+        phase2 = [(cell._gpio2_value, cell.on2, cell._read_i2, cell._read_p3, cell._read_p4,
+                   cell.imeas2, cell.p3meas2, cell.p4meas2) for cell in cells]
+
+        starttime = ticks_us()
+        for i in range(n):
+            #normal polarity on every cell in turn
+            t0 = ticks_us()
+            for gpio, on, read_i, read_p3, read_p4, imeas, p3meas, p4meas in phase1:
+                gpio(1)
+                sleep_us(on)
+                imeas[i] = read_i()
+                p3meas[i] = read_p3()
+                p4meas[i] = read_p4()
+                gpio(0)
+            #each cell has been off while the other number - 1 cells were on
+            sleep_us(max(0, off1 - ticks_diff(ticks_us(), t0) * (number - 1) // number))
+
+            #switched polarity on every cell in turn
+            t0 = ticks_us()
+            for gpio, on, read_i, read_p3, read_p4, imeas, p3meas, p4meas in phase2:
+                gpio(1)
+                sleep_us(on)
+                imeas[i] = read_i()
+                p3meas[i] = read_p3()
+                p4meas[i] = read_p4()
+                gpio(0)
+            sleep_us(max(0, off2 - ticks_diff(ticks_us(), t0) * (number - 1) // number))
+
+        elapsed_time = ticks_diff(ticks_us(), starttime)
+        self.elapsed_time = elapsed_time
+        for cell in cells:
+            cell.elapsed_time = elapsed_time
+            cell.meas_freq = n/(elapsed_time/1000000)
+
+    def read_temperature(self):
+        """ Reads the shared thermistor and returns the temperature in degrees C (-999 if there is none). """
+        if self.adc_therm is None:
+            return -999
+        n = self.n
+        therm_count = self.therm_count
+        read_therm = self.adc_therm.read
+        self.therm_power.value(1)
+        for i in range(n):
+            therm_count[i] = read_therm()
+        self.therm_power.value(0)
+        therm_count_av = robust.trimmed_mean(therm_count, n >> 2, (3*n + 3) >> 2, n)
+        return self.thermistor.temperature(therm_count_av)
+
+    def measure(self):
+        """ Measures every cell and the thermistor.
+
+        Returns
+        -------
+        results : list of array.array
+            The result array of each cell's ECSampler: average resistance
+            (ohms), average current (A) and temperature (degrees C).  The
+            same list and arrays are returned (and overwritten) on every call.
+
+        """
+        n = self.n
+        starttime = time.ticks_us()
+        for cell in self.cells:
+            if cell.ranges is not None:
+                cell.autorange()
+            cell._invalid = 0
+        self.sample()
+        T = self.read_temperature()
+        for cell in self.cells:
+            if cell.raw_file is not None:
+                with open(cell.raw_file, 'ab') as f:
+                    cell.write_raw(f)
+            cell._compute(0, n)
+            cell._finish(n)[2] = T
+        self.measure_time = time.ticks_diff(time.ticks_us(), starttime)
+        return self.results
+
+    def summary(self):
+        """ Returns the summary of every cell, one line per cell. """
+        lines = [f"cell {k}: " + cell.summary() for k, cell in enumerate(self.cells)]
+        if self.adc_therm is not None:
+            lines.append(f"T = {self.results[0][2]:.2f}")
+        return '\n'.join(lines)
+
+_sampler = None
+
+def read_ec():
+    """ Reads the conductivity cell and thermistor with the default pin layout.
+
+    The sampler is created on the first call and reused afterwards.
+
+    Returns
+    -------
+    list
+        Average resistance (ohms), average current (A) and temperature (degrees C).
+
+    """
+    global _sampler
+    if _sampler is None:
+        _sampler = ECSampler()
+    result = _sampler.measure()
+    print(_sampler.summary())
+    return([result[0], result[1], result[2]])
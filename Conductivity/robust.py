@@ -0,0 +1,235 @@
+""" Micropython library of robust statistics computed in place.
+
+The functions reorder the first ``length`` elements of a list or an
+``array.array`` (for example ``array('f')`` or ``array('l')``) by quickselect
+instead of sorting a copy, so no new list is allocated.  The order of the
+elements is changed; copy the data first if the sample order is still needed.
+
+Example
+-------
+>>> from array import array
+>>> import robust
+>>> a = array('f', [5, 1, 4, 2, 3, 100, 0, 6])
+>>> robust.median(a)
+3.5
+>>> robust.iqr_mean(a)
+3.5
+
+RunningMedian keeps the median of the last ``n`` values of a stream, with
+preallocated storage:
+
+>>> filt = robust.RunningMedian(9)
+>>> for x in readings:
+...     m = filt.update(x)
+
+"""
+
+from array import array
+
+#ranges of this many elements or fewer are finished by insertion sort
+_SMALL = 10
+
+def _insertion_sort(a, lo, hi):
+    #sorts a[lo:hi] in place
+    for i in range(lo + 1, hi):
+        value = a[i]
+        j = i - 1
+        while j >= lo and a[j] > value:
+            a[j + 1] = a[j]
+            j -= 1
+        a[j + 1] = value
+
+def select(a, k, lo=0, hi=None):
+    """ Moves the k-th smallest element of a[lo:hi] to index k, in place.
+
+    After the call every element of a[lo:k] is less than or equal to a[k] and
+    every element of a[k+1:hi] is greater than or equal to it.
+
+    Parameters
+    ----------
+    a : list or array.array
+        Data to partially order.
+    k : int
+        Index (lo <= k < hi) of the element to select.
+    lo, hi : int, optional
+        Range of a to work on.  Default is the whole of a.
+
+    Returns
+    -------
+    The value of a[k].
+
+    """
+    if hi is None:
+        hi = len(a)
+    hi -= 1
+    while hi - lo >= _SMALL:
+        #median of three pivot, which also leaves sentinels at a[lo] and a[hi]
+        mid = (lo + hi) >> 1
+        if a[mid] < a[lo]:
+            a[lo], a[mid] = a[mid], a[lo]
+        if a[hi] < a[lo]:
+            a[lo], a[hi] = a[hi], a[lo]
+        if a[hi] < a[mid]:
+            a[mid], a[hi] = a[hi], a[mid]
+        pivot = a[mid]
+
+        #Hoare partition
+        i = lo
+        j = hi
+        while i <= j:
+            while a[i] < pivot:
+                i += 1
+            while pivot < a[j]:
+                j -= 1
+            if i <= j:
+                a[i], a[j] = a[j], a[i]
+                i += 1
+                j -= 1
+        if k <= j:
+            hi = j
+        elif k >= i:
+            lo = i
+        else:
+            return a[k]
+    _insertion_sort(a, lo, hi + 1)
+    return a[k]
+
+def trimmed_mean(a, lower_index, upper_index, length=None):
+    """ Mean of the elements that would be sorted(a)[lower_index:upper_index].
+
+    Parameters
+    ----------
+    a : list or array.array
+        Data, reordered in place.
+    lower_index, upper_index : int
+        Ranks of the first and one past the last element to average.
+    length : int, optional
+        Number of elements of a to use.  Default is len(a).
+
+    Returns
+    -------
+    float
+        The trimmed mean.
+
+    """
+    if length is None:
+        length = len(a)
+    select(a, lower_index, 0, length)
+    select(a, upper_index - 1, lower_index, length)
+    total = 0
+    for i in range(lower_index, upper_index):
+        total += a[i]
+    return total / (upper_index - lower_index)
+
+def iqr_mean(a, length=None):
+    """ Mean of the middle two quartiles of a, reordering a in place.
+
+    Uses the same ranks as ``sorted(a)[floor(n/4):ceil(3*n/4)]``.
+
+    """
+    if length is None:
+        length = len(a)
+    return trimmed_mean(a, length >> 2, (3 * length + 3) >> 2, length)
+
+def median(a, length=None):
+    """ Median of a, reordering a in place.
+
+    For an even number of elements the mean of the two middle elements is
+    returned.
+
+    """
+    if length is None:
+        length = len(a)
+    k = length >> 1
+    upper = select(a, k, 0, length)
+    if length & 1:
+        return upper
+    #the lower middle element is the largest element left of k
+    lower = a[0]
+    for i in range(1, k):
+        if a[i] > lower:
+            lower = a[i]
+    return (lower + upper) / 2
+
+class RunningMedian:
+    """ Median of the last n values of a stream, without allocation per value.
+
+    The window is kept twice in preallocated arrays: in arrival order (a
+    ring buffer) and sorted.  Each update removes the oldest value from the
+    sorted copy and inserts the new one in a single pass that shifts only
+    the elements between the two positions, which is O(n) in the worst case
+    and usually much less for slowly changing signals.
+
+    Parameters
+    ----------
+    n : int
+        Window length.
+    typecode : str, optional
+        array typecode of the stored values.  Default is 'f'.
+
+    Attributes
+    ----------
+    count : int
+        Number of values in the window (less than n until it has filled).
+
+    """
+
+    def __init__(self, n, typecode='f'):
+        self.n = n
+        self._ring = array(typecode, [0] * n)
+        self._sorted = array(typecode, [0] * n)
+        self.reset()
+
+    def reset(self):
+        """ Empties the window. """
+        self.count = 0
+        self._next = 0
+
+    def update(self, x):
+        """ Adds x to the window, dropping the oldest value once it is full, and returns the median. """
+        ring = self._ring
+        s = self._sorted
+        if self.count < self.n:
+            #filling: insertion sort step into s[0:count+1]
+            i = self.count
+            while i > 0 and s[i - 1] > x:
+                s[i] = s[i - 1]
+                i -= 1
+            s[i] = x
+            self.count += 1
+        else:
+            old = ring[self._next]
+            #binary search for a position holding the old value
+            lo = 0
+            hi = self.n - 1
+            while lo < hi:
+                mid = (lo + hi) >> 1
+                if s[mid] < old:
+                    lo = mid + 1
+                else:
+                    hi = mid
+            i = lo
+            #slide the hole at i to where x belongs
+            if x > old:
+                while i + 1 < self.n and s[i + 1] < x:
+                    s[i] = s[i + 1]
+                    i += 1
+            else:
+                while i > 0 and s[i - 1] > x:
+                    s[i] = s[i - 1]
+                    i -= 1
+            s[i] = x
+        ring[self._next] = x
+        self._next += 1
+        if self._next == self.n:
+            self._next = 0
+        return self.median()
+
+    def median(self):
+        """ Median of the values in the window (mean of the middle two for an even count). """
+        count = self.count
+        if count & 1:
+            return self._sorted[count >> 1]
+        if count == 0:
+            raise ValueError('RunningMedian is empty')
+        return (self._sorted[(count >> 1) - 1] + self._sorted[count >> 1]) / 2
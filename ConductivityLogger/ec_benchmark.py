@@ -0,0 +1,385 @@
+""" Host-side benchmark of ec_function.ECSampler against the original read_ec.
+
+Runs on CPython with the fake ADC from fake_machine, so it measures the
+processing overhead of a measurement (the excitation sleeps return
+immediately) and the heap used per call.  Run from this folder with
+
+    python ec_benchmark.py
+
+The original read_ec, which builds its pins, ADCs and buffers on every call,
+is reproduced below as legacy_read_ec (without the final print) for comparison.
+run_adaptive() shows the number of samples taken by measure_adaptive() for
+cells of increasing noise.  run_timing() turns on real sleeps and a simulated
+ADC conversion time and compares the duration of a measurement, and the
+regularity of the excitation cycles, with the thermistor read after the burst
+and interleaved into the off-periods.  run_autorange() compares a fixed ADC
+range with auto-ranging over cells from high to low conductivity, and
+run_multicell() compares separate and interleaved measurement of several cells
+and checks that a cell cannot set its own n.
+run_sweep() shows the frequency sweep on a cell that needs time to settle.
+run_raw() checks that AnalysisCode/Conductivity/ec_raw.py, reprocessing the
+raw bursts, gives the logger's results, including bursts where the current
+ADC reads 0 for some samples (needs numpy).
+
+"""
+
+import fake_machine
+import array as arr
+import math
+import random
+import time
+import tracemalloc
+from machine import Pin, ADC
+import ec_function
+
+#full-scale voltage of the fake ADC at each attenuation (the values in ec_function.RANGES)
+FULL_SCALE = {ADC.ATTN_11DB: 2.730, ADC.ATTN_6DB: 1.300, ADC.ATTN_2_5DB: 1.050, ADC.ATTN_0DB: 0.750}
+
+class FakeCell:
+    """ Simulates the ADC counts of a four-electrode cell on the fake board.
+
+    The cell is driven from supply_voltage through a series resistor at each
+    end, and the resistance between each outer and inner electrode is
+    outer_resistance.  Counts follow the attenuation set on each fake ADC and
+    are clipped to 0..max_count.
+
+    Parameters
+    ----------
+    resistance : float
+        Resistance (ohms) between the inner electrodes.
+    noise : float
+        Standard deviation of the ADC noise, in counts.
+    series : sequence of tuple
+        (gpio1_pin, gpio2_pin, series resistance) of each pair of drive pins.
+    settle_us : float
+        Time constant (us) with which the voltage across the inner electrodes
+        rises after a drive pin goes high, to mimic cell and cable
+        capacitance.  Default is 0 (no settling).
+    """
+
+    def __init__(self, resistance=500, outer_resistance=100, supply_voltage=3.3,
+                 noise=8, therm_count=4000, max_count=8191,
+                 series=((11, 12, 272),), p3_pin=10, p4_pin=9, i1_pin=6,
+                 i2_pin=8, therm_pin=5, settle_us=0, seed=1):
+        rng = random.Random(seed)
+        self._noise = [int(round(rng.gauss(0, noise))) for i in range(1024)]
+        self._k = 0
+        self.resistance = resistance
+        self.outer_resistance = outer_resistance
+        self.supply_voltage = supply_voltage
+        self.max_count = max_count
+        self.series = series
+        self.settle_us = settle_us
+        self.therm_count = therm_count
+        fake_machine.set_adc_source(p3_pin, lambda adc: self._electrode(adc, 3))
+        fake_machine.set_adc_source(p4_pin, lambda adc: self._electrode(adc, 4))
+        fake_machine.set_adc_source(i1_pin, lambda adc: self._electrode(adc, 1))
+        fake_machine.set_adc_source(i2_pin, lambda adc: self._electrode(adc, 2))
+        fake_machine.set_adc_source(therm_pin, lambda adc: self._count(self.therm_count))
+
+    def _count(self, value):
+        self._k = (self._k + 1) & 1023
+        count = int(value) + self._noise[self._k]
+        return min(max(count, 0), self.max_count)
+
+    def _electrode(self, adc, electrode):
+        #voltage at an electrode for whichever drive pin is high
+        for pin1, pin2, rs in self.series:
+            if fake_machine.pin_value(pin1):
+                polarity = 1
+                pin = pin1
+                break
+            if fake_machine.pin_value(pin2):
+                polarity = 2
+                pin = pin2
+                break
+        else:
+            return self._count(0)
+        i = self.supply_voltage / (2*rs + 2*self.outer_resistance + self.resistance)
+        #in each polarity the current ADC (i1 or i2) is on the low side of the
+        #cell and the inner electrode readings differ by i * resistance
+        low, near_low, near_high = (1, 4, 3) if polarity == 1 else (2, 3, 4)
+        if electrode == low:
+            v = i * rs
+        elif electrode == near_low:
+            v = i * (rs + self.outer_resistance)
+        elif electrode == near_high:
+            settled = 1
+            if self.settle_us:
+                settled = 1 - math.exp(-fake_machine.pin_age_us(pin) / self.settle_us)
+            v = i * (rs + self.outer_resistance + self.resistance * settled)
+        else:
+            v = self.supply_voltage - i * rs
+        return self._count(v / FULL_SCALE[adc.attenuation] * self.max_count)
+
+def legacy_read_ec():
+    n = 12
+    cycle_time = 100
+    [on1,off1,on2,off2] = [cycle_time,cycle_time,cycle_time,cycle_time]
+    con_resistance = 272
+    therm_resistance = 9880
+    max_count = 8191
+    max_voltage = 2.730
+    gpio1 = Pin(11, Pin.OUT)
+    adc1 = ADC(Pin(10))
+    adc2 = ADC(Pin(9))
+    gpio2 = Pin(12, Pin.OUT)
+    therm_power = Pin(13, Pin.OUT)
+    adc3_current = ADC(Pin(8))
+    adc4_current = ADC(Pin(6))
+    adc_therm = ADC(Pin(5))
+    adc1.atten(ADC.ATTN_11DB)
+    adc2.atten(ADC.ATTN_11DB)
+    adc3_current.atten(ADC.ATTN_11DB)
+    adc4_current.atten(ADC.ATTN_11DB)
+    adc_therm.atten(ADC.ATTN_11DB)
+    imeas1 = arr.array('l',[0]*n)
+    imeas2 = arr.array('l',[0]*n)
+    p3meas1 = arr.array('l',[0]*n)
+    p3meas2 = arr.array('l',[0]*n)
+    p4meas1 = arr.array('l',[0]*n)
+    p4meas2 = arr.array('l',[0]*n)
+    starttime = time.ticks_us()
+    for i in range(n):
+        gpio1.value(1)
+        time.sleep_us(on1)
+        imeas1[i] = adc4_current.read()
+        p3meas1[i] = adc1.read()
+        p4meas1[i] = adc2.read()
+        gpio1.value(0)
+        time.sleep_us(off1)
+        gpio2.value(1)
+        time.sleep_us(on2)
+        imeas2[i] = adc3_current.read()
+        p3meas2[i] = adc1.read()
+        p4meas2[i] = adc2.read()
+        gpio2.value(0)
+        time.sleep_us(off2)
+    endtime = time.ticks_us()
+    elapsed_time = endtime - starttime
+    meas_freq = n/(elapsed_time/1000000)
+    i1 = arr.array('f',[0]*n)
+    i2 = arr.array('f',[0]*n)
+    V1 = arr.array('f',[0]*n)
+    V2 = arr.array('f',[0]*n)
+    R1 = arr.array('f',[0]*n)
+    R2 = arr.array('f',[0]*n)
+    for i in range(n):
+        try:
+            i1[i] = imeas1[i] / max_count * max_voltage / con_resistance
+            i2[i] = imeas2[i] / max_count * max_voltage / con_resistance
+            V1[i] = (p3meas1[i] - p4meas1[i])/max_count * max_voltage
+            V2[i] = (p4meas2[i] - p3meas2[i])/max_count * max_voltage
+            R1[i] = V1[i]/i1[i]
+            R2[i] = V2[i]/i2[i]
+        except:
+            R1[i] = -999999
+            R2[i] = -999999
+    upper_index = math.ceil(3*n/4)
+    lower_index = math.floor(n/4)
+    sampled_length = (upper_index - lower_index)
+    resistance1 = sum(sorted(R1)[lower_index:upper_index])/sampled_length
+    resistance2 = sum(sorted(R2)[lower_index:upper_index])/sampled_length
+    resistance_average = (resistance1+resistance2)/2
+    current1 = sum(sorted(i1)[lower_index:upper_index])/sampled_length
+    current2 = sum(sorted(i2)[lower_index:upper_index])/sampled_length
+    current_average = (current1+current2)/2
+    A = 0.001125308852122
+    B = 0.000234711863267
+    C = 0.000000085663516
+    therm_count = arr.array('f',[0]*n)
+    therm_power.value(1)
+    for i in range(n):
+        therm_count[i] = adc_therm.read()
+    therm_power.value(0)
+    therm_count_av = sum(sorted(therm_count)[lower_index:upper_index])/sampled_length
+    therm_voltage = therm_count_av / max_count * max_voltage
+    therm_i = therm_voltage / therm_resistance
+    R_t = (3.3 - therm_voltage)/therm_i
+    T = 1/((A+B*(math.log(R_t)))+C*((math.log(R_t))**3))-273.15
+    arrays_of_counts = [imeas1, imeas2, p3meas1, p3meas2, p4meas1, p4meas2]
+    oldmax = 0
+    oldmin = max_count
+    for array in arrays_of_counts:
+        maximum = max(max(array),oldmax)
+        minimum = min(min(array),oldmin)
+        oldmax = maximum
+        oldmin = minimum
+    return([resistance_average,current_average,T])
+
+def time_per_call(func, calls):
+    """ Returns the mean wall time of func() in microseconds. """
+    func()
+    start = time.perf_counter()
+    for i in range(calls):
+        func()
+    return (time.perf_counter() - start) / calls * 1000000
+
+def bytes_per_call(func, calls=20):
+    """ Returns the peak heap growth during one call and the heap retained per call, in bytes. """
+    func()
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    tracemalloc.reset_peak()
+    func()
+    peak = tracemalloc.get_traced_memory()[1] - base
+    for i in range(calls):
+        func()
+    retained = (tracemalloc.get_traced_memory()[0] - base) / (calls + 1)
+    tracemalloc.stop()
+    return peak, retained
+
+def run(calls=2000):
+    cell = FakeCell()
+    sampler = ec_function.ECSampler()
+    legacy = legacy_read_ec()
+    new = sampler.measure()
+    print(f"legacy R_av = {legacy[0]:.2f}, i_av = {legacy[1]:.5f}, T = {legacy[2]:.2f}")
+    print(f"sampler R_av = {new[0]:.2f}, i_av = {new[1]:.5f}, T = {new[2]:.2f}")
+    print(f"{'':>16}{'us/measurement':>16}{'peak bytes':>12}{'retained':>10}")
+    for name, func in (('legacy read_ec', legacy_read_ec), ('ECSampler', sampler.measure)):
+        us = time_per_call(func, calls)
+        peak, retained = bytes_per_call(func)
+        print(f"{name:>16}{us:16.1f}{peak:12d}{retained:10.1f}")
+
+def run_adaptive(target_se=0.5, max_n=96):
+    """ Shows how many samples measure_adaptive() takes as the cell gets noisier. """
+    print(f"{'noise (counts)':>16}{'n used':>8}{'SE (ohm)':>10}{'R_av':>10}")
+    for noise in (1, 8, 40, 150):
+        cell = FakeCell(noise=noise)
+        sampler = ec_function.ECSampler(max_n=max_n)
+        result = sampler.measure_adaptive(target_se)
+        print(f"{noise:16d}{int(result[3]):8d}{result[4]:10.3f}{result[0]:10.2f}")
+
+def cycle_stats(sampler, n):
+    """ Mean and standard deviation (us) of the excitation cycle period of the last burst. """
+    ticks = sampler.cycle_ticks
+    periods = [ticks[i + 1] - ticks[i] for i in range(n - 1)]
+    mean = sum(periods) / len(periods)
+    std = math.sqrt(sum((p - mean)**2 for p in periods) / len(periods))
+    return mean, std
+
+def run_timing(repeat=20):
+    """ Compares sequential and interleaved thermistor reads with simulated real timing. """
+    fake_machine.real_sleep = True
+    try:
+        cell = FakeCell()
+        print(f"{'thermistor':>12}{'measure us':>12}{'burst us':>10}{'cycle us':>10}{'cycle sd':>10}{'T':>8}")
+        for name, interleave in (('sequential', False), ('interleaved', True)):
+            sampler = ec_function.ECSampler(interleave_therm=interleave)
+            total = burst = 0
+            for i in range(repeat):
+                result = sampler.measure()
+                total += sampler.measure_time
+                burst += sampler.elapsed_time
+            mean, std = cycle_stats(sampler, sampler.n)
+            print(f"{name:>12}{total / repeat:12.0f}{burst / repeat:10.0f}{mean:10.1f}{std:10.1f}{result[2]:8.2f}")
+    finally:
+        fake_machine.real_sleep = False
+
+def run_autorange():
+    """ Compares a fixed range with auto-ranging for cells from high to low conductivity.
+
+    The auto-ranging sampler has a second pair of drive pins (14 and 15)
+    through 2200 ohm series resistors, tried when the 272 ohm pair clips.
+    """
+    ranges = ((ADC.ATTN_11DB, 2.730, 2200, 14, 15),) + ec_function.RANGES
+    print(f"{'R (ohm)':>10}{'fixed R_av':>12}{'status':>8}{'auto R_av':>12}{'status':>8}{'range':>7}")
+    for resistance in (5, 50, 500, 2000, 10000):
+        cell = FakeCell(resistance, series=((11, 12, 272), (14, 15, 2200)))
+        fixed = ec_function.ECSampler()
+        auto = ec_function.ECSampler(ranges=ranges)
+        R_fixed = fixed.measure()[0]
+        R_auto = auto.measure()[0]
+        print(f"{resistance:10d}{R_fixed:12.2f}{fixed.status:8d}{R_auto:12.2f}{auto.status:8d}{auto.range_index:7d}")
+
+#pins of extra cells used by run_multicell
+CELL_PINS = (dict(gpio1_pin=11, gpio2_pin=12, p3_pin=10, p4_pin=9, i1_pin=6, i2_pin=8),
+             dict(gpio1_pin=14, gpio2_pin=15, p3_pin=16, p4_pin=17, i1_pin=18, i2_pin=21),
+             dict(gpio1_pin=33, gpio2_pin=34, p3_pin=1, p4_pin=2, i1_pin=3, i2_pin=4))
+
+def run_multicell(repeat=10):
+    """ Compares measuring 1 to 3 cells one at a time with one MultiCellSampler burst. """
+    fake_machine.real_sleep = True
+    try:
+        fakes = [FakeCell((500, 800, 1100)[k], series=((pins['gpio1_pin'], pins['gpio2_pin'], 272),),
+                          p3_pin=pins['p3_pin'], p4_pin=pins['p4_pin'], i1_pin=pins['i1_pin'],
+                          i2_pin=pins['i2_pin'], seed=k + 1) for k, pins in enumerate(CELL_PINS)]
+        print(f"{'cells':>6}{'separate us':>13}{'multi us':>10}{'R_av of each cell (multi)':>30}")
+        for number in (1, 2, 3):
+            separate = [ec_function.ECSampler(**pins) for pins in CELL_PINS[:number]]
+            multi = ec_function.MultiCellSampler(CELL_PINS[:number])
+            t_separate = t_multi = 0
+            for i in range(repeat):
+                for sampler in separate:
+                    sampler.measure()
+                    t_separate += sampler.measure_time
+                results = multi.measure()
+                t_multi += multi.measure_time
+            R = ', '.join([f"{r[0]:.1f}" for r in results])
+            print(f"{number:6d}{t_separate / repeat:13.0f}{t_multi / repeat:10.0f}{R:>30}")
+    finally:
+        fake_machine.real_sleep = False
+
+    #every cell takes the sampler's n; a cell with its own n is refused rather than overrunning its arrays
+    multi = ec_function.MultiCellSampler([CELL_PINS[0], dict(CELL_PINS[1], max_n=32)], n=8)
+    assert all(cell.n == 8 for cell in multi.cells)
+    multi.measure()
+    try:
+        ec_function.MultiCellSampler([CELL_PINS[0], dict(CELL_PINS[1], n=16)], n=8)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError('a cell with its own n was accepted')
+
+def run_sweep(settle_us=15):
+    """ Sweeps the cycle time on a cell whose inner-electrode voltage settles with time constant settle_us. """
+    cell = FakeCell(settle_us=settle_us)
+    sampler = ec_function.ECSampler()
+    chosen = sampler.sweep()
+    print(f"{'cycle us':>9}{'freq hz':>10}{'R_av':>10}")
+    for k in range(len(sampler.sweep_R)):
+        print(f"{sampler.sweep_cycle_times[k]:9d}{sampler.sweep_freq[k]:10.0f}{sampler.sweep_R[k]:10.2f}")
+    print(f"chosen cycle time = {chosen} us")
+
+def run_raw(bursts=5):
+    """ Compares the logger's results with ec_raw.reprocess_file on the raw bursts of the same run. """
+    import os
+    import sys
+    import tempfile
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'AnalysisCode', 'Conductivity'))
+    import ec_raw
+    cell = FakeCell()
+    reads = [0]
+    def i1_source(adc):
+        #every third read of the i1 ADC in the last bursts returns 0
+        reads[0] += 1
+        count = cell._electrode(adc, 1)
+        return 0 if broken[0] and reads[0] % 3 == 0 else count
+    broken = [False]
+    fake_machine.set_adc_source(6, i1_source)
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, 'ecraw.bin')
+        sampler = ec_function.ECSampler(raw_file=path)
+        logged = []
+        for k in range(bursts):
+            broken[0] = k >= bursts // 2
+            result = sampler.measure()
+            logged.append((result[0], result[1], sampler.status & ec_function.STATUS_INVALID))
+        host = ec_raw.reprocess_file(path)
+    print(f"{'burst':>6}{'logger R_av':>13}{'host R_av':>11}{'logger i_av':>13}{'host i_av':>11}{'invalid':>9}{'status':>8}")
+    for k in range(bursts):
+        R, i, status = logged[k]
+        print(f"{k:6d}{R:13.2f}{host['R_av'][k]:11.2f}{i:13.6f}{host['i_av'][k]:11.6f}{host['invalid'][k]:9d}{status:8d}")
+        assert abs(R - host['R_av'][k]) <= 1e-4 * abs(R), (k, R, host['R_av'][k])
+        assert abs(i - host['i_av'][k]) <= 1e-4 * abs(i), (k, i, host['i_av'][k])
+        assert bool(host['invalid'][k]) == bool(status), k
+
+if __name__ == '__main__':
+    run()
+    run_adaptive()
+    run_timing()
+    run_autorange()
+    run_multicell()
+    run_sweep()
+    run_raw()
@@ -0,0 +1,179 @@
+""" Host-side stand-ins for the MicroPython ``machine`` module.
+
+Importing this module under CPython registers it as ``machine``, adds the
+MicroPython-only timing functions (sleep_us, ticks_us, ticks_diff, ...) to
+``time`` and registers ``time`` as ``utime``, so that the logger modules in
+this folder can be imported and benchmarked on a PC.  It is not meant to be copied to the board.
+
+Example
+-------
+>>> import fake_machine
+>>> fake_machine.set_adc_source(10, lambda adc: 4000)
+>>> import ec_function
+>>> sampler = ec_function.ECSampler()
+
+"""
+
+import sys
+import time
+
+#if True, sleep_us and sleep_ms busy-wait for the requested time; otherwise they
+#return immediately and advance the ticks clock by the requested time
+real_sleep = False
+#time (us) taken by each ADC read when real_sleep is True; about 40 us on the ESP32-S2
+adc_read_us = 40
+
+_pin_values = {}
+_pin_ticks = {}
+_skipped_us = 0
+_adc_sources = {}
+
+class Pin:
+    IN = 0
+    OUT = 1
+    OPEN_DRAIN = 2
+    OUT_PP = 1
+    PULL_UP = 1
+    PULL_DOWN = 2
+
+    def __init__(self, id, mode=-1, pull=-1, value=None):
+        self.id = id
+        self.mode = mode
+        if value is not None:
+            self.value(value)
+
+    def value(self, v=None):
+        if v is None:
+            return _pin_values.get(self.id, 0)
+        if v != _pin_values.get(self.id, 0):
+            _pin_ticks[self.id] = _ticks_us()
+        _pin_values[self.id] = v
+
+    def on(self):
+        self.value(1)
+
+    def off(self):
+        self.value(0)
+
+class ADC:
+    ATTN_0DB = 0
+    ATTN_2_5DB = 1
+    ATTN_6DB = 2
+    ATTN_11DB = 3
+
+    def __init__(self, pin):
+        self.pin = pin
+        self.attenuation = ADC.ATTN_0DB
+
+    def atten(self, attenuation):
+        self.attenuation = attenuation
+
+    def read(self):
+        if real_sleep:
+            _sleep_us(adc_read_us)
+        source = _adc_sources.get(self.pin.id)
+        if source is None:
+            return 0
+        return source(self)
+
+    def read_u16(self):
+        return self.read() << 3
+
+class I2C:
+    """ I2C bus that forwards transactions to fake devices by address.
+
+    Devices are objects with readfrom_mem(memaddr, nbytes),
+    writeto_mem(memaddr, buf), writeto(buf) and (if used) readfrom(nbytes)
+    methods.  Every transaction is
+    counted in ``transactions`` and every byte on the bus (addresses,
+    register numbers and data) in ``bus_bytes``; bus_us() converts these to
+    the time the bus would be busy at ``freq``.
+    """
+
+    def __init__(self, id=0, scl=None, sda=None, freq=400000):
+        self.devices = {}
+        self.transactions = 0
+        self.bus_bytes = 0
+        self.freq = freq
+
+    def bus_us(self):
+        """ Bus time (us) of all transactions so far: 9 clocks per byte, plus start and stop. """
+        return (self.bus_bytes * 9 + self.transactions * 2) * 1000000 / self.freq
+
+    def add_device(self, address, device):
+        self.devices[address] = device
+
+    def scan(self):
+        return sorted(self.devices)
+
+    def writeto(self, addr, buf, stop=True):
+        self.transactions += 1
+        self.bus_bytes += 1 + len(buf)
+        self.devices[addr].writeto(bytes(buf))
+        return len(buf)
+
+    def readfrom(self, addr, nbytes, stop=True):
+        self.transactions += 1
+        self.bus_bytes += 1 + nbytes
+        return bytes(self.devices[addr].readfrom(nbytes))
+
+    def readfrom_mem(self, addr, memaddr, nbytes):
+        self.transactions += 1
+        self.bus_bytes += 3 + nbytes
+        return bytes(self.devices[addr].readfrom_mem(memaddr, nbytes))
+
+    def readfrom_mem_into(self, addr, memaddr, buf):
+        self.transactions += 1
+        self.bus_bytes += 3 + len(buf)
+        data = self.devices[addr].readfrom_mem(memaddr, len(buf))
+        buf[:] = data
+
+    def writeto_mem(self, addr, memaddr, buf):
+        self.transactions += 1
+        self.bus_bytes += 2 + len(buf)
+        self.devices[addr].writeto_mem(memaddr, bytes(buf))
+
+def pin_value(id):
+    """ Returns the value last written to pin ``id``. """
+    return _pin_values.get(id, 0)
+
+def pin_age_us(id):
+    """ Returns the time (us) since pin ``id`` last changed value. """
+    return _ticks_us() - _pin_ticks.get(id, 0)
+
+def set_adc_source(id, source):
+    """ Makes ADC reads on pin ``id`` return ``source(adc)``. """
+    _adc_sources[id] = source
+
+def _ticks_us():
+    return int(time.perf_counter() * 1000000) + _skipped_us
+
+def _ticks_ms():
+    return _ticks_us() // 1000
+
+def _sleep_us(us):
+    global _skipped_us
+    if real_sleep:
+        end = time.perf_counter() + us / 1000000
+        while time.perf_counter() < end:
+            pass
+    else:
+        _skipped_us += int(us)
+
+def _sleep_ms(ms):
+    _sleep_us(ms * 1000)
+
+def install():
+    """ Registers this module as ``machine`` and ``time`` as ``utime``, and adds MicroPython timing functions to ``time``. """
+    sys.modules.setdefault('machine', sys.modules[__name__])
+    sys.modules.setdefault('utime', time)
+    if not hasattr(time, 'ticks_us'):
+        time.ticks_us = _ticks_us
+        time.ticks_ms = _ticks_ms
+        time.ticks_diff = lambda end, start: end - start
+        time.ticks_add = lambda ticks, delta: ticks + delta
+        time.sleep_us = _sleep_us
+        time.sleep_ms = _sleep_ms
+
+if sys.implementation.name != 'micropython':
+    install()
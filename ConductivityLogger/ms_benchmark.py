@@ -0,0 +1,236 @@
+""" Host-side benchmark of ms_pressure.MS58xx against the ms5839_02 function.
+
+Runs on CPython with the fake I2C bus from fake_machine and a simulated
+MS5839 on it.  Sleeps do not really wait but advance the ticks clock, so the
+time per reading below is what the sensor would take on the logger (sleeps
+plus the host's processing time), and the I2C transactions are counted by
+the fake bus.  run_bus() compares reading several sensors one after another
+with one MS58xxBus reading.  run_integer() checks the integer and numpy
+compensation against each other on random PROMs and conversions and times
+them.  run_burst() samples a simulated wave with PressureBurst and compares
+the statistics with those of the wave.  Run from this folder with
+
+    python ms_benchmark.py
+
+"""
+
+import fake_machine
+import math
+import random
+import time
+import ms_pressure
+from array import array
+from machine import I2C
+
+#typical conversion time (us) for each OSR command offset
+TYPICAL_US = {0x00: 540, 0x02: 1060, 0x04: 2080, 0x06: 4130, 0x08: 8220, 0x0A: 16440}
+
+class FakeMS58xx:
+    """ Simulates an MS58xx pressure sensor on the fake I2C bus.
+
+    Conversions take the typical datasheet time for their oversampling
+    ratio; reading the ADC before a conversion has finished returns zero, as
+    on the real sensor.
+
+    Parameters
+    ----------
+    prom : sequence of int
+        C1 to C6.
+    D1, D2 : int
+        Raw pressure and temperature conversions returned by the sensor.
+    crc_word : int
+        Where the CRC4 is stored (see ms_pressure.crc4).
+
+    Attributes
+    ----------
+    wave : callable or None
+        If set, wave(t) with t in seconds is added to D1 when a pressure
+        conversion starts.
+    """
+
+    def __init__(self, prom=(46372, 43981, 29059, 27842, 31553, 28165),
+                 D1=6465444, D2=8077636, crc_word=0):
+        words = [0] + list(prom) + [0]
+        if crc_word == 0:
+            words[0] = ms_pressure.crc4(words, 0) << 12
+        else:
+            words[7] = ms_pressure.crc4(words, 7)
+        self.words = words
+        self.D1 = D1
+        self.D2 = D2
+        self._ready = 0
+        self._value = 0
+        self.wave = None
+
+    def writeto(self, buf):
+        command = buf[0]
+        if 0x40 <= command <= 0x4A:
+            self._value = self.D1
+            if self.wave is not None:
+                self._value += int(self.wave(time.ticks_us() / 1000000))
+        elif 0x50 <= command <= 0x5A:
+            self._value = self.D2
+        else:
+            return
+        self._ready = time.ticks_add(time.ticks_us(), TYPICAL_US[command & 0x0F])
+
+    def readfrom_mem(self, memaddr, nbytes):
+        if memaddr == 0x00:
+            value = self._value if time.ticks_diff(time.ticks_us(), self._ready) >= 0 else 0
+            return bytes([value >> 16, (value >> 8) & 0xFF, value & 0xFF])
+        word = self.words[(memaddr - 0xA0) >> 1]
+        return bytes([word >> 8, word & 0xFF])
+
+    def writeto_mem(self, memaddr, buf):
+        pass
+
+def per_reading(func, i2c, readings=20):
+    """ Returns the I2C transactions, simulated time (ms) and host processing time (us) per reading. """
+    func()
+    transactions = i2c.transactions
+    start_ticks = time.ticks_us()
+    start = time.perf_counter()
+    for i in range(readings):
+        func()
+    cpu = (time.perf_counter() - start) / readings * 1000000
+    elapsed = time.ticks_diff(time.ticks_us(), start_ticks) / readings / 1000
+    return (i2c.transactions - transactions) / readings, elapsed, cpu
+
+def run():
+    i2c = I2C(1)
+    i2c.add_device(0x76, FakeMS58xx())
+    sensor = ms_pressure.MS58xx(i2c, 'MS5839_02')
+    print("ms5839_02 [T, P] =", ms_pressure.ms5839_02(i2c))
+    print("MS58xx    [T, P] =", sensor.read())
+    print(f"{'':>12}{'I2C/reading':>13}{'ms/reading':>12}{'host us':>10}")
+    for name, func in (('ms5839_02', lambda: ms_pressure.ms5839_02(i2c)), ('MS58xx', sensor.read)):
+        transactions, elapsed, cpu = per_reading(func, i2c)
+        print(f"{name:>12}{transactions:13.0f}{elapsed:12.1f}{cpu:10.1f}")
+
+    #time per reading at each oversampling ratio
+    print(f"{'OSR':>12}{'ms/reading':>25}{'[T, P]':>30}")
+    for osr in sorted(ms_pressure.OSR):
+        sensor = ms_pressure.MS58xx(i2c, 'MS5839_02', osr_pressure=osr, osr_temperature=osr)
+        transactions, elapsed, cpu = per_reading(sensor.read, i2c)
+        T, P = sensor.read()
+        print(f"{osr:12d}{elapsed:25.2f}{T:15.2f}{P:15.2f}")
+
+    #a corrupted PROM word is caught by the CRC check
+    i2c.devices[0x76].words[3] ^= 0x0100
+    try:
+        ms_pressure.MS58xx(i2c, 'MS5839_02')
+        print('CRC check missed a corrupted PROM')
+    except ValueError as e:
+        print('Corrupted PROM:', e)
+
+def run_bus(readings=20):
+    """ Compares reading 1 to 3 sensors one after another with one MS58xxBus reading. """
+    i2c1 = I2C(1)
+    i2c2 = I2C(2)
+    i2c1.add_device(0x76, FakeMS58xx(crc_word=7, D1=4311550))
+    i2c1.add_device(0x77, FakeMS58xx(crc_word=7, D1=4411550))
+    i2c2.add_device(0x76, FakeMS58xx(crc_word=7, D1=4511550))
+    #the address argument of the functions is used now
+    print("ms5803_05 at 0x77 [T, P] =", ms_pressure.ms5803_05(i2c1, 0x77))
+    sensors = [ms_pressure.MS58xx(i2c1, 'MS5803_05', 0x76),
+               ms_pressure.MS58xx(i2c1, 'MS5803_05', 0x77),
+               ms_pressure.MS58xx(i2c2, 'MS5803_05', 0x76)]
+    print(f"{'sensors':>8}{'one by one ms':>15}{'bus ms':>8}  pressures (bus)")
+    for number in (1, 2, 3):
+        bus = ms_pressure.MS58xxBus(sensors[:number])
+        start = time.ticks_us()
+        for i in range(readings):
+            for sensor in sensors[:number]:
+                sensor.read()
+        separate = time.ticks_diff(time.ticks_us(), start) / readings / 1000
+        start = time.ticks_us()
+        for i in range(readings):
+            results = bus.read()
+        together = time.ticks_diff(time.ticks_us(), start) / readings / 1000
+        pressures = ', '.join([f"{r[1]:.2f}" for r in results])
+        print(f"{number:8d}{separate:15.1f}{together:8.1f}  {pressures}")
+
+def run_integer(proms=200, samples=2000, seed=1):
+    """ Fuzzes compensate_int_* against compensate_array and the float functions, then times them. """
+    import numpy as np
+    rng = random.Random(seed)
+    print(f"{'model':>10}{'mismatches':>12}{'max |float-int| T':>20}{'P':>8}")
+    for model in sorted(ms_pressure.MODELS):
+        compensate, compensate_int, np_compensate, crc_word, terms_int = ms_pressure.MODELS[model]
+        mismatches = 0
+        dT_max = dP_max = 0.0
+        for i in range(proms):
+            C = [rng.randrange(1 << 16) for k in range(6)]
+            D1 = [rng.randrange(1 << 24) for k in range(samples // proms)]
+            D2 = [rng.randrange(1 << 24) for k in range(samples // proms)]
+            T, P = ms_pressure.compensate_array(model, C, D1, D2)
+            for k in range(len(D1)):
+                TEMP, PRES = compensate_int(*C, D1[k], D2[k])
+                if TEMP != T[k] or PRES != P[k]:
+                    mismatches += 1
+                #the float versions leave TEMP == 2000 undefined (MS5803)
+                if TEMP != 2000:
+                    fT, fP = compensate(*C, D1[k], D2[k])
+                    dT_max = max(dT_max, abs(fT - TEMP / 100))
+                    dP_max = max(dP_max, abs(fP - PRES / 100))
+        print(f"{model:>10}{mismatches:12d}{dT_max:20.3f}{dP_max:8.3f}")
+
+    #throughput with the PROM of FakeMS58xx
+    C = (46372, 43981, 29059, 27842, 31553, 28165)
+    D1 = [rng.randrange(6000000, 7000000) for k in range(20000)]
+    D2 = [rng.randrange(7000000, 9000000) for k in range(20000)]
+    for name, func in (('float', ms_pressure.compensate_ms5840_02), ('integer', ms_pressure.compensate_int_ms5840_02)):
+        start = time.perf_counter()
+        for k in range(len(D1)):
+            func(*C, D1[k], D2[k])
+        rate = len(D1) / (time.perf_counter() - start)
+        print(f"{name:>10} {rate / 1e6:8.2f} million samples/s")
+    D1 = np.array(D1 * 50, dtype=np.int64)
+    D2 = np.array(D2 * 50, dtype=np.int64)
+    start = time.perf_counter()
+    ms_pressure.compensate_array('MS5840_02', C, D1, D2)
+    rate = len(D1) / (time.perf_counter() - start)
+    print(f"{'numpy':>10} {rate / 1e6:8.2f} million samples/s")
+
+def run_burst(window=16384):
+    """ Samples a 2 s, 0.5 m wave at each OSR and prints PressureBurst's statistics. """
+    i2c = I2C(1)
+    device = FakeMS58xx(crc_word=7, D1=4311550)
+    i2c.add_device(0x76, device)
+    sensor = ms_pressure.MS58xx(i2c, 'MS5803_05')
+    #D1 counts per metre of water
+    P0 = sensor.compensate_int(device.D1, device.D2)[1]
+    P1 = sensor.compensate_int(device.D1 + 10000, device.D2)[1]
+    metre = 10000 / (P1 - P0) * 100 * 1000 * ms_pressure.G / 100
+    amplitude = 0.25
+    period = 2.0
+    device.wave = lambda t: amplitude * metre * math.sin(2 * math.pi * t / period)
+    print(f"wave: Hs = {4 * amplitude / math.sqrt(2):.3f} m, H = {2 * amplitude:.3f} m, T = {period:.2f} s")
+    print(f"{'OSR':>6}{'rate Hz':>9}{'window s':>10}{'mean hPa':>10}{'Hs m':>8}{'Hmax m':>8}{'Tz s':>7}{'waves':>6}")
+    for osr in (256, 1024, 4096):
+        sensor = ms_pressure.MS58xx(i2c, 'MS5803_05', osr_pressure=osr)
+        burst = ms_pressure.PressureBurst(sensor, window)
+        burst.run()
+        [mean, Hs, Hmax, Tz, waves] = burst.statistics()
+        rate = 1000000 / burst.interval_us
+        print(f"{osr:6d}{rate:9.0f}{window / rate:10.1f}{mean:10.2f}{Hs:8.3f}{Hmax:8.3f}{Tz:7.2f}{int(waves):6d}")
+    trace = burst.decimate(256)
+    print('trace decimated by 256:', ', '.join([f"{v:.2f}" for v in trace[:6]]), '...')
+
+    #an empty burst, or a run of no samples, gives zeros rather than dividing by zero
+    import io
+    empty = ms_pressure.PressureBurst(sensor, 16)
+    empty.run(0)
+    line = io.StringIO()
+    empty.write(line)
+    assert line.getvalue() == '0.000,0.0000,0.0000,0.000,0,0.00,0.0\n', line.getvalue()
+    #the run's pressures agree with the full integer compensation
+    device.wave = None
+    empty.run(1)
+    assert empty.buffer[0] == array('f', [sensor.compensate_int(device.D1, device.D2)[1] / 100])[0], empty.buffer[0]
+
+if __name__ == '__main__':
+    run()
+    run_bus()
+    run_integer()
+    run_burst()
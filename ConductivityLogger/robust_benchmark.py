@@ -0,0 +1,118 @@
+""" CPython benchmark of robust.py against the sorted-slice approach.
+
+Compares the interquartile mean and the median computed in place by
+quickselect with ``sum(sorted(a)[lower:upper])`` and ``sorted(a)[n//2]`` for
+sample sizes from 12 to 1024, reporting microseconds per call and the peak
+heap used by one call.  run_running() compares robust.RunningMedian with
+sorting the window again for every new value of a stream.  Run from this
+folder with
+
+    python robust_benchmark.py
+
+"""
+
+import math
+import random
+import time
+import tracemalloc
+from array import array
+import robust
+
+def sorted_iqr_mean(a):
+    n = len(a)
+    upper_index = math.ceil(3*n/4)
+    lower_index = math.floor(n/4)
+    return sum(sorted(a)[lower_index:upper_index])/(upper_index - lower_index)
+
+def sorted_median(a):
+    n = len(a)
+    s = sorted(a)
+    if n & 1:
+        return s[n//2]
+    return (s[n//2 - 1] + s[n//2])/2
+
+def time_per_call(func, data, work, repeat):
+    """ Mean time (us) of func(work) after restoring work from data, minus the restore time. """
+    start = time.perf_counter()
+    for i in range(repeat):
+        work[:] = data
+    restore = time.perf_counter() - start
+    start = time.perf_counter()
+    for i in range(repeat):
+        work[:] = data
+        func(work)
+    return (time.perf_counter() - start - restore) / repeat * 1000000
+
+def peak_bytes(func, data, work):
+    work[:] = data
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    func(work)
+    peak = tracemalloc.get_traced_memory()[1] - base
+    tracemalloc.stop()
+    return peak
+
+def run():
+    rng = random.Random(1)
+    print(f"{'n':>5}{'typecode':>9}{'method':>14}{'sorted us':>11}{'select us':>11}{'sorted B':>10}{'select B':>10}")
+    for n in (12, 16, 32, 64, 128, 256, 512, 1024):
+        repeat = max(20, 20000 // n)
+        for typecode in ('f', 'l'):
+            if typecode == 'f':
+                data = array('f', [rng.gauss(500, 20) for i in range(n)])
+            else:
+                data = array('l', [rng.randint(0, 8191) for i in range(n)])
+            work = array(typecode, data)
+            for name, reference, candidate in (('iqr_mean', sorted_iqr_mean, robust.iqr_mean),
+                                               ('median', sorted_median, robust.median)):
+                work[:] = data
+                expected = reference(work)
+                work[:] = data
+                got = candidate(work)
+                assert abs(got - expected) <= 1e-6 * abs(expected), (name, n, got, expected)
+                t_sorted = time_per_call(reference, data, work, repeat)
+                t_select = time_per_call(candidate, data, work, repeat)
+                b_sorted = peak_bytes(reference, data, work)
+                b_select = peak_bytes(candidate, data, work)
+                print(f"{n:5d}{typecode:>9}{name:>14}{t_sorted:11.1f}{t_select:11.1f}{b_sorted:10d}{b_select:10d}")
+
+def run_running(length=5000):
+    """ Microseconds per streamed value for RunningMedian and for sorting the window each time. """
+    rng = random.Random(2)
+    #slowly drifting pressure with noise, as from a BME280
+    stream = [1000 + 0.001 * i + rng.gauss(0, 0.05) for i in range(length)]
+    print(f"{'window':>7}{'sorted us':>11}{'running us':>12}{'sorted B':>10}{'running B':>11}")
+    for n in (9, 31, 101, 301):
+        def sorted_stream():
+            window = []
+            for x in stream:
+                window.append(x)
+                if len(window) > n:
+                    del window[0]
+                m = sorted_median(window)
+            return m
+        filt = robust.RunningMedian(n)
+        def running_stream():
+            filt.reset()
+            update = filt.update
+            for x in stream:
+                m = update(x)
+            return m
+        assert abs(array('f', [sorted_stream()])[0] - running_stream()) < 1e-3
+        times = []
+        for func in (sorted_stream, running_stream):
+            start = time.perf_counter()
+            func()
+            times.append((time.perf_counter() - start) / length * 1000000)
+        #peak heap while streaming, beyond the filter itself
+        peaks = []
+        for func in (sorted_stream, running_stream):
+            tracemalloc.start()
+            func()
+            peaks.append(tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+        print(f"{n:7d}{times[0]:11.2f}{times[1]:12.2f}{peaks[0]:10d}{peaks[1]:11d}")
+
+if __name__ == '__main__':
+    run()
+    run_running()
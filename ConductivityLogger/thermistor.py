@@ -0,0 +1,154 @@
+""" Micropython library for converting NTC thermistor ADC counts to temperature.
+
+The thermistor is read through a voltage divider: the supply is connected
+through the thermistor to the ADC pin, which is connected to ground through a
+fixed resistor.  A Thermistor object evaluates the Steinhart-Hart equation once
+for every ``step`` ADC counts when it is created, and afterwards converts
+readings by linear interpolation in that table, which avoids evaluating
+``math.log`` on every reading.
+
+Example
+-------
+>>> import thermistor
+>>> therm = thermistor.Thermistor(resistance=9880, max_voltage=2.730, max_count=8191)
+>>> therm.temperature(4000)
+16.62...
+>>> therm.max_error(400, 7900)  #largest error (degrees C) and where it occurs
+(0.0026..., 408)
+
+On a PC with numpy (or a board with ulab), ``therm.convert(counts)`` converts a
+whole array of counts at once.
+
+"""
+
+import math
+from array import array
+
+try:
+    import numpy as np
+except ImportError:
+    try:
+        from ulab import numpy as np
+    except ImportError:
+        np = None
+
+#Steinhart-Hart coefficients of the 10k NTC thermistors used on the loggers
+A = 0.001125308852122
+B = 0.000234711863267
+C = 0.000000085663516
+
+class Thermistor:
+    """ Count to temperature conversion for an NTC thermistor divider.
+
+    Parameters
+    ----------
+    resistance : float, optional
+        Fixed resistor (ohms) in line with the thermistor.
+    max_voltage : float, optional
+        ADC reference: the voltage read as max_count.
+    max_count : int, optional
+        Maximum ADC count.  8191 for the ESP32-S2 in single read mode.
+    supply_voltage : float, optional
+        Voltage across the divider.  Default is 3.3.
+    coefficients : tuple of float, optional
+        Steinhart-Hart coefficients (A, B, C).
+    step : int, optional
+        Spacing of the table in ADC counts.  Smaller steps use more memory
+        and give a smaller interpolation error.  Default is 16.
+
+    """
+
+    def __init__(self, resistance=9880, max_voltage=2.730, max_count=8191,
+                 supply_voltage=3.3, coefficients=(A, B, C), step=16):
+        self.resistance = resistance
+        self.max_voltage = max_voltage
+        self.max_count = max_count
+        self.supply_voltage = supply_voltage
+        self.coefficients = coefficients
+        self.step = step
+        self._inv_step = 1 / step
+
+        #table[k] is the temperature at count k*step; the last entry is at or beyond max_count
+        length = max_count // step + 2
+        self.table = array('f', [0] * length)
+        for k in range(length):
+            self.table[k] = self.steinhart_hart(k * step)
+        self._last = length - 2
+
+    def steinhart_hart(self, count):
+        """ Temperature (degrees C) at an ADC count, from the closed form.
+
+        Returns nan where the divider gives no valid thermistor resistance
+        (for example a count of zero).
+
+        """
+        voltage = count / self.max_count * self.max_voltage
+        try:
+            R_t = (self.supply_voltage - voltage) * self.resistance / voltage
+            log_R_t = math.log(R_t)
+        except (ZeroDivisionError, ValueError):
+            return float('nan')
+        a, b, c = self.coefficients
+        return 1/(a + b*log_R_t + c*log_R_t**3) - 273.15
+
+    def temperature(self, count):
+        """ Temperature (degrees C) at an ADC count, by interpolation in the table.
+
+        count may be an integer or a float (for example an averaged count).
+        Counts below ``step`` return nan, because the first table entry (a
+        count of zero) has no valid temperature.
+
+        """
+        x = count * self._inv_step
+        k = int(x)
+        if k < 0:
+            k = 0
+        elif k > self._last:
+            k = self._last
+        table = self.table
+        return table[k] + (x - k) * (table[k + 1] - table[k])
+
+    def convert(self, counts):
+        """ Converts a whole array of counts to temperature (degrees C).
+
+        Uses numpy (or ulab) when it is available, otherwise returns an
+        array('f') filled by temperature().
+
+        """
+        if np is not None:
+            x = np.arange(len(self.table)) * self.step
+            return np.interp(np.array(counts), x, np.array(self.table))
+        result = array('f', [0] * len(counts))
+        for i in range(len(counts)):
+            result[i] = self.temperature(counts[i])
+        return result
+
+    def max_error(self, lowest=None, highest=None):
+        """ Largest difference between the table and the closed form.
+
+        Every integer count from lowest to highest is checked (by default
+        every count that gives a valid temperature in both table cells).
+
+        Returns
+        -------
+        error : float
+            Maximum absolute error in degrees C.
+        count : int
+            ADC count where it occurs.
+
+        """
+        if lowest is None:
+            lowest = self.step
+        if highest is None:
+            highest = self.max_count
+        error = 0
+        worst = lowest
+        for count in range(lowest, highest + 1):
+            exact = self.steinhart_hart(count)
+            if exact != exact:
+                continue
+            difference = abs(self.temperature(count) - exact)
+            if difference > error:
+                error = difference
+                worst = count
+        return error, worst
@@ -39,6 +39,7 @@ def flash_led(n,lagtime):
 def log(logtime):
     #setup i2c bus
     i2c = I2C(1,scl=Pin(4), sda=Pin(3))
+    pressure_sensor = None
     
     while True:
        
@@ -59,9 +60,13 @@ def log(logtime):
         next_time = time.time() + logtime
 
         #read pressure and temperature
+        #the calibration PROM is read once, when the sensor is first found
         try:
-            [pres, ctemp] = ms_pressure.ms5839_02(i2c)
+            if pressure_sensor is None:
+                pressure_sensor = ms_pressure.MS58xx(i2c, 'MS5839_02')
+            [pres, ctemp] = pressure_sensor.read()
         except:
+            pressure_sensor = None
             [pres, ctemp] = [-999,-999]
             flash_led(2,500)
 
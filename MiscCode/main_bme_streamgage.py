@@ -1,6 +1,7 @@
 import time
 import machine
 import bme280
+import robust
 #import utime
 import usocket
 import network
@@ -46,18 +47,22 @@ counter = 0
     # Loop code goes inside the while statement, this is called repeatedly: #
     ###################################################################
 
-# read median of 10 values from each sensor
-readings1 = [bme1.raw_values for i in range(0, 9)] #loop from i = 1 to i = 9
-temperature1 = [readings1[i][0] for i in range(0,9)]
-pressure1 = [readings1[i][1] for i in range(0,9)]
-humidity1 = [readings1[i][2] for i in range(0,9)]
-data1 = (sorted(temperature1)[4], sorted(pressure1)[4], sorted(humidity1)[4])
-
-readings2 = [bme2.raw_values for i in range(0, 9)] #loop from i = 1 to i = 9
-temperature2 = [readings2[i][0] for i in range(0,9)]
-pressure2 = [readings2[i][1] for i in range(0,9)]
-humidity2 = [readings2[i][2] for i in range(0,9)]
-data2 = (sorted(temperature2)[4], sorted(pressure2)[4], sorted(humidity2)[4])
+# read median of 9 values from each sensor
+n = 9
+#running medians of temperature, pressure and humidity, fed one reading at a time
+filters = [robust.RunningMedian(n) for i in range(3)]
+
+def read_median(bme):
+    for filt in filters:
+        filt.reset()
+    for i in range(n):
+        reading = bme.raw_values
+        for k in range(3):
+            filters[k].update(reading[k])
+    return (filters[0].median(), filters[1].median(), filters[2].median())
+
+data1 = read_median(bme1)
+data2 = read_median(bme2)
 
 #use this to only read a single value
 #data1 = bme1.raw_values
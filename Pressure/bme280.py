@@ -49,7 +49,30 @@ BME280_OSAMPLE_8 = 4
 BME280_OSAMPLE_16 = 5
 
 BME280_REGISTER_CONTROL_HUM = 0xF2
+BME280_REGISTER_STATUS = 0xF3
 BME280_REGISTER_CONTROL = 0xF4
+BME280_REGISTER_CONFIG = 0xF5
+
+# Standby time between conversions in normal mode (BMP280 uses 6 and 7 for
+# 2000 and 4000 ms)
+BME280_STANDBY_0_5 = 0
+BME280_STANDBY_62_5 = 1
+BME280_STANDBY_125 = 2
+BME280_STANDBY_250 = 3
+BME280_STANDBY_500 = 4
+BME280_STANDBY_1000 = 5
+BME280_STANDBY_10 = 6
+BME280_STANDBY_20 = 7
+
+# IIR filter coefficients
+BME280_FILTER_OFF = 0
+BME280_FILTER_2 = 1
+BME280_FILTER_4 = 2
+BME280_FILTER_8 = 3
+BME280_FILTER_16 = 4
+
+# status register bit set while a conversion is running
+BME280_STATUS_MEASURING = 0x08
 
 
 class BME280:
@@ -58,7 +81,21 @@ class BME280:
                  mode=BME280_OSAMPLE_1,
                  address=BME280_I2CADDR,
                  i2c=None,
+                 normal=False,
+                 standby=BME280_STANDBY_0_5,
+                 iir=BME280_FILTER_OFF,
                  **kwargs):
+        """ Args:
+                mode: oversampling (BME280_OSAMPLE_*) of all three values
+                address: I2C address
+                i2c: I2C object
+                normal: if True, run the sensor in normal mode, converting
+                    continuously; reads then fetch the latest conversion
+                    without waiting. Otherwise every read forces a conversion
+                standby: standby time between conversions in normal mode
+                    (BME280_STANDBY_*)
+                iir: IIR filter coefficient (BME280_FILTER_*)
+        """
         # Check that mode is valid.
         if mode not in [BME280_OSAMPLE_1, BME280_OSAMPLE_2, BME280_OSAMPLE_4,
                         BME280_OSAMPLE_8, BME280_OSAMPLE_16]:
@@ -66,7 +103,12 @@ class BME280:
                 'Unexpected mode value {0}. Set mode to one of '
                 'BME280_ULTRALOWPOWER, BME280_STANDARD, BME280_HIGHRES, or '
                 'BME280_ULTRAHIGHRES'.format(mode))
+        if standby not in range(8):
+            raise ValueError('Unexpected standby value {0}.'.format(standby))
+        if iir not in range(5):
+            raise ValueError('Unexpected iir value {0}.'.format(iir))
         self._mode = mode
+        self._normal = normal
         self.address = address
         if i2c is None:
             raise ValueError('An I2C object is required.')
@@ -89,17 +131,59 @@ class BME280:
 
         self.dig_H6 = unpack_from("<b", dig_e1_e7, 6)[0]
 
-        self.i2c.writeto_mem(self.address, BME280_REGISTER_CONTROL,
-                             bytearray([0x3F]))
         self.t_fine = 0
 
         # temporary data holders which stay allocated
         self._l1_barray = bytearray(1)
         self._l8_barray = bytearray(8)
         self._l3_resultarray = array("i", [0, 0, 0])
+        self._l3_compensated = array("i", [0, 0, 0])
+
+        # the config register is only written reliably in sleep mode
+        self._write_register(BME280_REGISTER_CONTROL, 0)
+        self._write_register(BME280_REGISTER_CONFIG, standby << 5 | iir << 2)
+        self._write_register(BME280_REGISTER_CONTROL_HUM, mode)
+        if normal:
+            self._write_register(BME280_REGISTER_CONTROL,
+                                 mode << 5 | mode << 2 | 3)
+
+        # typical and maximum conversion times (us), datasheet section 9.1
+        osr = 1 << (mode - 1)
+        self._typical_us = 1000 + 3 * 2000 * osr + 1000
+        self._max_us = 1250 + 3 * 2300 * osr + 1150
+
+    def _write_register(self, register, value):
+        self._l1_barray[0] = value
+        self.i2c.writeto_mem(self.address, register, self._l1_barray)
+
+    def measuring(self):
+        """ Returns True while the sensor is converting. """
+        self.i2c.readfrom_mem_into(self.address, BME280_REGISTER_STATUS,
+                                   self._l1_barray)
+        return bool(self._l1_barray[0] & BME280_STATUS_MEASURING)
+
+    def wait_ready(self, timeout_us=None):
+        """ Polls the status register until a conversion has finished.
+            Args:
+                timeout_us: give up after this long; default is the maximum
+                conversion time
+            Returns:
+                True if the conversion finished, False on timeout
+        """
+        if timeout_us is None:
+            timeout_us = self._max_us
+        start = time.ticks_us()
+        while self.measuring():
+            if time.ticks_diff(time.ticks_us(), start) > timeout_us:
+                return False
+            time.sleep_us(100)
+        return True
 
     def read_raw_data(self, result):
         """ Reads the raw (uncompensated) data from the sensor.
+
+            In normal mode this is the latest conversion and the call does not
+            wait; otherwise a conversion is forced first.
             Args:
                 result: array of length 3 or alike where the result will be
                 stored, in temperature, pressure, humidity order
@@ -107,17 +191,13 @@ class BME280:
                 None
         """
 
-        self._l1_barray[0] = self._mode
-        self.i2c.writeto_mem(self.address, BME280_REGISTER_CONTROL_HUM,
-                             self._l1_barray)
-        self._l1_barray[0] = self._mode << 5 | self._mode << 2 | 1
-        self.i2c.writeto_mem(self.address, BME280_REGISTER_CONTROL,
-                             self._l1_barray)
-
-        sleep_time = 1250 + 2300 * (1 << self._mode)
-        sleep_time = sleep_time + 2300 * (1 << self._mode) + 575
-        sleep_time = sleep_time + 2300 * (1 << self._mode) + 575
-        time.sleep_us(sleep_time)  # Wait the required time
+        if not self._normal:
+            # force one conversion, sleep through most of it and poll the
+            # status register for the rest
+            self._write_register(BME280_REGISTER_CONTROL,
+                                 self._mode << 5 | self._mode << 2 | 1)
+            time.sleep_us(self._typical_us - 1000)
+            self.wait_ready(self._max_us - self._typical_us + 1000)
 
         # burst readout from 0xF7 to 0xFE, recommended by datasheet
         self.i2c.readfrom_mem_into(self.address, 0xF7, self._l8_barray)
@@ -133,12 +213,14 @@ class BME280:
         result[1] = raw_press
         result[2] = raw_hum
 
-    def read_compensated_data(self, result=None):
+    def read_compensated_data(self, result=None, humidity=True):
         """ Reads the data from the sensor and returns the compensated data.
             Args:
                 result: array of length 3 or alike where the result will be
                 stored, in temperature, pressure, humidity order. You may use
                 this to read out the sensor without allocating heap memory
+                humidity: if False, skip the humidity compensation (for
+                BMP280 parts, which have no humidity sensor) and return 0
             Returns:
                 array with temperature, pressure, humidity. Will be the one from
                 the result parameter if not None
@@ -146,7 +228,7 @@ class BME280:
         self.read_raw_data(self._l3_resultarray)
         raw_temp, raw_press, raw_hum = self._l3_resultarray
         # temperature
-        var1 = ((raw_temp >> 3) - (self.dig_T1 << 1)) * (self.dig_T2 >> 11)
+        var1 = (((raw_temp >> 3) - (self.dig_T1 << 1)) * self.dig_T2) >> 11
         var2 = (((((raw_temp >> 4) - self.dig_T1) *
                   ((raw_temp >> 4) - self.dig_T1)) >> 12) * self.dig_T3) >> 14
         self.t_fine = var1 + var2
@@ -169,7 +251,20 @@ class BME280:
             var2 = (self.dig_P8 * p) >> 19
             pressure = ((p + var1 + var2) >> 8) + (self.dig_P7 << 4)
 
-        # humidity
+        if humidity:
+            hum = self._compensate_humidity(raw_hum)
+        else:
+            hum = 0
+
+        if result:
+            result[0] = temp
+            result[1] = pressure
+            result[2] = hum
+            return result
+
+        return array("i", (temp, pressure, hum))
+
+    def _compensate_humidity(self, raw_hum):
         h = self.t_fine - 76800
         h = (((((raw_hum << 14) - (self.dig_H4 << 20) -
                 (self.dig_H5 * h)) + 16384)
@@ -179,15 +274,24 @@ class BME280:
         h = h - (((((h >> 15) * (h >> 15)) >> 7) * self.dig_H1) >> 4)
         h = 0 if h < 0 else h
         h = 419430400 if h > 419430400 else h
-        humidity = h >> 12
+        return h >> 12
 
-        if result:
-            result[0] = temp
-            result[1] = pressure
-            result[2] = humidity
-            return result
-
-        return array("i", (temp, pressure, humidity))
+    def read_into(self, buf, humidity=True):
+        """ Reads the sensor into a float array without building new objects.
+            Args:
+                buf: array('f') or alike of length 3 where temperature (C),
+                pressure (hPa) and relative humidity (%) will be stored
+                humidity: if False, skip the humidity compensation and leave
+                buf[2] unchanged
+            Returns:
+                buf
+        """
+        result = self.read_compensated_data(self._l3_compensated, humidity)
+        buf[0] = result[0] / 100
+        buf[1] = result[1] / 25600
+        if humidity:
+            buf[2] = result[2] / 1024
+        return buf
 
     @property
     def values(self):
@@ -0,0 +1,160 @@
+""" Water depth from water and barometric pressure, on the logger or a PC.
+
+Depth below the water surface is the difference between the pressure
+measured under water and the atmospheric pressure, divided by the weight of
+a metre of water, which depends on the water temperature::
+
+    depth (m) = (P_water - P_air) (hPa) * 100 / (density(T) * g)
+
+depth() works on single readings (as read by bme280 or ms_pressure) and, on a
+PC with numpy, on whole arrays.  When the barometer is a different sensor
+logged at its own times (another logger, or a weather station some distance
+away), compensate() first interpolates the barometric series to the times of
+the water readings.
+
+Example
+-------
+>>> import depth
+>>> [T, P] = ms_pressure.ms5839_02(i2c)
+>>> depth.depth(P, bme.raw_values[1], T)
+
+On a PC, with times in seconds (or numpy datetime64):
+
+>>> d = depth.compensate(t_water, P_water, t_air, P_air, T_water, max_gap=1800)
+
+"""
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+#standard gravity (m/s2)
+G = 9.80665
+#density (kg/m3) used when no water temperature is given
+DENSITY = 1000.0
+
+def water_density(temperature):
+    """ Density of air-free pure water (kg/m3) at temperature (degrees C), 0 to 40 C.
+
+    Uses the formula of Tanaka et al. (2001, Metrologia 38, 301).  Works on
+    numbers and numpy arrays.
+
+    """
+    t = temperature
+    return 999.974950 * (1 - (t - 3.983035) * (t - 3.983035) * (t + 301.797) / (522528.9 * (t + 69.34881)))
+
+def depth(water_pressure, air_pressure, temperature=None, density=None):
+    """ Depth (m) of water above a pressure sensor.
+
+    Parameters
+    ----------
+    water_pressure, air_pressure : float or numpy.ndarray
+        Pressure (hPa) under water and of the atmosphere.
+    temperature : float or numpy.ndarray, optional
+        Water temperature (degrees C), used to find the density of water.
+    density : float, optional
+        Density (kg/m3), for example of salt water.  Overrides temperature.
+        If neither is given DENSITY is used.
+
+    Returns
+    -------
+    float or numpy.ndarray
+
+    """
+    if density is None:
+        density = DENSITY if temperature is None else water_density(temperature)
+    return (water_pressure - air_pressure) * 100 / (density * G)
+
+def _seconds(t):
+    #numpy datetime64 to float seconds; anything else is returned as is
+    if np is not None and isinstance(t, np.ndarray) and t.dtype.kind == 'M':
+        return t.astype('datetime64[us]').astype(np.int64) / 1e6
+    return t
+
+def interpolate(times, ref_times, ref_values, max_gap=None):
+    """ Linearly interpolates a series to other times.
+
+    Parameters
+    ----------
+    times : sequence of float
+        Times (s) to interpolate to, in increasing order on the logger.
+    ref_times, ref_values : sequence of float
+        The series to interpolate, with ref_times increasing.
+    max_gap : float, optional
+        Times with no reference reading within max_gap before and after them
+        (including times outside the reference series) give nan, unless they
+        coincide with a reference reading.  Default is no limit, with values
+        held beyond the ends.
+
+    Returns
+    -------
+    numpy.ndarray if numpy is available, otherwise a list.
+
+    """
+    if np is not None:
+        times = np.asarray(_seconds(np.asarray(times)), dtype=np.float64)
+        ref_times = np.asarray(_seconds(np.asarray(ref_times)), dtype=np.float64)
+        values = np.interp(times, ref_times, np.asarray(ref_values, dtype=np.float64))
+        if max_gap is not None:
+            right = np.searchsorted(ref_times, times)
+            left = np.clip(right - 1, 0, len(ref_times) - 1)
+            right = np.clip(right, 0, len(ref_times) - 1)
+            exact = ref_times[right] == times
+            gap = np.maximum(times - ref_times[left], ref_times[right] - times)
+            values[(~exact & (gap > max_gap)) | (times < ref_times[0]) | (times > ref_times[-1])] = np.nan
+        return values
+
+    #walk both series once, as both are in time order
+    nan = float('nan')
+    last = len(ref_times) - 1
+    result = []
+    j = 0
+    for t in times:
+        while j < last and ref_times[j + 1] <= t:
+            j += 1
+        if t <= ref_times[0] or j == last:
+            k = 0 if t <= ref_times[0] else last
+            outside = t != ref_times[k]
+            value = ref_values[k]
+        else:
+            t0 = ref_times[j]
+            t1 = ref_times[j + 1]
+            outside = False
+            if max_gap is not None and t != t0 and (t - t0 > max_gap or t1 - t > max_gap):
+                outside = True
+            value = ref_values[j] + (ref_values[j + 1] - ref_values[j]) * (t - t0) / (t1 - t0)
+        result.append(nan if outside and max_gap is not None else value)
+    return result
+
+def compensate(water_times, water_pressure, air_times, air_pressure, temperature=None,
+               density=None, max_gap=None):
+    """ Depth series from water pressure and a barometer logged at other times.
+
+    Parameters
+    ----------
+    water_times, water_pressure : sequence of float
+        Times (s, or datetime64 on a PC) and pressures (hPa) of the water
+        pressure sensor.
+    air_times, air_pressure : sequence of float
+        Times and pressures (hPa) of the barometer, in time order.
+    temperature : sequence of float or float, optional
+        Water temperature (degrees C) at water_times.
+    density : float, optional
+        Passed to depth().
+    max_gap : float, optional
+        Passed to interpolate(); depths where the barometer has no reading
+        within max_gap seconds are nan.
+
+    Returns
+    -------
+    numpy.ndarray if numpy is available, otherwise a list.
+
+    """
+    air = interpolate(water_times, air_times, air_pressure, max_gap)
+    if np is not None:
+        T = None if temperature is None else np.asarray(temperature, dtype=np.float64)
+        return depth(np.asarray(water_pressure, dtype=np.float64), air, T, density)
+    if temperature is None or isinstance(temperature, (int, float)):
+        return [depth(water_pressure[i], air[i], temperature, density) for i in range(len(air))]
+    return [depth(water_pressure[i], air[i], temperature[i], density) for i in range(len(air))]
@@ -2,7 +2,8 @@
 
 Code modified from code originally developed for raspberry pi at the `control
 everything community <https://github.com/ControlEverythingCommunity/MS5803-05BA/blob/master/Python/MS5803_05BA.py>`_.
-Uses the maximum oversamping ratio of 4096.
+Uses the oversamping ratio of 4096 by default; MS58xx objects can use any
+ratio from 256 to 8192 (see OSR).
 
 Example
 -------
@@ -13,11 +14,67 @@ Example
 >>> ground_pin = Pin(2, Pin.OUT_PP)
 >>> [pres, ctemp] = pressure.ms5840_02(i2c, VDD_pin, ground_pin)
 
+The functions above reset the sensor and read its calibration PROM on every
+call.  For repeated readings, an MS58xx object reads and checks the PROM once
+and afterwards only runs the pressure and temperature conversions:
+
+>>> sensor = ms_pressure.MS58xx(i2c, 'MS5839_02')
+>>> [ctemp, pres] = sensor.read()
+
+Sensors at different addresses on one bus can convert at the same time.  An
+MS58xxBus starts the pressure conversion on every sensor, waits once, reads
+them all, and then does the same for temperature:
+
+>>> bus = ms_pressure.MS58xxBus([ms_pressure.MS58xx(i2c, 'MS5803_05', 0x76),
+...                              ms_pressure.MS58xx(i2c, 'MS5803_05', 0x77)])
+>>> [[ctemp1, pres1], [ctemp2, pres2]] = bus.read()
+
+Lower oversampling ratios give noisier readings in less time:
+
+>>> fast = ms_pressure.MS58xx(i2c, 'MS5839_02', osr_pressure=1024, osr_temperature=256)
+
+MS58xx objects compensate with the integer arithmetic of the datasheets
+(compensate_int_* functions).  ``sensor.read_int()`` returns temperature and
+pressure in hundredths of degrees C and hPa without using floats.  On a PC
+with numpy, ``compensate_array(model, prom, D1, D2)`` does the same
+arithmetic on whole arrays of raw conversions, with identical results.
+
+For waves and surge, a PressureBurst samples one sensor as fast as its
+pressure OSR allows into a ring buffer and reduces the window to a few
+statistics (mean level, significant and maximum wave height, zero-crossing
+period), optionally with a decimated trace:
+
+>>> burst = ms_pressure.PressureBurst(ms_pressure.MS58xx(i2c, 'MS5803_05', osr_pressure=256), 2048)
+>>> burst.run()
+>>> [mean, Hs, Hmax, Tz, waves] = burst.statistics()
+
 """
 
 import time
-
-def read_uncompensated(i2c,address,VDD_pin,ground_pin):
+import math
+from array import array
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+#water density (kg/m3) and gravity (m/s2) for wave heights from pressure
+WATER_DENSITY = 1000.0
+G = 9.80665
+
+#oversampling ratio: (offset added to the D1 0x40 and D2 0x50 commands,
+#maximum conversion time in microseconds from the datasheets)
+OSR = {
+    256: (0x00, 600),
+    512: (0x02, 1170),
+    1024: (0x04, 2280),
+    2048: (0x06, 4540),
+    4096: (0x08, 9040),
+    8192: (0x0A, 18080),  #MS5837, MS5839 and MS5840 only
+    }
+
+def read_uncompensated(i2c,address,VDD_pin,ground_pin,osr=4096):
     #turn on power and turn off ground if necessary
     if not(VDD_pin is None):
         VDD_pin.value(1)
@@ -25,57 +82,60 @@ def read_uncompensated(i2c,address,VDD_pin,ground_pin):
     if not(ground_pin is None):
         ground_pin.value(0)
             
+    #conversion commands and wait for the oversampling ratio
+    [osr_offset, wait_us] = OSR[osr]
+
     reset_command = bytearray([0x1E])
-    i2c.writeto(0x76, reset_command)
-    time.sleep(0.1)
+    i2c.writeto(address, reset_command)
+    time.sleep_ms(3)  #reset takes 2.8 ms
 
     # Read 12 bytes of calibration data
     # Read pressure sensitivity
     data = bytearray(2)
-    data = i2c.readfrom_mem(0x76, 0xA2, 2)
+    data = i2c.readfrom_mem(address, 0xA2, 2)
     C1 = data[0] * 256 + data[1]
 
     # Read pressure offset
-    data = i2c.readfrom_mem(0x76, 0xA4, 2)
+    data = i2c.readfrom_mem(address, 0xA4, 2)
     C2 = data[0] * 256 + data[1]
 
     # Read temperature coefficient of pressure sensitivity
-    data = i2c.readfrom_mem(0x76, 0xA6, 2)
+    data = i2c.readfrom_mem(address, 0xA6, 2)
     C3 = data[0] * 256 + data[1]
 
     # Read temperature coefficient of pressure offset
-    data = i2c.readfrom_mem(0x76, 0xA8, 2)
+    data = i2c.readfrom_mem(address, 0xA8, 2)
     C4 = data[0] * 256 + data[1]
 
     # Read reference temperature
-    data = i2c.readfrom_mem(0x76, 0xAA, 2)
+    data = i2c.readfrom_mem(address, 0xAA, 2)
     C5 = data[0] * 256 + data[1]
 
     # Read temperature coefficient of the temperature
-    data = i2c.readfrom_mem(0x76, 0xAC, 2)
+    data = i2c.readfrom_mem(address, 0xAC, 2)
     C6 = data[0] * 256 + data[1]
 
-    pressure_command = bytearray([0x48])
-    i2c.writeto(0x76, pressure_command)
-    time.sleep(0.1)
+    pressure_command = bytearray([0x40 + osr_offset])
+    i2c.writeto(address, pressure_command)
+    time.sleep_us(wait_us)
 
     # Read digital pressure value
     # Read data back from 0x00(0), 3 bytes
     # D1 MSB2, D1 MSB1, D1 LSB
     value = bytearray(3)
-    value = i2c.readfrom_mem(0x76, 0x00, 3)
+    value = i2c.readfrom_mem(address, 0x00, 3)
     D1 = value[0] * 65536 + value[1] * 256 + value[2]
 
-    #0x50(64)    Temperature conversion(OSR = 256) command
-    temperature_command = bytearray([0x58])
-    i2c.writeto(0x76, temperature_command)
-    time.sleep(0.1)
+    #0x50 + osr_offset    Temperature conversion command
+    temperature_command = bytearray([0x50 + osr_offset])
+    i2c.writeto(address, temperature_command)
+    time.sleep_us(wait_us)
 
     # Read digital temperature value
     # Read data back from 0x00(0), 3 bytes
     # D2 MSB2, D2 MSB1, D2 LSB
 
-    value = i2c.readfrom_mem(0x76, 0x00, 3)
+    value = i2c.readfrom_mem(address, 0x00, 3)
     D2 = value[0] * 65536 + value[1] * 256 + value[2]
 
     return[C1,C2,C3,C4,C5,C6,D1,D2]
@@ -103,29 +163,7 @@ def ms5803_02(i2c, address = 0x76, VDD_pin=None, ground_pin=None):
     """
     
     [C1,C2,C3,C4,C5,C6,D1,D2] = read_uncompensated(i2c, address, VDD_pin, ground_pin)
-
-    dT = D2 - C5 * 2**8
-    TEMP = 2000 + dT * C6 / 2**23
-    OFF = C2 * 2**17 + (C4 * dT) / 2**6
-    SENS = C1 * 2**16 + (C3 * dT ) / 2**7
-    
-    if TEMP > 2000 :
-        T2 = 0
-        OFF2 = 0
-        SENS2 = 0
-    elif TEMP < 2000 :
-        T2 = (dT * dT) / 2**31
-        OFF2 = 61 * ((TEMP - 2000) * (TEMP - 2000)) / 2**4
-        SENS2 = 2 * ((TEMP - 2000) * (TEMP - 2000)) 
-        if TEMP < -1500 :
-            OFF2 = OFF2 + 20 * (TEMP + 1500) * (TEMP + 1500)
-            SENS2 = SENS2 + 12 * ((TEMP + 1500) * (TEMP +1500))
-
-    TEMP = TEMP - T2
-    OFF = OFF - OFF2
-    SENS = SENS - SENS2
-    pressure = ((((D1 * SENS) / 2**21) - OFF) / 2**15) / 100.0
-    cTemp = TEMP / 100.0
+    [cTemp, pressure] = compensate_ms5803_02(C1,C2,C3,C4,C5,C6,D1,D2)
     
     if not(VDD_pin is None):
         VDD_pin.value(0)
@@ -155,35 +193,14 @@ def ms5803_05(i2c, address = 0x76, VDD_pin=None, ground_pin=None):
     """
     
     [C1,C2,C3,C4,C5,C6,D1,D2] = read_uncompensated(i2c, address, VDD_pin, ground_pin)
-
-    dT = D2 - C5 * 2**8
-    TEMP = 2000 + dT * C6 / 2**23
-    OFF = C2 * 2**18 + (C4 * dT) / 2**5
-    SENS = C1 * 2**17 + (C3 * dT ) / 2**7
-
-    if TEMP > 2000 :
-        T2 = 0
-        OFF2 = 0
-        SENS2 = 0
-    elif TEMP < 2000 :
-        T2 = 3 * (dT * dT) / 2**33
-        OFF2 = 3 * ((TEMP - 2000) * (TEMP - 2000)) / 2**3
-        SENS2 = 7 * ((TEMP - 2000) * (TEMP - 2000)) / 2**3
-        if TEMP < -1500 :
-            SENS2 = SENS2 + 3 * ((TEMP + 1500) * (TEMP +1500))
-
-    TEMP = TEMP - T2
-    OFF = OFF - OFF2
-    SENS = SENS - SENS2
-    pressure = ((((D1 * SENS) / 2**21) - OFF) / 2**15) / 100.0
-    cTemp = TEMP / 100.0
+    [cTemp, pressure] = compensate_ms5803_05(C1,C2,C3,C4,C5,C6,D1,D2)
     
     if not(VDD_pin is None):
         VDD_pin.value(0)
         
     return([cTemp, pressure])
 
-def ms5840_02(i2c, VDD_pin=None, ground_pin=None):
+def ms5840_02(i2c, VDD_pin=None, ground_pin=None, address=0x76):
     """ Reads pressure and temperature from an MS5840_02 sensor.
     
     Parameters
@@ -194,6 +211,8 @@ def ms5840_02(i2c, VDD_pin=None, ground_pin=None):
 		Pin object representing the pin used to power the device 
 	ground_pin : :obj:'machine.PIN', optional
 		Pin object representing the pin used to ground the device
+	address : int, optional
+        I2C address of the sensor.  Default is 118 (0x76).
     Returns
     -------
     pressure : float
@@ -203,9 +222,90 @@ def ms5840_02(i2c, VDD_pin=None, ground_pin=None):
 
     """
     #import time
-    address = 0x76
     [C1,C2,C3,C4,C5,C6,D1,D2] = read_uncompensated(i2c,address,VDD_pin,ground_pin)
+    [cTemp, pressure] = compensate_ms5840_02(C1,C2,C3,C4,C5,C6,D1,D2)
+
+    if not(VDD_pin is None):
+        VDD_pin.value(0)
+        
+    return([cTemp, pressure])
+
+def ms5839_02(i2c, VDD_pin=None, ground_pin=None, address=0x76):
+    """ Reads pressure and temperature from an MS5839_02 sensor (same as MS5840_02).
+    
+    Parameters
+    ----------
+	i2c : :obj:'machine.I2C'
+		An I2C bus object
+	VDD_pin : :obj:'machine.PIN', optional
+		Pin object representing the pin used to power the device 
+	ground_pin : :obj:'machine.PIN', optional
+		Pin object representing the pin used to ground the device
+	address : int, optional
+        I2C address of the sensor.  Default is 118 (0x76).
+    Returns
+    -------
+    pressure : float
+        Pressure in hPa.
+    temperature : float
+        Temperature in degrees C.
 
+    """
+    return ms5840_02(i2c, VDD_pin, ground_pin, address)
+
+def compensate_ms5803_02(C1,C2,C3,C4,C5,C6,D1,D2):
+    """ Converts MS5803_02 calibration words and raw conversions to [temperature, pressure]. """
+    dT = D2 - C5 * 2**8
+    TEMP = 2000 + dT * C6 / 2**23
+    OFF = C2 * 2**17 + (C4 * dT) / 2**6
+    SENS = C1 * 2**16 + (C3 * dT ) / 2**7
+    
+    if TEMP > 2000 :
+        T2 = 0
+        OFF2 = 0
+        SENS2 = 0
+    elif TEMP < 2000 :
+        T2 = (dT * dT) / 2**31
+        OFF2 = 61 * ((TEMP - 2000) * (TEMP - 2000)) / 2**4
+        SENS2 = 2 * ((TEMP - 2000) * (TEMP - 2000)) 
+        if TEMP < -1500 :
+            OFF2 = OFF2 + 20 * (TEMP + 1500) * (TEMP + 1500)
+            SENS2 = SENS2 + 12 * ((TEMP + 1500) * (TEMP +1500))
+
+    TEMP = TEMP - T2
+    OFF = OFF - OFF2
+    SENS = SENS - SENS2
+    pressure = ((((D1 * SENS) / 2**21) - OFF) / 2**15) / 100.0
+    cTemp = TEMP / 100.0
+    return([cTemp, pressure])
+
+def compensate_ms5803_05(C1,C2,C3,C4,C5,C6,D1,D2):
+    """ Converts MS5803_05 calibration words and raw conversions to [temperature, pressure]. """
+    dT = D2 - C5 * 2**8
+    TEMP = 2000 + dT * C6 / 2**23
+    OFF = C2 * 2**18 + (C4 * dT) / 2**5
+    SENS = C1 * 2**17 + (C3 * dT ) / 2**7
+
+    if TEMP > 2000 :
+        T2 = 0
+        OFF2 = 0
+        SENS2 = 0
+    elif TEMP < 2000 :
+        T2 = 3 * (dT * dT) / 2**33
+        OFF2 = 3 * ((TEMP - 2000) * (TEMP - 2000)) / 2**3
+        SENS2 = 7 * ((TEMP - 2000) * (TEMP - 2000)) / 2**3
+        if TEMP < -1500 :
+            SENS2 = SENS2 + 3 * ((TEMP + 1500) * (TEMP +1500))
+
+    TEMP = TEMP - T2
+    OFF = OFF - OFF2
+    SENS = SENS - SENS2
+    pressure = ((((D1 * SENS) / 2**21) - OFF) / 2**15) / 100.0
+    cTemp = TEMP / 100.0
+    return([cTemp, pressure])
+
+def compensate_ms5840_02(C1,C2,C3,C4,C5,C6,D1,D2):
+    """ Converts MS5840_02 (or MS5839_02) calibration words and raw conversions to [temperature, pressure]. """
     dT = D2 - C5 * 2**8
     TEMP = 2000 + dT * C6 / 2**23 
     OFF = C2 * 2**17 + (C4 * dT) / 2**6  #MS5840
@@ -234,30 +334,644 @@ def ms5840_02(i2c, VDD_pin=None, ground_pin=None):
 
     pressure = P2
     cTemp = TEMP2
-
-    if not(VDD_pin is None):
-        VDD_pin.value(0)
-        
     return([cTemp, pressure])
 
-def ms5839_02(i2c, VDD_pin=None, ground_pin=None):
-    """ Reads pressure and temperature from an MS5839_02 sensor (same as MS5840_02).
-    
+def _div(x, shift):
+    #x / 2**shift truncated toward zero, as integer division in the datasheet C code
+    if x >= 0:
+        return x >> shift
+    return -(-x >> shift)
+
+def pressure_int(D1, OFF, SENS):
+    """ Integer pressure (0.01 hPa) from D1 and the OFF and SENS terms of a terms_int function. """
+    return _div(_div(D1 * SENS, 21) - OFF, 15)
+
+def terms_int_ms5803_02(C1,C2,C3,C4,C5,C6,D2):
+    """ Integer MS5803_02 temperature (0.01 C) and the OFF and SENS terms of the pressure, [TEMP, OFF, SENS]. """
+    dT = D2 - (C5 << 8)
+    TEMP = 2000 + _div(dT * C6, 23)
+    OFF = (C2 << 17) + _div(C4 * dT, 6)
+    SENS = (C1 << 16) + _div(C3 * dT, 7)
+    if TEMP < 2000:
+        T2 = (dT * dT) >> 31
+        OFF2 = (61 * (TEMP - 2000) * (TEMP - 2000)) >> 4
+        SENS2 = 2 * (TEMP - 2000) * (TEMP - 2000)
+        if TEMP < -1500:
+            OFF2 += 20 * (TEMP + 1500) * (TEMP + 1500)
+            SENS2 += 12 * (TEMP + 1500) * (TEMP + 1500)
+        TEMP -= T2
+        OFF -= OFF2
+        SENS -= SENS2
+    return [TEMP, OFF, SENS]
+
+def compensate_int_ms5803_02(C1,C2,C3,C4,C5,C6,D1,D2):
+    """ Integer MS5803_02 compensation; returns [temperature (0.01 C), pressure (0.01 hPa)]. """
+    [TEMP, OFF, SENS] = terms_int_ms5803_02(C1,C2,C3,C4,C5,C6,D2)
+    return [TEMP, pressure_int(D1, OFF, SENS)]
+
+def terms_int_ms5803_05(C1,C2,C3,C4,C5,C6,D2):
+    """ Integer MS5803_05 temperature (0.01 C) and the OFF and SENS terms of the pressure, [TEMP, OFF, SENS]. """
+    dT = D2 - (C5 << 8)
+    TEMP = 2000 + _div(dT * C6, 23)
+    OFF = (C2 << 18) + _div(C4 * dT, 5)
+    SENS = (C1 << 17) + _div(C3 * dT, 7)
+    if TEMP < 2000:
+        T2 = (3 * dT * dT) >> 33
+        OFF2 = (3 * (TEMP - 2000) * (TEMP - 2000)) >> 3
+        SENS2 = (7 * (TEMP - 2000) * (TEMP - 2000)) >> 3
+        if TEMP < -1500:
+            SENS2 += 3 * (TEMP + 1500) * (TEMP + 1500)
+        TEMP -= T2
+        OFF -= OFF2
+        SENS -= SENS2
+    return [TEMP, OFF, SENS]
+
+def compensate_int_ms5803_05(C1,C2,C3,C4,C5,C6,D1,D2):
+    """ Integer MS5803_05 compensation; returns [temperature (0.01 C), pressure (0.01 hPa)]. """
+    [TEMP, OFF, SENS] = terms_int_ms5803_05(C1,C2,C3,C4,C5,C6,D2)
+    return [TEMP, pressure_int(D1, OFF, SENS)]
+
+def terms_int_ms5840_02(C1,C2,C3,C4,C5,C6,D2):
+    """ Integer MS5840_02 (or MS5839_02) temperature (0.01 C) and the OFF and SENS terms of the pressure, [TEMP, OFF, SENS]. """
+    dT = D2 - (C5 << 8)
+    TEMP = 2000 + _div(dT * C6, 23)
+    OFF = (C2 << 17) + _div(C4 * dT, 6)
+    SENS = (C1 << 16) + _div(C3 * dT, 7)
+    if TEMP <= 2000:
+        square = (TEMP - 2000) * (TEMP - 2000)
+        if TEMP > 1000:
+            TEMP -= (12 * dT * dT) >> 35
+            OFF -= (30 * square) >> 8
+        else:
+            TEMP -= (14 * dT * dT) >> 35
+            OFF -= (35 * square) >> 3
+            SENS -= (63 * square) >> 5
+    return [TEMP, OFF, SENS]
+
+def compensate_int_ms5840_02(C1,C2,C3,C4,C5,C6,D1,D2):
+    """ Integer MS5840_02 (or MS5839_02) compensation; returns [temperature (0.01 C), pressure (0.01 hPa)]. """
+    [TEMP, OFF, SENS] = terms_int_ms5840_02(C1,C2,C3,C4,C5,C6,D2)
+    return [TEMP, pressure_int(D1, OFF, SENS)]
+
+def _np_div(x, shift):
+    #numpy version of _div
+    return np.where(x >= 0, x >> shift, -((-x) >> shift))
+
+def _np_ms5803_02(C1,C2,C3,C4,C5,C6,D1,D2):
+    dT = D2 - (C5 << 8)
+    TEMP = 2000 + _np_div(dT * C6, 23)
+    OFF = (C2 << 17) + _np_div(C4 * dT, 6)
+    SENS = (C1 << 16) + _np_div(C3 * dT, 7)
+    low = TEMP < 2000
+    square = (TEMP - 2000) * (TEMP - 2000)
+    cold = np.where(TEMP < -1500, (TEMP + 1500) * (TEMP + 1500), 0)
+    TEMP = np.where(low, TEMP - ((dT * dT) >> 31), TEMP)
+    OFF = np.where(low, OFF - ((61 * square) >> 4) - 20 * cold, OFF)
+    SENS = np.where(low, SENS - 2 * square - 12 * cold, SENS)
+    return TEMP, _np_div(_np_div(D1 * SENS, 21) - OFF, 15)
+
+def _np_ms5803_05(C1,C2,C3,C4,C5,C6,D1,D2):
+    dT = D2 - (C5 << 8)
+    TEMP = 2000 + _np_div(dT * C6, 23)
+    OFF = (C2 << 18) + _np_div(C4 * dT, 5)
+    SENS = (C1 << 17) + _np_div(C3 * dT, 7)
+    low = TEMP < 2000
+    square = (TEMP - 2000) * (TEMP - 2000)
+    SENS2 = ((7 * square) >> 3) + np.where(TEMP < -1500, 3 * (TEMP + 1500) * (TEMP + 1500), 0)
+    TEMP = np.where(low, TEMP - ((3 * dT * dT) >> 33), TEMP)
+    OFF = np.where(low, OFF - ((3 * square) >> 3), OFF)
+    SENS = np.where(low, SENS - SENS2, SENS)
+    return TEMP, _np_div(_np_div(D1 * SENS, 21) - OFF, 15)
+
+def _np_ms5840_02(C1,C2,C3,C4,C5,C6,D1,D2):
+    dT = D2 - (C5 << 8)
+    TEMP = 2000 + _np_div(dT * C6, 23)
+    OFF = (C2 << 17) + _np_div(C4 * dT, 6)
+    SENS = (C1 << 16) + _np_div(C3 * dT, 7)
+    square = (TEMP - 2000) * (TEMP - 2000)
+    middle = (TEMP <= 2000) & (TEMP > 1000)
+    cold = TEMP <= 1000
+    OFF = OFF - np.where(middle, (30 * square) >> 8, 0) - np.where(cold, (35 * square) >> 3, 0)
+    SENS = SENS - np.where(cold, (63 * square) >> 5, 0)
+    TEMP = TEMP - np.where(middle, (12 * dT * dT) >> 35, 0) - np.where(cold, (14 * dT * dT) >> 35, 0)
+    return TEMP, _np_div(_np_div(D1 * SENS, 21) - OFF, 15)
+
+def compensate_array(model, prom, D1, D2):
+    """ Compensates arrays of raw conversions with numpy, matching the compensate_int_* functions exactly.
+
     Parameters
     ----------
-	i2c : :obj:'machine.I2C'
-		An I2C bus object
-	VDD_pin : :obj:'machine.PIN', optional
-		Pin object representing the pin used to power the device 
-	ground_pin : :obj:'machine.PIN', optional
-		Pin object representing the pin used to ground the device
+    model : str
+        One of the keys of MODELS.
+    prom : sequence of int
+        PROM words C1 to C6, or the eight PROM words read by MS58xx (then
+        prom[1:7] is used).
+    D1, D2 : array_like
+        Raw pressure and temperature conversions.
+
     Returns
     -------
-    pressure : float
-        Pressure in hPa.
+    temperature, pressure : numpy.ndarray
+        int64 arrays in hundredths of degrees C and of hPa.
+
+    """
+    if np is None:
+        raise ImportError('compensate_array needs numpy')
+    if len(prom) == 8:
+        prom = prom[1:7]
+    C = [np.int64(c) for c in prom]
+    D1 = np.asarray(D1, dtype=np.int64)
+    D2 = np.asarray(D2, dtype=np.int64)
+    return MODELS[model][2](C[0], C[1], C[2], C[3], C[4], C[5], D1, D2)
+
+def crc4(prom, crc_word):
+    """ CRC4 of the PROM words as in the MS58xx datasheets.
+
+    Parameters
+    ----------
+    prom : sequence of int
+        The eight 16-bit PROM words (use 0 for the eighth word of sensors
+        with a seven word PROM).
+    crc_word : int
+        0 if the CRC is stored in the top four bits of word 0 (MS5837,
+        MS5839, MS5840), or 7 if it is stored in the bottom four bits of
+        word 7 (MS5803).
+
+    Returns
+    -------
+    int
+        The 4-bit CRC, computed with the CRC bits themselves set to zero.
+
+    """
+    n_rem = 0
+    for cnt in range(16):
+        word = prom[cnt >> 1]
+        if cnt >> 1 == crc_word:
+            word &= 0x0FFF if crc_word == 0 else 0xFF00
+        if cnt & 1:
+            n_rem ^= word & 0x00FF
+        else:
+            n_rem ^= word >> 8
+        for n_bit in range(8):
+            if n_rem & 0x8000:
+                n_rem = ((n_rem << 1) ^ 0x3000) & 0xFFFF
+            else:
+                n_rem = (n_rem << 1) & 0xFFFF
+    return (n_rem >> 12) & 0xF
+
+#float, integer and numpy compensation functions, location of the CRC (see crc4) and
+#integer temperature terms for each sensor
+MODELS = {
+    'MS5803_02': (compensate_ms5803_02, compensate_int_ms5803_02, _np_ms5803_02, 7, terms_int_ms5803_02),
+    'MS5803_05': (compensate_ms5803_05, compensate_int_ms5803_05, _np_ms5803_05, 7, terms_int_ms5803_05),
+    'MS5840_02': (compensate_ms5840_02, compensate_int_ms5840_02, _np_ms5840_02, 0, terms_int_ms5840_02),
+    'MS5839_02': (compensate_ms5840_02, compensate_int_ms5840_02, _np_ms5840_02, 0, terms_int_ms5840_02),
+    }
+
+class MS58xx:
+    """ MS58xx pressure sensor with the calibration PROM read once.
+
+    The sensor is reset and its PROM read and checked against its CRC4 when
+    the object is created.  Each reading then only starts the pressure (D1)
+    and temperature (D2) conversions and reads their results.
+
+    Parameters
+    ----------
+    i2c : :obj:'machine.I2C'
+        An I2C bus object
+    model : str, optional
+        One of the keys of MODELS.  Default is 'MS5839_02'.
+    address : int, optional
+        I2C address of the sensor, 118 or 119.  Default is 118 (0x76).
+    VDD_pin : :obj:'machine.PIN', optional
+        Pin object representing the pin used to power the device.  If
+        given, the sensor is powered (and reset) for each reading only.
+    ground_pin : :obj:'machine.PIN', optional
+        Pin object representing the pin used to ground the device
+    osr_pressure, osr_temperature : int, optional
+        Oversampling ratios of the pressure and temperature conversions,
+        one of the keys of OSR.  Default is 4096.  8192 is not available on
+        the MS5803.
+
+    Raises
+    ------
+    ValueError
+        If the model or an oversampling ratio is not supported, or the PROM
+        does not match its CRC.
+
+    """
+
+    def __init__(self, i2c, model='MS5839_02', address=0x76, VDD_pin=None, ground_pin=None,
+                 osr_pressure=4096, osr_temperature=4096):
+        if model not in MODELS:
+            raise ValueError('Unknown MS58xx model %s' % model)
+        for osr in (osr_pressure, osr_temperature):
+            if osr not in OSR or (osr == 8192 and model.startswith('MS5803')):
+                raise ValueError('OSR %s not supported by %s' % (osr, model))
+        self.i2c = i2c
+        self.model = model
+        self.address = address
+        self.VDD_pin = VDD_pin
+        self.ground_pin = ground_pin
+        [self._compensate, self._compensate_int, np_compensate, self._crc_word, self._terms_int] = MODELS[model]
+        self._buf = bytearray(3)
+        self._reset_command = bytearray([0x1E])
+        self.osr_pressure = osr_pressure
+        self.osr_temperature = osr_temperature
+        self._pressure_command = bytearray([0x40 + OSR[osr_pressure][0]])
+        self._temperature_command = bytearray([0x50 + OSR[osr_temperature][0]])
+        self._pressure_wait = OSR[osr_pressure][1]
+        self._temperature_wait = OSR[osr_temperature][1]
+        self._power_on()
+        try:
+            self.prom = self.read_prom()
+        finally:
+            self._power_off()
+        [self.C1, self.C2, self.C3, self.C4, self.C5, self.C6] = self.prom[1:7]
+
+    def _power_on(self, wait=True):
+        #turn on power and turn off ground if necessary, then reset the sensor
+        if not(self.VDD_pin is None):
+            self.VDD_pin.value(1)
+        if not(self.ground_pin is None):
+            self.ground_pin.value(0)
+        self.i2c.writeto(self.address, self._reset_command)
+        if wait:
+            time.sleep_ms(3)  #reset takes 2.8 ms
+
+    def _power_off(self):
+        if not(self.VDD_pin is None):
+            self.VDD_pin.value(0)
+
+    def read_prom(self):
+        """ Reads the eight PROM words and checks their CRC4.
+
+        Returns
+        -------
+        list of int
+
+        """
+        prom = [0] * 8
+        words = 7 if self._crc_word == 0 else 8
+        for k in range(words):
+            data = self.i2c.readfrom_mem(self.address, 0xA0 + 2 * k, 2)
+            prom[k] = data[0] * 256 + data[1]
+        if self._crc_word == 0:
+            stored = prom[0] >> 12
+        else:
+            stored = prom[7] & 0xF
+        if crc4(prom, self._crc_word) != stored:
+            raise ValueError('MS58xx PROM CRC mismatch')
+        return prom
+
+    def start_pressure(self):
+        """ Starts a pressure (D1) conversion. """
+        self.i2c.writeto(self.address, self._pressure_command)
+
+    def start_temperature(self):
+        """ Starts a temperature (D2) conversion. """
+        self.i2c.writeto(self.address, self._temperature_command)
+
+    def read_adc(self):
+        """ Reads the 24-bit result of the last conversion (0 if it has not finished). """
+        buf = self._buf
+        self.i2c.readfrom_mem_into(self.address, 0x00, buf)
+        return buf[0] * 65536 + buf[1] * 256 + buf[2]
+
+    def read_raw(self):
+        """ Returns the raw pressure and temperature conversions [D1, D2]. """
+        if not(self.VDD_pin is None):
+            self._power_on()
+        self.start_pressure()
+        time.sleep_us(self._pressure_wait)
+        D1 = self.read_adc()
+        self.start_temperature()
+        time.sleep_us(self._temperature_wait)
+        D2 = self.read_adc()
+        self._power_off()
+        return [D1, D2]
+
+    def compensate(self, D1, D2):
+        """ Converts raw conversions to [temperature (degrees C), pressure (hPa)] with the cached PROM. """
+        [TEMP, P] = self.compensate_int(D1, D2)
+        return [TEMP / 100, P / 100]
+
+    def compensate_int(self, D1, D2):
+        """ Converts raw conversions to [temperature (0.01 C), pressure (0.01 hPa)] with integer arithmetic. """
+        return self._compensate_int(self.C1, self.C2, self.C3, self.C4, self.C5, self.C6, D1, D2)
+
+    def terms_int(self, D2):
+        """ Returns [temperature (0.01 C), OFF, SENS]; pressure_int(D1, OFF, SENS) then gives the pressure for this D2. """
+        return self._terms_int(self.C1, self.C2, self.C3, self.C4, self.C5, self.C6, D2)
+
+    def read(self):
+        """ Reads temperature and pressure.
+
+        Returns
+        -------
+        list
+            Temperature (degrees C) and pressure (hPa), in the same order as
+            the ms5840_02 and ms5803_05 functions.
+
+        """
+        [D1, D2] = self.read_raw()
+        return self.compensate(D1, D2)
+
+    def read_int(self):
+        """ Reads temperature (0.01 degrees C) and pressure (0.01 hPa) as integers. """
+        [D1, D2] = self.read_raw()
+        return self.compensate_int(D1, D2)
+
+class MS58xxBus:
+    """ Reads several MS58xx sensors with their conversions running at the same time.
+
+    The sensors must have different addresses (they may be on different
+    buses).  A reading starts the pressure conversion on every sensor, waits
+    once for the slowest, reads every result, and then does the same for
+    temperature, so N sensors take about as long as one.
+
+    Parameters
+    ----------
+    sensors : sequence of MS58xx
+
+    """
+
+    def __init__(self, sensors):
+        self.sensors = list(sensors)
+        self._powered = [sensor for sensor in self.sensors if not(sensor.VDD_pin is None)]
+        self._pressure_wait = max([sensor._pressure_wait for sensor in self.sensors])
+        self._temperature_wait = max([sensor._temperature_wait for sensor in self.sensors])
+        #raw conversions [D1, D2] of each sensor from the last reading
+        self.raw = [[0, 0] for sensor in self.sensors]
+
+    def read_raw(self):
+        """ Returns the raw conversions [D1, D2] of every sensor.  The same lists are reused. """
+        sensors = self.sensors
+        raw = self.raw
+        for sensor in self._powered:
+            sensor._power_on(False)
+        if self._powered:
+            time.sleep_ms(3)  #reset takes 2.8 ms
+        for sensor in sensors:
+            sensor.start_pressure()
+        time.sleep_us(self._pressure_wait)
+        for k in range(len(sensors)):
+            raw[k][0] = sensors[k].read_adc()
+        for sensor in sensors:
+            sensor.start_temperature()
+        time.sleep_us(self._temperature_wait)
+        for k in range(len(sensors)):
+            raw[k][1] = sensors[k].read_adc()
+        for sensor in self._powered:
+            sensor._power_off()
+        return raw
+
+    def read(self):
+        """ Reads every sensor.
+
+        Returns
+        -------
+        list
+            [temperature (degrees C), pressure (hPa)] of each sensor, in the
+            order the sensors were given.
+
+        """
+        raw = self.read_raw()
+        sensors = self.sensors
+        return [sensors[k].compensate(raw[k][0], raw[k][1]) for k in range(len(sensors))]
+
+class PressureBurst:
+    """ Samples an MS58xx at its fastest rate and computes wave statistics on the logger.
+
+    The temperature is converted once at the start of each run and used to
+    compensate every pressure sample of the run, so only pressure
+    conversions are made, each started as soon as the previous one has been
+    read; its compensation runs while the next conversion is in progress.
+    The temperature terms of the integer compensation are worked out once
+    per run, and each pressure (hPa) is computed from them (pressure_int)
+    straight into a preallocated ring buffer of ``window`` samples, from
+    which statistics() and decimate() work.
+
+    Wave heights are computed from pressure at the sensor, without
+    correcting for the attenuation of short waves with depth.
+
+    Parameters
+    ----------
+    sensor : MS58xx
+        The sensor, with the pressure OSR that sets the sampling rate (about
+        1.5 kHz at 256, 100 Hz at 4096 on a 400 kHz bus).
+    window : int
+        Number of samples kept.
+    density : float, optional
+        Water density (kg/m3).  Default is WATER_DENSITY.
+
+    Attributes
+    ----------
+    buffer : array('f')
+        Ring buffer of pressures (hPa).
+    count : int
+        Number of samples in the buffer.
+    interval_us : float
+        Mean time between samples of the last run (0 before the first run).
     temperature : float
-        Temperature in degrees C.
+        Temperature (degrees C) measured at the start of the last run.
+    stats : array('f')
+        Output of statistics().
 
     """
-    return ms5840_02(i2c,VDD_pin = None, ground_pin = None)
-    
+
+    def __init__(self, sensor, window, density=WATER_DENSITY):
+        self.sensor = sensor
+        self.window = window
+        self.buffer = array('f', bytes(4 * window))
+        self.count = 0
+        self._next = 0
+        self.interval_us = 0
+        self.temperature = 0
+        #metres of water per hPa
+        self._scale = 100 / (density * G)
+        self.stats = array('f', [0, 0, 0, 0, 0])
+
+    def run(self, samples=None):
+        """ Samples pressure as fast as possible.
+
+        Parameters
+        ----------
+        samples : int, optional
+            Number of samples.  Default is the window length.  Runs shorter
+            than the window add to the samples already in the buffer.  A run
+            of 0 samples does nothing.
+
+        """
+        if samples is None:
+            samples = self.window
+        if samples <= 0:
+            return
+        sensor = self.sensor
+        #bound methods and locals for the sampling loop
+        start_pressure = sensor.start_pressure
+        read_adc = sensor.read_adc
+        pressure = pressure_int
+        sleep_us = time.sleep_us
+        ticks_us = time.ticks_us
+        ticks_diff = time.ticks_diff
+        wait = sensor._pressure_wait
+        buffer = self.buffer
+        window = self.window
+        k = self._next
+
+        if not(sensor.VDD_pin is None):
+            sensor._power_on()
+        sensor.start_temperature()
+        time.sleep_us(sensor._temperature_wait)
+        D2 = read_adc()
+        [TEMP, OFF, SENS] = sensor.terms_int(D2)
+
+        start = ticks_us()
+        start_pressure()
+        started = start
+        for i in range(samples):
+            remaining = wait - ticks_diff(ticks_us(), started)
+            if remaining > 0:
+                sleep_us(remaining)
+            D1 = read_adc()
+            if i < samples - 1:
+                start_pressure()
+                started = ticks_us()
+            buffer[k] = pressure(D1, OFF, SENS) / 100
+            k += 1
+            if k == window:
+                k = 0
+        elapsed = ticks_diff(ticks_us(), start)
+        sensor._power_off()
+
+        self._next = k
+        self.count = min(window, self.count + samples)
+        self.interval_us = elapsed / samples
+        self.temperature = TEMP / 100
+
+    def reset(self):
+        """ Empties the buffer. """
+        self.count = 0
+        self._next = 0
+
+    def _oldest(self):
+        #index of the oldest sample in the ring buffer
+        return self._next if self.count == self.window else 0
+
+    def statistics(self):
+        """ Computes wave statistics of the samples in the buffer.
+
+        Returns
+        -------
+        array('f')
+            The stats attribute: mean pressure (hPa), significant wave
+            height Hs = 4 * standard deviation (m), maximum zero up-crossing
+            wave height (m), mean zero up-crossing period Tz (s) and the
+            number of complete waves.  Tz and the maximum height are 0 if
+            there is no complete wave, and all five are 0 if no sample has
+            been stored.
+
+        """
+        buffer = self.buffer
+        window = self.window
+        count = self.count
+        stats = self.stats
+        if count == 0:
+            for i in range(5):
+                stats[i] = 0
+            return stats
+        first = self._oldest()
+        total = 0.0
+        k = first
+        for i in range(count):
+            total += buffer[k]
+            k += 1
+            if k == window:
+                k = 0
+        mean = total / count
+
+        #second pass: variance, and zero up-crossing waves
+        squares = 0.0
+        crossings = 0
+        first_crossing = last_crossing = 0
+        crest = trough = 0.0
+        highest = 0.0
+        previous = buffer[first] - mean
+        k = first
+        for i in range(count):
+            x = buffer[k] - mean
+            squares += x * x
+            if previous < 0 <= x:
+                if crossings:
+                    if crest - trough > highest:
+                        highest = crest - trough
+                else:
+                    first_crossing = i
+                last_crossing = i
+                crossings += 1
+                crest = trough = 0.0
+            if x > crest:
+                crest = x
+            elif x < trough:
+                trough = x
+            previous = x
+            k += 1
+            if k == window:
+                k = 0
+
+        waves = crossings - 1 if crossings > 1 else 0
+        stats[0] = mean
+        stats[1] = 4 * math.sqrt(squares / count) * self._scale
+        stats[2] = highest * self._scale
+        stats[3] = (last_crossing - first_crossing) * self.interval_us / 1000000 / waves if waves else 0
+        stats[4] = waves
+        return stats
+
+    def decimate(self, factor, out=None):
+        """ Block means of factor consecutive samples, oldest first.
+
+        Parameters
+        ----------
+        factor : int
+            Samples per output value.
+        out : array('f'), optional
+            Array of at least count // factor elements to fill, so that no
+            new array is made.
+
+        Returns
+        -------
+        array('f')
+            out, or a new array, with count // factor values (hPa).
+
+        """
+        length = self.count // factor
+        if out is None:
+            out = array('f', bytes(4 * length))
+        buffer = self.buffer
+        window = self.window
+        k = self._oldest()
+        for j in range(length):
+            total = 0.0
+            for i in range(factor):
+                total += buffer[k]
+                k += 1
+                if k == window:
+                    k = 0
+            out[j] = total / factor
+        return out
+
+    def write(self, f, decimate=0):
+        """ Writes the statistics, and optionally a trace decimated by decimate, as one comma-separated line.
+
+        The sampling rate (Hz) is written as 0 before the first run.
+
+        """
+        stats = self.statistics()
+        rate = 1000000 / self.interval_us if self.interval_us else 0
+        f.write(f"{stats[0]:.3f},{stats[1]:.4f},{stats[2]:.4f},{stats[3]:.3f},{int(stats[4])},"
+                f"{self.temperature:.2f},{rate:.1f}")
+        if decimate:
+            for value in self.decimate(decimate):
+                f.write(f",{value:.3f}")
+        f.write('\n')
@@ -15,12 +15,12 @@ Be sure to set the correct SSID, password, and apikey.
 """
 
 import machine, utime, esp, esp32, urequests, usocket, network, uos
-import bme280, ms5803, post_to_google_sheet
+import bme280, ms5803, post_to_google_sheet, depth
 from machine import Pin
 
 def log():
     import machine, utime, esp, esp32, urequests, usocket, network, uos
-    import bme280, ms5803, post_to_google_sheet
+    import bme280, ms5803, post_to_google_sheet, depth
     from machine import Pin
 
     led = Pin(5, Pin.OUT)
@@ -134,7 +134,7 @@ def log():
         bad = True
         
     if not bad:
-        WaterLevelDifference = (P2-P1)*100/9810
+        WaterLevelDifference = depth.depth(P2, P1, T2)
     else:
         WaterLevelDifference = -999
         
@@ -90,7 +90,8 @@ try:
     utime.sleep(.1)
     tempC = bme.raw_values[0]
     tempC = bme.raw_values[0]
-except:
+except (ImportError, OSError):
+    #no bme280 driver or sensor: use the DS3231 temperature instead
     byte_tmsb = i2c.readfrom_mem(0x68,0x11,1)
     byte_tlsb = i2c.readfrom_mem(0x68,0x12,1)
     tempC = list(byte_tmsb)[0]+list(byte_tlsb)[0]/256